@@ -0,0 +1,75 @@
+# agenda.py - Open todos bucketed by when they are due
+#
+# Overdue, today, the rest of this week (through Sunday) and later, counted
+# from today in the user's timezone. One range query reads all of a user's
+# open todos with a due date off idx_todos_user_open_due, already in due
+# order; recurring occurrences (recurrence.py) are added for today through
+# the end of the week.
+import functools
+import os
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError, available_timezones
+
+import models
+import recurrence
+from schema import PRIORITIES
+from storage import queries
+
+DEFAULT_TIMEZONE = os.environ.get('DEFAULT_TIMEZONE', 'UTC')
+
+BUCKETS = ('overdue', 'today', 'this_week', 'later')
+BUCKET_TITLES = {'overdue': 'Overdue', 'today': 'Today', 'this_week': 'This week', 'later': 'Later'}
+
+@functools.lru_cache(maxsize=None)
+def timezones():
+    """Every IANA zone name this system knows, sorted, for the settings page"""
+    return sorted(available_timezones())
+
+def valid_timezone(name):
+    if not name or name != name.strip():
+        return False
+    try:
+        ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return False
+    return True
+
+def today_in(timezone):
+    """The current date in `timezone`, or in DEFAULT_TIMEZONE if it is unset or unknown"""
+    if not valid_timezone(timezone):
+        timezone = DEFAULT_TIMEZONE
+    return datetime.now(ZoneInfo(timezone)).date()
+
+def bucket(due, today, week_end):
+    if due < today:
+        return 'overdue'
+    if due == today:
+        return 'today'
+    if due <= week_end:
+        return 'this_week'
+    return 'later'
+
+def load_agenda(cur, user_id, today, with_occurrences=True):
+    """{bucket: [entry, ...]} for BUCKETS, each in due date then priority order
+
+    Entries are dicts; stored todos have an 'id', occurrences of a recurring
+    series a 'series_id' instead.
+    """
+    week_end = today + timedelta(days=6 - today.weekday())
+    buckets = {name: [] for name in BUCKETS}
+
+    cur.execute(queries.AGENDA_TODOS, (user_id,))
+    for todo in models.fetch_all(cur, models.AgendaTodo):
+        buckets[bucket(todo.due_date, today, week_end)].append(todo._asdict())
+
+    if with_occurrences:
+        occurrences = recurrence.expand(cur, user_id, today, week_end)
+        for occurrence in occurrences:
+            entry = {key: value for key, value in occurrence.items() if key != 'date'}
+            entry['due_date'] = occurrence['date']
+            buckets[bucket(entry['due_date'], today, week_end)].append(entry)
+        if occurrences:
+            for name in ('today', 'this_week'):
+                buckets[name].sort(key=lambda e: (e['due_date'], PRIORITIES.index(e['priority'])))
+
+    return buckets
@@ -0,0 +1,135 @@
+# analytics.py - Completion analytics from the todo_daily_stats rollups
+#
+# The todo_items_daily_stats trigger (schema.py) keeps the rollups current as
+# todos are created, completed, reopened and recategorised. Run this script
+# once after upgrading to fill them in from existing todos and the archive,
+# or at any time to recompute them:
+#
+#   python analytics.py [--user-id 42]
+import argparse
+import sys
+
+from db import get_db_connection
+import queries
+
+MAX_DAYS = 365
+
+# One user's rollups recomputed from raw rows, live and archived
+REBUILD_USER = '''
+    WITH raw AS (
+        SELECT user_id, category_id, created_at, completed_at, due_date
+        FROM todo_items WHERE user_id = %(user_id)s
+        UNION ALL
+        SELECT user_id, category_id, created_at, completed_at, due_date
+        FROM todo_items_archive WHERE user_id = %(user_id)s
+    )
+    INSERT INTO todo_daily_stats (user_id, day, category_key, created, completed, completed_late, completion_seconds)
+    SELECT user_id, day, category_key, SUM(created), SUM(completed), SUM(completed_late), SUM(completion_seconds)
+    FROM (
+        SELECT user_id, created_at::date AS day, COALESCE(category_id, 0) AS category_key,
+               1 AS created, 0 AS completed, 0 AS completed_late, 0::bigint AS completion_seconds
+        FROM raw WHERE created_at IS NOT NULL
+        UNION ALL
+        SELECT user_id, completed_at::date, COALESCE(category_id, 0), 0, 1,
+               COALESCE((due_date < completed_at::date)::int, 0),
+               COALESCE(EXTRACT(EPOCH FROM completed_at - created_at)::bigint, 0)
+        FROM raw WHERE completed_at IS NOT NULL
+    ) contributions
+    GROUP BY user_id, day, category_key
+'''
+
+def category_name(key, name):
+    if key == 0:
+        return 'Uncategorized'
+    # Rollups outlive the categories they were counted under
+    return name or 'Deleted category'
+
+def load_analytics(cur, user_id, days):
+    """Daily series, per-category totals and headline numbers for the last `days` days"""
+    params = {'user_id': user_id, 'days': days}
+
+    cur.execute(queries.ANALYTICS_DAILY, params)
+    daily = [{
+        'day': day.isoformat(),
+        'created': created,
+        'completed': completed,
+        'completed_late': late,
+    } for day, created, completed, late in cur.fetchall()]
+
+    cur.execute(queries.ANALYTICS_CATEGORIES, params)
+    categories = []
+    completed = late = seconds = 0
+    for key, name, color, cat_completed, cat_late, cat_seconds in cur.fetchall():
+        categories.append({
+            'category_id': key or None,
+            'name': category_name(key, name),
+            'color': color,
+            'completed': cat_completed,
+            'completed_late': cat_late,
+            'avg_hours_to_complete': round(cat_seconds / cat_completed / 3600, 1),
+        })
+        completed += cat_completed
+        late += cat_late
+        seconds += cat_seconds
+
+    cur.execute(queries.OVERDUE_COUNT, (user_id,))
+    overdue_now = cur.fetchone()[0]
+
+    return {
+        'days': days,
+        'daily': daily,
+        'categories': categories,
+        'totals': {
+            'created': sum(d['created'] for d in daily),
+            'completed': completed,
+            'completed_per_day': round(completed / days, 2),
+            'avg_hours_to_complete': round(seconds / completed / 3600, 1) if completed else None,
+            'late_share': round(late / completed, 3) if completed else None,
+            'overdue_now': overdue_now,
+        }
+    }
+
+def rebuild(user_id=None):
+    """Recompute rollups from raw rows, one user per transaction"""
+    conn = get_db_connection()
+    if not conn:
+        print("❌ Cannot rebuild analytics - no connection")
+        return False
+
+    try:
+        cur = conn.cursor()
+        if user_id is None:
+            cur.execute('SELECT id FROM todo_users ORDER BY id')
+            user_ids = [row[0] for row in cur.fetchall()]
+        else:
+            user_ids = [user_id]
+        conn.commit()
+
+        for n, uid in enumerate(user_ids, 1):
+            # Every todo write locks the user's row (change_seq), so holding it
+            # keeps the trigger from updating rollups while they are replaced
+            cur.execute('SELECT 1 FROM todo_users WHERE id = %s FOR UPDATE', (uid,))
+            cur.execute('DELETE FROM todo_daily_stats WHERE user_id = %s', (uid,))
+            cur.execute(REBUILD_USER, {'user_id': uid})
+            conn.commit()
+            if n % 100 == 0:
+                print(f"🔵 Rebuilt analytics for {n}/{len(user_ids)} users")
+
+        print(f"✅ Rebuilt analytics for {len(user_ids)} users")
+        return True
+
+    except Exception as e:
+        print(f"❌ Analytics rebuild error: {e}")
+        conn.rollback()
+        return False
+
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Recompute the todo_daily_stats rollups')
+    parser.add_argument('--user-id', type=int, help='only this user')
+    args = parser.parse_args()
+
+    if not rebuild(args.user_id):
+        sys.exit(1)
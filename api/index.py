@@ -1,2 +1,7 @@
-from app import app
+import os
+
+# Defer the database handshake and schema check until a route needs them,
+# so cold starts serving / or /login never wait on Postgres
+os.environ.setdefault('LAZY_DB_INIT', '1')
 
+from app import app
@@ -1,120 +1,192 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import time
+IMPORT_STARTED = time.perf_counter()
+
+from flask import Flask, Response, render_template, request, redirect, url_for, session, flash, jsonify, g
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import timedelta
+from werkzeug.http import is_resource_modified
+from werkzeug.middleware.proxy_fix import ProxyFix
+from datetime import date, datetime, timedelta
+from collections import OrderedDict
+from functools import wraps
 import os
+import threading
+
+from db import circuit_open, DatabaseBusy, REPLICA_URLS
+import storage
+from storage import queries
+import models
+import realtime
+import sync
+import group_commit
+import ratelimit
+import analytics
+import tags
+import recurrence
+import sharing
+import positions
+import agenda
+import ical
+import fragments
+from schema import MEMBER_ROLES
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'your-secret-key-change-this-in-production')
 app.permanent_session_lifetime = timedelta(days=7)
 
-def get_db_connection():
-    """Establish database connection with comprehensive error handling"""
-    try:
-        # Try DATABASE_URL first (for deployment platforms like Vercel, Heroku)
-        db_url = os.environ.get('DATABASE_URL')
-        
-        if db_url:
-            print(f"🔵 Using DATABASE_URL")
-            # Fix postgres:// to postgresql:// (required for psycopg2)
-            if db_url.startswith('postgres://'):
-                db_url = db_url.replace('postgres://', 'postgresql://', 1)
-            
-            print(f"🔵 Connecting to database...")
-            conn = psycopg2.connect(db_url, sslmode='require')
-            print("✅ Database connected successfully via DATABASE_URL")
-            return conn
-        else:
-            # Fallback to individual parameters (for local development)
-            print("🔵 Using individual DB parameters")
-            conn = psycopg2.connect(
-                dbname=os.environ.get('DB_NAME', 'todo_db'),
-                user=os.environ.get('DB_USER', 'todo_user'),
-                password=os.environ.get('DB_PASSWORD', 'thinkpad'),
-                host=os.environ.get('DB_HOST', 'localhost'),
-                port=os.environ.get('DB_PORT', '5432')
-            )
-            print("✅ Database connected successfully via parameters")
-            return conn
-            
-    except Exception as e:
-        print(f"❌ Database connection error: {e}")
-        print(f"❌ Error type: {type(e).__name__}")
-        return None
+# Behind a load balancer (Render, Heroku) request.remote_addr is the proxy;
+# trust this many X-Forwarded-For hops to find the client for rate limiting
+TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES', 0))
+if TRUSTED_PROXIES:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES)
 
-def init_db():
-    """Initialize database tables if they don't exist"""
-    conn = get_db_connection()
-    if not conn:
-        print("❌ Cannot initialize database - no connection")
-        return False
+HISTORY_PAGE_SIZE = 50
+SYNC_PAGE_SIZE = 500
+
+# After a write, a session reads from the primary for this long so it never
+# sees a replica that has not caught up with its own change yet
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 10))
+
+# Last dashboard each user loaded in this process, served read-only while the
+# database is unreachable instead of an empty page
+DASHBOARD_SNAPSHOT_LIMIT = int(os.environ.get('DASHBOARD_SNAPSHOT_LIMIT', 500))
+dashboard_snapshots = OrderedDict()
+snapshot_lock = threading.Lock()
+
+def save_dashboard_snapshot(user_id, todos, categories, stats):
+    with snapshot_lock:
+        dashboard_snapshots[user_id] = (todos, categories, stats, datetime.now())
+        dashboard_snapshots.move_to_end(user_id)
+        while len(dashboard_snapshots) > DASHBOARD_SNAPSHOT_LIMIT:
+            dashboard_snapshots.popitem(last=False)
+
+def render_dashboard_fallback(message):
+    """Dashboard for when the database failed: the last snapshot, read-only, if we have one"""
+    with snapshot_lock:
+        snapshot = dashboard_snapshots.get(session['user_id'])
+    if snapshot:
+        todos, categories, stats, taken_at = snapshot
+        flash(f"The database is unavailable. Showing your tasks as of {taken_at.strftime('%H:%M')}; "
+              "changes are disabled until it is back.", 'error')
+        return render_template('dashboard.html', todos=todos, categories=categories, stats=stats,
+                               degraded=True)
     
-    try:
-        cur = conn.cursor()
-        
-        print("🔵 Creating tables if not exist...")
-        
-        # Users table
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS todo_users (
-                id SERIAL PRIMARY KEY,
-                username VARCHAR(50) UNIQUE NOT NULL,
-                password VARCHAR(255) NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Categories table
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS todo_categories (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER REFERENCES todo_users(id) ON DELETE CASCADE,
-                name VARCHAR(100) NOT NULL,
-                color VARCHAR(7) DEFAULT '#667eea',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(user_id, name)
-            )
-        ''')
-        
-        # Todos table
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS todo_items (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER REFERENCES todo_users(id) ON DELETE CASCADE,
-                category_id INTEGER REFERENCES todo_categories(id) ON DELETE SET NULL,
-                title VARCHAR(255) NOT NULL,
-                description TEXT,
-                priority VARCHAR(10) DEFAULT 'medium' CHECK (priority IN ('low', 'medium', 'high')),
-                status VARCHAR(20) DEFAULT 'pending' CHECK (status IN ('pending', 'in_progress', 'completed')),
-                due_date DATE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Create indexes
-        cur.execute('CREATE INDEX IF NOT EXISTS idx_todos_user_id ON todo_items(user_id)')
-        cur.execute('CREATE INDEX IF NOT EXISTS idx_todos_status ON todo_items(status)')
-        cur.execute('CREATE INDEX IF NOT EXISTS idx_categories_user_id ON todo_categories(user_id)')
-        
-        conn.commit()
-        cur.close()
-        conn.close()
-        
-        print("✅ Database tables initialized successfully")
-        return True
-        
-    except Exception as e:
-        print(f"❌ Database initialization error: {e}")
-        if conn:
-            conn.rollback()
-            conn.close()
-        return False
+    flash(message, 'error')
+    return render_template('dashboard.html', todos=[], categories=[], stats=models.DashboardStats.EMPTY)
+
+def db_error_message():
+    if circuit_open():
+        return 'The database is unavailable, so changes are disabled for now. Please try again shortly.'
+    return 'Database connection error'
+
+def get_read_connection():
+    """Connection for read-only routes: a replica unless this session wrote recently"""
+    pinned = session.get('primary_until', 0) > time.time()
+    return get_db_connection(readonly=not pinned)
+
+# Serverless platforms import the app on every cold start, so with lazy
+# init the schema check waits for the first route that needs the database
+# instead of delaying / and /login. On by default on Vercel.
+LAZY_DB_INIT = os.environ.get('LAZY_DB_INIT', '1' if os.environ.get('VERCEL') else '').lower() in ('1', 'true', 'yes')
+
+startup_report = {
+    'lazy_db_init': LAZY_DB_INIT,
+    'import_ms': None,
+    'db_init_ms': None,
+    'first_request': None,
+    'first_request_ms': None,
+}
+db_initialized = False
+db_init_lock = threading.Lock()
+
+def ensure_db_initialized():
+    """Run init_db() once per process; retried later if the database was down"""
+    global db_initialized
+    if db_initialized:
+        return
+    with db_init_lock:
+        if db_initialized:
+            return
+        started = time.perf_counter()
+        db_initialized = storage.init_db()
+        startup_report['db_init_ms'] = round((time.perf_counter() - started) * 1000, 1)
+
+def get_db_connection(readonly=False):
+    """The storage backend's get_db_connection(), after making sure the schema exists"""
+    ensure_db_initialized()
+    return storage.get_db_connection(readonly)
 
 # Initialize database on startup
-with app.app_context():
-    init_db()
+if not LAZY_DB_INIT:
+    with app.app_context():
+        ensure_db_initialized()
+
+app.jinja_env.globals['storage_supports'] = storage.supports
+app.jinja_env.globals['todo_card'] = fragments.render_card
+
+def requires(feature):
+    """For routes whose feature the storage backend lacks (see storage.py)"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if storage.supports(feature):
+                return view(*args, **kwargs)
+            if request.path.startswith('/api/'):
+                return jsonify({'error': f'Not available with the {storage.BACKEND} backend'}), 501
+            flash(f'This feature is not available with the {storage.BACKEND} backend', 'error')
+            return redirect(url_for('dashboard'))
+        return wrapper
+    return decorator
+
+@app.before_request
+def enforce_rate_limits():
+    """Token buckets per route class, by client IP and by user (see ratelimit.py)"""
+    # Only a logged-in user counts; keying login attempts on the username
+    # typed would let anyone lock that account out
+    decision = ratelimit.check(request.endpoint, request.method, request.remote_addr,
+                               session.get('user_id'))
+    if decision is None:
+        return None
+    g.rate_limit = decision
+    if decision.allowed:
+        return None
+    
+    print(f"⚠️ Rate limited {request.endpoint} for {request.remote_addr}")
+    if request.path.startswith('/api/'):
+        return jsonify({'error': 'Too many requests'}), 429, decision.headers()
+    return render_template('429.html', retry_after=decision.reset), 429, decision.headers()
+
+@app.after_request
+def add_rate_limit_headers(response):
+    decision = g.get('rate_limit')
+    if decision is not None:
+        for name, value in decision.headers().items():
+            response.headers.setdefault(name, value)
+    return response
+
+@app.before_request
+def time_first_request():
+    if startup_report['first_request_ms'] is None:
+        g.request_started = time.perf_counter()
+
+@app.after_request
+def report_first_request(response):
+    """Log import and first-request timings once per process"""
+    if startup_report['first_request_ms'] is None and 'request_started' in g:
+        startup_report['first_request'] = request.path
+        startup_report['first_request_ms'] = round((time.perf_counter() - g.request_started) * 1000, 1)
+        db_init = (f"{startup_report['db_init_ms']} ms" if startup_report['db_init_ms'] is not None
+                   else 'deferred')
+        print(f"🚀 Startup report: import {startup_report['import_ms']} ms, "
+              f"first request {request.path} {startup_report['first_request_ms']} ms, "
+              f"db init {db_init}")
+    return response
+
+@app.after_request
+def pin_reads_after_write(response):
+    """Pin this session's reads to the primary after any POST"""
+    if REPLICA_URLS and request.method == 'POST':
+        session['primary_until'] = time.time() + REPLICA_PIN_SECONDS
+    return response
 
 # Routes
 @app.route('/')
@@ -124,6 +196,13 @@ def landing():
         return redirect(url_for('dashboard'))
     return render_template('landing.html')
 
+def parse_email(value):
+    """A form's email address: stripped, '' if left empty, None if it is not an address"""
+    email = (value or '').strip()
+    if email and (len(email) > 255 or '@' not in email.strip('@') or any(c.isspace() for c in email)):
+        return None
+    return email
+
 @app.route('/register', methods=['GET', 'POST'])
 def register():
     """User registration"""
@@ -134,11 +213,16 @@ def register():
         print("🔵 Registration attempt started")
         username = request.form.get('username', '').strip()
         password = request.form.get('password', '').strip()
+        email = parse_email(request.form.get('email'))
         
         if not username or not password:
             flash('Username and password are required', 'error')
             return render_template('register.html')
         
+        if email is None:
+            flash('Please enter a valid email address or leave it empty', 'error')
+            return render_template('register.html')
+        
         if len(username) < 3:
             flash('Username must be at least 3 characters long', 'error')
             return render_template('register.html')
@@ -156,7 +240,7 @@ def register():
         try:
             print(f"🔵 Checking if username exists: {username}")
             cur = conn.cursor()
-            cur.execute('SELECT id FROM todo_users WHERE username = %s', (username,))
+            cur.execute(queries.USERNAME_TAKEN, (username,))
             if cur.fetchone():
                 print(f"❌ Username already exists: {username}")
                 flash('Username already exists. Please choose another.', 'error')
@@ -166,10 +250,7 @@ def register():
             
             print(f"🔵 Creating new user: {username}")
             hashed_password = generate_password_hash(password, method='pbkdf2:sha256')
-            cur.execute(
-                'INSERT INTO todo_users (username, password) VALUES (%s, %s) RETURNING id',
-                (username, hashed_password)
-            )
+            cur.execute(queries.INSERT_USER, (username, hashed_password, email or None))
             user_id = cur.fetchone()[0]
             conn.commit()
             
@@ -184,10 +265,7 @@ def register():
             ]
             
             for cat_name, cat_color in default_categories:
-                cur.execute(
-                    'INSERT INTO todo_categories (user_id, name, color) VALUES (%s, %s, %s)',
-                    (user_id, cat_name, cat_color)
-                )
+                cur.execute(queries.INSERT_CATEGORY, (user_id, cat_name, cat_color))
             
             conn.commit()
             cur.close()
@@ -232,20 +310,18 @@ def login():
         try:
             cur = conn.cursor()
             print("🔵 Executing database query")
-            cur.execute(
-                'SELECT id, username, password FROM todo_users WHERE username = %s',
-                (username,)
-            )
-            user = cur.fetchone()
+            cur.execute(queries.USER_BY_USERNAME, (username,))
+            user = models.fetch_one(cur, models.User)
             cur.close()
             conn.close()
             
-            if user and check_password_hash(user[2], password):
+            if user and check_password_hash(user.password, password):
                 print(f"✅ Login successful for {username}")
                 session.permanent = True
-                session['user_id'] = user[0]
-                session['username'] = user[1]
-                flash(f'Welcome back, {user[1]}!', 'success')
+                session['user_id'] = user.id
+                session['username'] = user.username
+                session['timezone'] = user.timezone
+                flash(f'Welcome back, {user.username}!', 'success')
                 return redirect(url_for('dashboard'))
             else:
                 print(f"❌ Invalid credentials for {username}")
@@ -266,79 +342,65 @@ def dashboard():
         flash('Please log in to access the dashboard', 'error')
         return redirect(url_for('login'))
     
-    conn = get_db_connection()
+    conn = get_read_connection()
     if not conn:
-        flash('Database connection error', 'error')
-        return render_template('dashboard.html', todos=[], categories=[], stats={
-            'total': 0, 'completed': 0, 'pending': 0, 'in_progress': 0
-        })
+        return render_dashboard_fallback('Database connection error')
     
+    tag_filter, tag_match = dashboard_tag_filter()
+    order = dashboard_order()
+    params = {'user_id': session['user_id'], 'tags': tag_filter}
+
     try:
         cur = conn.cursor()
-        
-        # Get categories
-        cur.execute(
-            'SELECT id, name, color FROM todo_categories WHERE user_id = %s ORDER BY name',
-            (session['user_id'],)
-        )
-        categories = cur.fetchall()
-        
-        # Get todos
-        cur.execute(
-            '''SELECT t.id, t.title, t.description, t.priority, t.status, 
-                      c.name, c.color, t.due_date, t.created_at
-               FROM todo_items t
-               LEFT JOIN todo_categories c ON t.category_id = c.id
-               WHERE t.user_id = %s 
-               ORDER BY 
-                   CASE t.status 
-                       WHEN 'in_progress' THEN 1
-                       WHEN 'pending' THEN 2
-                       WHEN 'completed' THEN 3
-                   END,
-                   CASE t.priority
-                       WHEN 'high' THEN 1
-                       WHEN 'medium' THEN 2
-                       WHEN 'low' THEN 3
-                   END,
-                   t.created_at DESC''',
-            (session['user_id'],)
-        )
-        todos = cur.fetchall()
-        
-        # Get stats
-        cur.execute(
-            '''SELECT 
-                   COUNT(*) as total,
-                   SUM(CASE WHEN status = 'completed' THEN 1 ELSE 0 END) as completed,
-                   SUM(CASE WHEN status = 'pending' THEN 1 ELSE 0 END) as pending,
-                   SUM(CASE WHEN status = 'in_progress' THEN 1 ELSE 0 END) as in_progress
-               FROM todo_items 
-               WHERE user_id = %s''',
-            (session['user_id'],)
-        )
-        stats_row = cur.fetchone()
-        stats = {
-            'total': stats_row[0] or 0,
-            'completed': stats_row[1] or 0,
-            'pending': stats_row[2] or 0,
-            'in_progress': stats_row[3] or 0
-        }
+
+        # Get categories, own and shared; they also answer this request's permission checks
+        cur.execute(queries.CATEGORIES_FOR_USER, params)
+        categories = models.fetch_all(cur, models.Category)
+        sharing.remember(categories)
+
+        # Get tags
+        cur.execute(queries.USER_TAGS, (session['user_id'],))
+        user_tags = models.fetch_all(cur, models.TagCount)
+
+        # Get todos and stats, narrowed to the tag filter if there is one
+        if tag_filter:
+            todos_sql = (queries.DASHBOARD_TODOS_MANUAL_TAGGED if order == 'manual'
+                         else queries.DASHBOARD_TODOS_TAGGED)[tag_match]
+            stats_sql = queries.DASHBOARD_STATS_TAGGED[tag_match]
+            shared_sql = queries.SHARED_TODOS_TAGGED[tag_match]
+        else:
+            todos_sql = queries.DASHBOARD_TODOS_MANUAL if order == 'manual' else queries.DASHBOARD_TODOS
+            stats_sql, shared_sql = queries.DASHBOARD_STATS, queries.SHARED_TODOS
+        cur.execute(todos_sql, params)
+        todos = models.fetch_all(cur, models.Todo)
+        cur.execute(stats_sql, params)
+        stats = models.DashboardStats.from_row(cur.fetchone())
+
+        # Other people's todos in shared categories: one more query, only for users who share
+        if sharing.any_shared(categories):
+            cur.execute(shared_sql, params)
+            shared = models.fetch_all(cur, models.Todo)
+            # Manual order is the user's own list; shared todos follow it in the usual order
+            todos = todos + shared if order == 'manual' else sharing.merge(todos, shared)
+            stats = stats.counted(shared)
+
+        occurrences = upcoming_occurrences(cur, tag_filter, tag_match)
         
         cur.close()
         conn.close()
         
+        if not tag_filter:
+            save_dashboard_snapshot(session['user_id'], todos, categories, stats)
         print(f"✅ Dashboard loaded for user {session['username']}")
-        return render_template('dashboard.html', todos=todos, categories=categories, stats=stats)
+        return render_template('dashboard.html', todos=todos, categories=categories, stats=stats,
+                               user_tags=user_tags, tag_filter=tag_filter, tag_match=tag_match, order=order,
+                               occurrences=occurrences, occurrence_days=recurrence.DASHBOARD_DAYS)
         
     except Exception as e:
         print(f"❌ Dashboard error: {e}")
         if conn:
             conn.close()
-        flash('Error loading dashboard', 'error')
-        return render_template('dashboard.html', todos=[], categories=[], stats={
-            'total': 0, 'completed': 0, 'pending': 0, 'in_progress': 0
-        })
+        return render_dashboard_fallback('Error loading dashboard')
 
 @app.route('/add', methods=['POST'])
 def add_todo():
@@ -350,31 +412,59 @@ def add_todo():
     title = request.form.get('title', '').strip()
     description = request.form.get('description', '').strip()
     priority = request.form.get('priority', 'medium')
-    category_id = request.form.get('category', None)
+    category_id = request.form.get('category', None, type=int)
     due_date = request.form.get('due_date', None)
+    parent_id = request.form.get('parent_id', None, type=int)
     
     if not title:
         flash('Task title is required', 'error')
         return redirect(url_for('dashboard'))
     
-    if category_id == '':
-        category_id = None
+    try:
+        todo_tags = tags.normalize(request.form.get('tags', ''))
+    except ValueError as e:
+        flash(f'Invalid tags: {e}', 'error')
+        return redirect(url_for('dashboard'))
     
     if due_date == '':
         due_date = None
     
+    repeat = request.form.get('repeat', '')
+    if repeat in recurrence.FREQUENCIES:
+        if not storage.supports('recurrence'):
+            flash(f'Recurring tasks are not available with the {storage.BACKEND} backend', 'error')
+            return redirect(url_for('dashboard'))
+        every = min(max(request.form.get('every', 1, type=int), 1), recurrence.MAX_EVERY)
+        return add_series(title, description, priority, category_id, todo_tags, repeat, every,
+                          due_date or date.today().isoformat())
+    
     conn = get_db_connection()
     if not conn:
-        flash('Database connection error', 'error')
+        flash(db_error_message(), 'error')
         return redirect(url_for('dashboard'))
     
     try:
         cur = conn.cursor()
-        cur.execute(
-            '''INSERT INTO todo_items (user_id, title, description, priority, category_id, due_date, status) 
-               VALUES (%s, %s, %s, %s, %s, %s, 'pending')''',
-            (session['user_id'], title, description, priority, category_id, due_date)
-        )
+        if parent_id is not None:
+            cur.execute(queries.EDITABLE_PARENT, {'todo_id': parent_id, 'user_id': session['user_id']})
+            parent = cur.fetchone()
+            if not parent:
+                cur.close()
+                conn.close()
+                flash('Parent task not found', 'error')
+                return redirect(url_for('dashboard'))
+            category_id = parent[1]
+        elif category_id is not None and not sharing.can_edit(sharing.category_role(cur, category_id)):
+            cur.close()
+            conn.close()
+            flash('Category not found', 'error')
+            return redirect(url_for('dashboard'))
+        # New top-level todos go to the top of the manual order; subtasks are not ordered by hand
+        position_key = positions.first_key(cur, session['user_id']) if parent_id is None else None
+        cur.execute(queries.INSERT_TODO, (session['user_id'], title, description, priority, category_id, due_date,
+                                          parent_id, todo_tags, position_key))
+        realtime.publish_shared(cur, session['user_id'], category_id, 'todo_added', id=cur.fetchone()[0])
+        realtime.publish_parent(cur, session['user_id'], parent_id)
         conn.commit()
         cur.close()
         conn.close()
@@ -391,6 +481,183 @@ def add_todo():
     
     return redirect(url_for('dashboard'))
 
+def dashboard_tag_filter():
+    """The ?tag=...&match=... filter of a dashboard URL, as (tags, match)"""
+    try:
+        tag_filter = tags.normalize(request.args.getlist('tag'))
+    except ValueError:
+        tag_filter = []
+    tag_match = request.args.get('match') if request.args.get('match') in tags.MATCH_MODES else 'any'
+    return tag_filter, tag_match
+
+def dashboard_order():
+    """The dashboard order (positions.ORDERS): ?order= if given, which is remembered, else the last one used"""
+    order = request.args.get('order')
+    if order in positions.ORDERS:
+        session['dashboard_order'] = order
+    return session.get('dashboard_order', 'priority')
+
+def upcoming_occurrences(cur, tag_filter, tag_match):
+    """Recurring todos due in the dashboard's window that nobody has acted on yet"""
+    if not storage.supports('recurrence'):
+        return []
+    today = date.today()
+    return recurrence.expand(cur, session['user_id'], today,
+                             today + timedelta(days=recurrence.DASHBOARD_DAYS - 1), tag_filter, tag_match)
+
+@app.route('/occurrences')
+@requires('recurrence')
+def occurrences():
+    """The dashboard's recurring section, re-fetched after a realtime series_changed event"""
+    if 'user_id' not in session:
+        return '', 401
+    
+    conn = get_db_connection()
+    if not conn:
+        return '', 503
+    
+    try:
+        cur = conn.cursor()
+        upcoming = upcoming_occurrences(cur, *dashboard_tag_filter())
+        cur.close()
+        conn.close()
+    except Exception as e:
+        print(f"❌ Occurrences error: {e}")
+        conn.close()
+        return '', 500
+    
+    return render_template('_occurrences.html', occurrences=upcoming, occurrence_days=recurrence.DASHBOARD_DAYS)
+
+def add_series(title, description, priority, category_id, todo_tags, frequency, every, starts_on):
+    """add_todo for a recurring todo: one todo_series row, no todos until an occurrence is acted on"""
+    conn = get_db_connection()
+    if not conn:
+        flash(db_error_message(), 'error')
+        return redirect(url_for('dashboard'))
+    
+    try:
+        cur = conn.cursor()
+        cur.execute(queries.INSERT_SERIES, {
+            'user_id': session['user_id'], 'title': title, 'description': description,
+            'priority': priority, 'category_id': category_id, 'tags': todo_tags,
+            'frequency': frequency, 'every': every, 'starts_on': starts_on
+        })
+        realtime.publish(cur, session['user_id'], 'series_changed', id=cur.fetchone()[0])
+        conn.commit()
+        cur.close()
+        conn.close()
+        
+        print(f"✅ Recurring task added: {title} ({recurrence.describe(frequency, every)})")
+        flash('Recurring task added!', 'success')
+        
+    except Exception as e:
+        print(f"❌ Add series error: {e}")
+        if conn:
+            conn.rollback()
+            conn.close()
+        flash('Failed to add recurring task', 'error')
+    
+    return redirect(url_for('dashboard'))
+
+@app.route('/series/<int:series_id>/<occurrence_date>', methods=['POST'])
+@requires('recurrence')
+def update_occurrence(series_id, occurrence_date):
+    """Start, complete or skip one occurrence of a recurring todo"""
+    if 'user_id' not in session:
+        flash('Please log in first', 'error')
+        return redirect(url_for('login'))
+    
+    action = request.form.get('action')
+    try:
+        day = date.fromisoformat(occurrence_date)
+    except ValueError:
+        day = None
+    if day is None or action not in ('start', 'complete', 'skip'):
+        flash('Invalid occurrence', 'error')
+        return redirect(url_for('dashboard'))
+    
+    conn = get_db_connection()
+    if not conn:
+        flash(db_error_message(), 'error')
+        return redirect(url_for('dashboard'))
+    
+    try:
+        cur = conn.cursor()
+        cur.execute(queries.SERIES_RULE, (series_id, session['user_id']))
+        rule = models.fetch_one(cur, models.SeriesRule)
+        if not rule or not recurrence.is_occurrence(*rule, day):
+            flash('Task not found', 'error')
+        elif action == 'skip':
+            cur.execute(queries.SKIP_OCCURRENCE, (series_id, day))
+            realtime.publish(cur, session['user_id'], 'series_changed', id=series_id)
+            print(f"✅ Occurrence {day} of series {series_id} skipped")
+            flash('Occurrence skipped', 'success')
+        else:
+            cur.execute(queries.MATERIALIZE_OCCURRENCE, {
+                'series_id': series_id, 'user_id': session['user_id'], 'date': day,
+                'status': 'completed' if action == 'complete' else 'in_progress'
+            })
+            row = cur.fetchone()
+            if row:
+                realtime.publish(cur, session['user_id'], 'todo_added', id=row[0])
+                realtime.publish(cur, session['user_id'], 'series_changed', id=series_id)
+                print(f"✅ Occurrence {day} of series {series_id} stored as task {row[0]}")
+                flash('Task status updated!', 'success')
+            else:
+                # Already a real todo; it is updated like any other
+                flash('This occurrence is already on your list', 'error')
+        conn.commit()
+        cur.close()
+        conn.close()
+        
+    except Exception as e:
+        print(f"❌ Occurrence update error: {e}")
+        if conn:
+            conn.rollback()
+            conn.close()
+        flash('Failed to update task', 'error')
+    
+    return redirect(url_for('dashboard'))
+
+@app.route('/series/<int:series_id>/delete', methods=['POST'])
+@requires('recurrence')
+def delete_series(series_id):
+    """Stop a recurring todo; occurrences already on the list stay"""
+    if 'user_id' not in session:
+        flash('Please log in first', 'error')
+        return redirect(url_for('login'))
+    
+    conn = get_db_connection()
+    if not conn:
+        flash(db_error_message(), 'error')
+        return redirect(url_for('dashboard'))
+    
+    try:
+        cur = conn.cursor()
+        cur.execute(queries.DELETE_SERIES, (series_id, session['user_id']))
+        deleted = cur.rowcount
+        if deleted > 0:
+            realtime.publish(cur, session['user_id'], 'series_changed', id=series_id)
+        conn.commit()
+        
+        if deleted > 0:
+            print(f"✅ Series {series_id} deleted")
+            flash('Recurring task stopped', 'success')
+        else:
+            flash('Task not found', 'error')
+        
+        cur.close()
+        conn.close()
+            
+    except Exception as e:
+        print(f"❌ Delete series error: {e}")
+        if conn:
+            conn.rollback()
+            conn.close()
+        flash('Failed to stop recurring task', 'error')
+    
+    return redirect(url_for('dashboard'))
+
 @app.route('/update/<int:todo_id>', methods=['POST'])
 def update_todo_status(todo_id):
     """Update todo status"""
@@ -400,22 +667,28 @@ def update_todo_status(todo_id):
     
     status = request.form.get('status', 'pending')
     
+    if group_commit.GROUP_COMMIT and storage.supports('group_commit'):
+        return update_todo_status_grouped(todo_id, status)
+    
     conn = get_db_connection()
     if not conn:
-        flash('Database connection error', 'error')
+        flash(db_error_message(), 'error')
         return redirect(url_for('dashboard'))
     
     try:
         cur = conn.cursor()
-        cur.execute(
-            '''UPDATE todo_items 
-               SET status = %s, updated_at = CURRENT_TIMESTAMP 
-               WHERE id = %s AND user_id = %s''',
-            (status, todo_id, session['user_id'])
-        )
+        cur.execute(queries.UPDATE_TODO_STATUS, {
+            'status': status, 'todo_id': todo_id, 'user_id': session['user_id']
+        })
+        row = cur.fetchone()
+        updated = cur.rowcount
+        if updated > 0:
+            parent_id, category_id = row
+            realtime.publish_shared(cur, session['user_id'], category_id, 'todo_updated', id=todo_id, status=status)
+            realtime.publish_parent(cur, session['user_id'], parent_id)
         conn.commit()
         
-        if cur.rowcount > 0:
+        if updated > 0:
             print(f"✅ Task {todo_id} status updated to {status}")
             flash('Task status updated!', 'success')
         else:
@@ -433,6 +706,29 @@ def update_todo_status(todo_id):
     
     return redirect(url_for('dashboard'))
 
+def update_todo_status_grouped(todo_id, status):
+    """update_todo_status via the group committer, which commits many requests' updates at once"""
+    ensure_db_initialized()
+    try:
+        updated = group_commit.committer.update_status(session['user_id'], todo_id, status)
+    except DatabaseBusy:
+        raise
+    except group_commit.DatabaseUnavailable as e:
+        print(f"❌ Update error: {e}")
+        flash(db_error_message(), 'error')
+        return redirect(url_for('dashboard'))
+    except Exception as e:
+        print(f"❌ Update error: {e}")
+        flash('Failed to update task', 'error')
+        return redirect(url_for('dashboard'))
+    
+    if updated > 0:
+        print(f"✅ Task {todo_id} status updated to {status}")
+        flash('Task status updated!', 'success')
+    else:
+        flash('Task not found', 'error')
+    return redirect(url_for('dashboard'))
+
 @app.route('/delete/<int:todo_id>', methods=['POST'])
 def delete_todo(todo_id):
     """Delete todo"""
@@ -442,18 +738,21 @@ def delete_todo(todo_id):
     
     conn = get_db_connection()
     if not conn:
-        flash('Database connection error', 'error')
+        flash(db_error_message(), 'error')
         return redirect(url_for('dashboard'))
     
     try:
         cur = conn.cursor()
-        cur.execute(
-            'DELETE FROM todo_items WHERE id = %s AND user_id = %s',
-            (todo_id, session['user_id'])
-        )
+        cur.execute(queries.DELETE_TODO, {'todo_id': todo_id, 'user_id': session['user_id']})
+        row = cur.fetchone()
+        deleted = cur.rowcount
+        if deleted > 0:
+            parent_id, category_id = row
+            realtime.publish_shared(cur, session['user_id'], category_id, 'todo_deleted', id=todo_id)
+            realtime.publish_parent(cur, session['user_id'], parent_id)
         conn.commit()
         
-        if cur.rowcount > 0:
+        if deleted > 0:
             print(f"✅ Task {todo_id} deleted")
             flash('Task deleted successfully!', 'success')
         else:
@@ -471,6 +770,112 @@ def delete_todo(todo_id):
     
     return redirect(url_for('dashboard'))
 
+@app.route('/tags/<int:todo_id>', methods=['POST'])
+def update_todo_tags(todo_id):
+    """Replace a todo's tags"""
+    if 'user_id' not in session:
+        flash('Please log in first', 'error')
+        return redirect(url_for('login'))
+    
+    try:
+        todo_tags = tags.normalize(request.form.get('tags', ''))
+    except ValueError as e:
+        flash(f'Invalid tags: {e}', 'error')
+        return redirect(url_for('dashboard'))
+    
+    conn = get_db_connection()
+    if not conn:
+        flash(db_error_message(), 'error')
+        return redirect(url_for('dashboard'))
+    
+    try:
+        cur = conn.cursor()
+        cur.execute(queries.UPDATE_TODO_TAGS, {'tags': todo_tags, 'todo_id': todo_id, 'user_id': session['user_id']})
+        row = cur.fetchone()
+        updated = cur.rowcount
+        if updated > 0:
+            realtime.publish_shared(cur, session['user_id'], row[0], 'todo_updated', id=todo_id)
+        conn.commit()
+        
+        if updated > 0:
+            print(f"✅ Task {todo_id} tags set to {todo_tags}")
+            flash('Tags updated!', 'success')
+        else:
+            flash('Task not found', 'error')
+        
+        cur.close()
+        conn.close()
+            
+    except Exception as e:
+        print(f"❌ Tag update error: {e}")
+        if conn:
+            conn.rollback()
+            conn.close()
+        flash('Failed to update tags', 'error')
+    
+    return redirect(url_for('dashboard'))
+
+@app.route('/todos/<int:todo_id>/move', methods=['POST'])
+def move_todo(todo_id):
+    """Drag and drop: put a todo between two others in the manual order, rewriting only its own key"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+    
+    data = request.get_json(silent=True) or {}
+    # The todos now directly above and below it; None at either end of the list
+    after_id, before_id = data.get('after'), data.get('before')
+    neighbours = [n for n in (after_id, before_id) if n is not None]
+    if not all(isinstance(n, int) for n in neighbours) or todo_id in neighbours:
+        return jsonify({'error': 'after and before must be other todo ids or null'}), 400
+    
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': db_error_message()}), 503
+    
+    try:
+        cur = conn.cursor()
+        params = {'ids': neighbours, 'user_id': session['user_id']}
+        keys = {}
+        positions.lock(cur, session['user_id'])
+        if neighbours:
+            cur.execute(queries.POSITIONS, params)
+            keys = dict(cur.fetchall())
+            if len(keys) < len(neighbours):
+                cur.close()
+                conn.close()
+                return jsonify({'error': 'Task not found'}), 404
+            if None in keys.values() or len(set(keys.values())) < len(keys):
+                # Todos from before manual ordering have no key yet, or two
+                # share one: key the whole list once
+                positions.rebalance(cur, session['user_id'])
+                cur.execute(queries.POSITIONS, params)
+                keys = dict(cur.fetchall())
+        key = positions.key_between(keys.get(after_id), keys.get(before_id))
+        cur.execute(queries.MOVE_TODO, {'key': key, 'todo_id': todo_id, 'user_id': session['user_id']})
+        moved = cur.rowcount
+        if moved > 0:
+            realtime.publish(cur, session['user_id'], 'todo_updated', id=todo_id)
+        conn.commit()
+        cur.close()
+        conn.close()
+    
+    except ValueError:
+        # The neighbours were reordered since the page was loaded
+        conn.rollback()
+        conn.close()
+        return jsonify({'error': 'The list has changed; reload and try again'}), 409
+    except Exception as e:
+        print(f"❌ Move error: {e}")
+        if conn:
+            conn.rollback()
+            conn.close()
+        return jsonify({'error': 'Failed to move task'}), 500
+    
+    if moved == 0:
+        return jsonify({'error': 'Task not found'}), 404
+    print(f"✅ Task {todo_id} moved to {key}")
+    return jsonify({'id': todo_id, 'position': key})
+
 @app.route('/add_category', methods=['POST'])
 def add_category():
     """Add new category"""
@@ -487,15 +892,13 @@ def add_category():
     
     conn = get_db_connection()
     if not conn:
-        flash('Database connection error', 'error')
+        flash(db_error_message(), 'error')
         return redirect(url_for('dashboard'))
     
     try:
         cur = conn.cursor()
-        cur.execute(
-            'INSERT INTO todo_categories (user_id, name, color) VALUES (%s, %s, %s)',
-            (session['user_id'], name, color)
-        )
+        cur.execute(queries.INSERT_CATEGORY, (session['user_id'], name, color))
+        realtime.publish(cur, session['user_id'], 'category_added', id=cur.fetchone()[0], name=name, color=color)
         conn.commit()
         cur.close()
         conn.close()
@@ -503,7 +906,7 @@ def add_category():
         print(f"✅ Category added: {name}")
         flash('Category added successfully!', 'success')
         
-    except psycopg2.IntegrityError:
+    except storage.IntegrityError:
         if conn:
             conn.rollback()
             conn.close()
@@ -517,6 +920,664 @@ def add_category():
     
     return redirect(url_for('dashboard'))
 
+@app.route('/categories/<int:category_id>/members')
+def category_members(category_id):
+    """Who a category is shared with; its owner adds and removes them here"""
+    if 'user_id' not in session:
+        flash('Please log in first', 'error')
+        return redirect(url_for('login'))
+    
+    conn = get_read_connection()
+    if not conn:
+        flash(db_error_message(), 'error')
+        return redirect(url_for('dashboard'))
+    
+    try:
+        cur = conn.cursor()
+        cur.execute(queries.CATEGORIES_FOR_USER, {'user_id': session['user_id']})
+        category = next((c for c in models.fetch_all(cur, models.Category) if c.id == category_id), None)
+        members = []
+        if category:
+            cur.execute(queries.CATEGORY_MEMBERS, (category_id,))
+            members = models.fetch_all(cur, models.CategoryMember)
+        cur.close()
+        conn.close()
+    except Exception as e:
+        print(f"❌ Members error: {e}")
+        if conn:
+            conn.close()
+        flash('Failed to load members', 'error')
+        return redirect(url_for('dashboard'))
+    
+    if not category:
+        flash('Category not found', 'error')
+        return redirect(url_for('dashboard'))
+    return render_template('members.html', category=category, members=members, roles=MEMBER_ROLES)
+
+@app.route('/categories/<int:category_id>/members', methods=['POST'])
+def add_category_member(category_id):
+    """Share a category with another user, or change their role"""
+    if 'user_id' not in session:
+        flash('Please log in first', 'error')
+        return redirect(url_for('login'))
+    
+    username = request.form.get('username', '').strip()
+    role = request.form.get('role', 'viewer')
+    if not username or role not in MEMBER_ROLES:
+        flash('A username and a valid role are required', 'error')
+        return redirect(url_for('category_members', category_id=category_id))
+    
+    conn = get_db_connection()
+    if not conn:
+        flash(db_error_message(), 'error')
+        return redirect(url_for('category_members', category_id=category_id))
+    
+    try:
+        cur = conn.cursor()
+        if sharing.category_role(cur, category_id) != 'owner':
+            cur.close()
+            conn.close()
+            flash('Only the owner can share this category', 'error')
+            return redirect(url_for('dashboard'))
+        cur.execute(queries.UPSERT_CATEGORY_MEMBER, {
+            'category_id': category_id, 'username': username, 'role': role
+        })
+        row = cur.fetchone()
+        if row:
+            realtime.publish(cur, row[0], 'category_shared', id=category_id, role=role)
+        conn.commit()
+        cur.close()
+        conn.close()
+        
+        if row:
+            print(f"✅ Category {category_id} shared with {username} as {role}")
+            flash(f'Shared with {username} as {role}', 'success')
+        else:
+            flash('No such user', 'error')
+    
+    except Exception as e:
+        print(f"❌ Add member error: {e}")
+        if conn:
+            conn.rollback()
+            conn.close()
+        flash('Failed to share category', 'error')
+    
+    return redirect(url_for('category_members', category_id=category_id))
+
+@app.route('/categories/<int:category_id>/members/<int:member_id>/delete', methods=['POST'])
+def remove_category_member(category_id, member_id):
+    """Stop sharing a category with someone; members may also remove themselves"""
+    if 'user_id' not in session:
+        flash('Please log in first', 'error')
+        return redirect(url_for('login'))
+    
+    leaving = member_id == session['user_id']
+    conn = get_db_connection()
+    if not conn:
+        flash(db_error_message(), 'error')
+        return redirect(url_for('dashboard'))
+    
+    try:
+        cur = conn.cursor()
+        if not leaving and sharing.category_role(cur, category_id) != 'owner':
+            cur.close()
+            conn.close()
+            flash('Only the owner can change who this category is shared with', 'error')
+            return redirect(url_for('dashboard'))
+        cur.execute(queries.DELETE_CATEGORY_MEMBER, (category_id, member_id))
+        removed = cur.rowcount
+        if removed > 0:
+            realtime.publish(cur, member_id, 'category_unshared', id=category_id)
+        conn.commit()
+        cur.close()
+        conn.close()
+        
+        if removed > 0:
+            print(f"✅ User {member_id} removed from category {category_id}")
+            flash('You left the category' if leaving else 'Member removed', 'success')
+        else:
+            flash('Member not found', 'error')
+    
+    except Exception as e:
+        print(f"❌ Remove member error: {e}")
+        if conn:
+            conn.rollback()
+            conn.close()
+        flash('Failed to remove member', 'error')
+    
+    if leaving:
+        return redirect(url_for('dashboard'))
+    return redirect(url_for('category_members', category_id=category_id))
+
+@app.route('/events')
+def events():
+    """Server-Sent Events stream of this user's todo changes"""
+    if 'user_id' not in session:
+        return '', 401
+    if not realtime.available():
+        # 204 tells EventSource to stop reconnecting
+        return '', 204
+    
+    return Response(realtime.stream(session['user_id']), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/todos/<int:todo_id>/card')
+def todo_card(todo_id):
+    """One rendered todo card, fetched by the dashboard after a realtime event"""
+    if 'user_id' not in session:
+        return '', 401
+    
+    # The primary, since the event may be for a write replicas have not seen yet
+    conn = get_db_connection()
+    if not conn:
+        return '', 503
+    
+    try:
+        cur = conn.cursor()
+        cur.execute(queries.DASHBOARD_TODO, {'todo_id': todo_id, 'user_id': session['user_id']})
+        todo = models.fetch_one(cur, models.Todo)
+        cur.close()
+        conn.close()
+    except Exception as e:
+        print(f"❌ Todo card error: {e}")
+        conn.close()
+        return '', 500
+    
+    if not todo:
+        return '', 404
+    return fragments.render_card(todo, session.get('dashboard_order', 'priority'))
+
+@app.route('/api/fragment-cache')
+def api_fragment_cache():
+    """Size and hit rate of this process's rendered-card cache (see fragments.py)"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+    return jsonify(fragments.cards.stats())
+
+def load_todo_tree(root_id):
+    """A todo and its descendants (or with root_id None, every todo) as TODO_TREE rows, or None on error"""
+    # The primary, like todo_card: the subtree is usually fetched right after a change
+    conn = get_db_connection()
+    if not conn:
+        return None
+    
+    try:
+        cur = conn.cursor()
+        cur.execute(queries.TODO_TREE, {'user_id': session['user_id'], 'root_id': root_id})
+        nodes = models.fetch_all(cur, models.TreeTodo)
+        cur.close()
+        conn.close()
+        return nodes
+    except Exception as e:
+        print(f"❌ Todo tree error: {e}")
+        conn.close()
+        return None
+
+@app.route('/todos/<int:todo_id>/subtasks')
+def todo_subtasks(todo_id):
+    """A todo's subtree as an HTML fragment, fetched when its card is expanded"""
+    if 'user_id' not in session:
+        return '', 401
+    
+    nodes = load_todo_tree(todo_id)
+    if nodes is None:
+        return '', 503
+    if not nodes:
+        return '', 404
+    return render_template('_subtasks.html', root=nodes[0], nodes=nodes[1:])
+
+@app.route('/api/todos/tree')
+def api_todo_tree():
+    """The user's todos as nested JSON, or just the subtree under ?root=<id>"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+    
+    root_id = request.args.get('root', None, type=int)
+    nodes = load_todo_tree(root_id)
+    if nodes is None:
+        return jsonify({'error': 'Database connection error'}), 503
+    if root_id is not None and not nodes:
+        return jsonify({'error': 'Task not found'}), 404
+    
+    roots = []
+    by_id = {}
+    # Parents always come before their children in TODO_TREE order
+    for todo in nodes:
+        node = by_id[todo.id] = {
+            'id': todo.id,
+            'title': todo.title,
+            'description': todo.description_preview,
+            # The full text is at /api/todos/<id>/description
+            'description_truncated': todo.description_truncated,
+            'priority': todo.priority,
+            'status': todo.status,
+            'category': todo.category,
+            'category_color': todo.category_color,
+            'due_date': todo.due_date.isoformat() if todo.due_date else None,
+            'created_at': todo.created_at.isoformat() if todo.created_at else None,
+            'subtask_total': todo.subtask_total,
+            'subtask_done': todo.subtask_done,
+            'tags': todo.tags,
+            'role': todo.role,
+            'subtasks': []
+        }
+        parent = by_id.get(todo.parent_id)
+        if parent is not None and todo.depth > 0:
+            parent['subtasks'].append(node)
+        else:
+            roots.append(node)
+    
+    return jsonify({'todos': roots})
+
+@app.route('/api/todos/<int:todo_id>/description')
+def api_todo_description(todo_id):
+    """A todo's full description; list views only carry a preview"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+    
+    conn = get_read_connection()
+    if not conn:
+        return jsonify({'error': 'Database connection error'}), 503
+    
+    try:
+        cur = conn.cursor()
+        cur.execute(queries.TODO_DESCRIPTION, {'todo_id': todo_id, 'user_id': session['user_id']})
+        row = cur.fetchone()
+        cur.close()
+        conn.close()
+    except Exception as e:
+        print(f"❌ Todo description error: {e}")
+        conn.close()
+        return jsonify({'error': 'Failed to load description'}), 500
+    
+    if not row:
+        return jsonify({'error': 'Task not found'}), 404
+    return jsonify({'id': todo_id, 'description': row[0]})
+
+def parse_history_cursor(cursor):
+    """Split a '<completed_at>_<id>' cursor; anything unparsable means the first page"""
+    try:
+        completed_at, todo_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(completed_at), int(todo_id)
+    except (AttributeError, ValueError):
+        return None, None
+
+def load_history(user_id, cursor, limit):
+    """Fetch one page of archived todos, returning (todos, next_cursor)"""
+    before_completed, before_id = parse_history_cursor(cursor)
+    conn = get_read_connection()
+    if not conn:
+        return None, None
+
+    try:
+        cur = conn.cursor()
+        cur.execute(queries.HISTORY_PAGE, {
+            'user_id': user_id,
+            'before_completed': before_completed,
+            'before_id': before_id,
+            'limit': limit
+        })
+        todos = models.fetch_all(cur, models.ArchivedTodo)
+        cur.close()
+        conn.close()
+    except Exception as e:
+        print(f"❌ History error: {e}")
+        conn.close()
+        return None, None
+
+    next_cursor = None
+    if len(todos) == limit and todos[-1].completed_at:
+        next_cursor = f"{todos[-1].completed_at.isoformat()}_{todos[-1].id}"
+    return todos, next_cursor
+
+@app.route('/history')
+@requires('archive')
+def history():
+    """Archived (completed) todos, read on demand"""
+    if 'user_id' not in session:
+        flash('Please log in first', 'error')
+        return redirect(url_for('login'))
+    
+    todos, next_cursor = load_history(session['user_id'], request.args.get('before'), HISTORY_PAGE_SIZE)
+    if todos is None:
+        flash('Error loading history', 'error')
+        todos = []
+    
+    return render_template('history.html', todos=todos, next_cursor=next_cursor)
+
+@app.route('/api/history')
+@requires('archive')
+def api_history():
+    """Archived todos as JSON, paged with the `before` cursor"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+    
+    limit = min(request.args.get('limit', HISTORY_PAGE_SIZE, type=int), 200)
+    todos, next_cursor = load_history(session['user_id'], request.args.get('before'), max(limit, 1))
+    if todos is None:
+        return jsonify({'error': 'Database connection error'}), 503
+    
+    return jsonify({
+        'todos': [{
+            'id': todo.id,
+            'title': todo.title,
+            'description': todo.description,
+            'priority': todo.priority,
+            'status': todo.status,
+            'category': todo.category,
+            'category_color': todo.category_color,
+            'due_date': todo.due_date.isoformat() if todo.due_date else None,
+            'created_at': todo.created_at.isoformat() if todo.created_at else None,
+            'completed_at': todo.completed_at.isoformat() if todo.completed_at else None
+        } for todo in todos],
+        'next': next_cursor
+    })
+
+def load_user_analytics(days):
+    """Analytics for the logged-in user over the last `days` days, or None if the database failed"""
+    conn = get_read_connection()
+    if not conn:
+        return None
+    
+    try:
+        cur = conn.cursor()
+        stats = analytics.load_analytics(cur, session['user_id'], days)
+        cur.close()
+        conn.close()
+        return stats
+    except Exception as e:
+        print(f"❌ Analytics error: {e}")
+        conn.close()
+        return None
+
+def analytics_days():
+    return min(max(request.args.get('days', 30, type=int), 1), analytics.MAX_DAYS)
+
+@app.route('/analytics')
+@requires('analytics')
+def analytics_page():
+    """Completion throughput, time to complete and lateness, from the daily rollups"""
+    if 'user_id' not in session:
+        flash('Please log in first', 'error')
+        return redirect(url_for('login'))
+    
+    stats = load_user_analytics(analytics_days())
+    if stats is None:
+        flash('Error loading analytics', 'error')
+        return redirect(url_for('dashboard'))
+    
+    return render_template('analytics.html', stats=stats)
+
+@app.route('/api/analytics')
+@requires('analytics')
+def api_analytics():
+    """The analytics page as JSON"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+    
+    stats = load_user_analytics(analytics_days())
+    if stats is None:
+        return jsonify({'error': 'Database connection error'}), 503
+    return jsonify(stats)
+
+@app.route('/api/sync')
+@requires('sync')
+def api_sync():
+    """Changes to this user's todos since the `since` cursor, for offline clients"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+    
+    since = request.args.get('since', type=int)
+    limit = min(max(request.args.get('limit', SYNC_PAGE_SIZE, type=int), 1), 1000)
+    conn = get_read_connection()
+    if not conn:
+        return jsonify({'error': 'Database connection error'}), 503
+    
+    try:
+        cur = conn.cursor()
+        changes = sync.changes_since(cur, session['user_id'], since, limit)
+        cur.close()
+        conn.close()
+    except Exception as e:
+        print(f"❌ Sync error: {e}")
+        conn.close()
+        return jsonify({'error': 'Sync failed'}), 500
+    
+    if changes is None:
+        return jsonify({'error': 'Not logged in'}), 401
+    return jsonify(changes)
+
+@app.route('/api/sync', methods=['POST'])
+@requires('sync')
+def api_sync_push():
+    """Apply a batch of queued offline mutations, reporting conflicts per mutation"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+    
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('mutations'), list):
+        return jsonify({'error': 'Expected {"base_seq": ..., "mutations": [...]}'}), 400
+    if len(data['mutations']) > sync.MAX_MUTATIONS:
+        return jsonify({'error': f'At most {sync.MAX_MUTATIONS} mutations per request'}), 413
+    base_seq = data.get('base_seq')
+    if base_seq is not None and not isinstance(base_seq, int):
+        return jsonify({'error': 'base_seq must be an integer'}), 400
+    
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Database connection error'}), 503
+    
+    try:
+        cur = conn.cursor()
+        results = sync.apply_mutations(cur, session['user_id'], base_seq, data['mutations'])
+        conn.commit()
+        cur.close()
+        conn.close()
+    except Exception as e:
+        print(f"❌ Sync push error: {e}")
+        conn.rollback()
+        conn.close()
+        return jsonify({'error': 'Sync failed'}), 500
+    
+    print(f"✅ Applied {sum(r['status'] == 'ok' for r in results)}/{len(results)} offline changes")
+    return jsonify({'results': results})
+
+def load_user_agenda():
+    """(today, buckets) for the logged-in user, or None if the database failed"""
+    conn = get_read_connection()
+    if not conn:
+        return None
+
+    try:
+        cur = conn.cursor()
+        if 'timezone' not in session:
+            # Logged in before timezones were remembered at login
+            cur.execute(queries.USER_SETTINGS, (session['user_id'],))
+            user = models.fetch_one(cur, models.UserSettings)
+            session['timezone'] = user.timezone if user else None
+        today = agenda.today_in(session['timezone'])
+        buckets = agenda.load_agenda(cur, session['user_id'], today, storage.supports('recurrence'))
+        cur.close()
+        conn.close()
+        return today, buckets
+    except Exception as e:
+        print(f"❌ Agenda error: {e}")
+        conn.close()
+        return None
+
+@app.route('/agenda')
+def agenda_page():
+    """Open todos by when they are due: overdue, today, this week, later"""
+    if 'user_id' not in session:
+        flash('Please log in first', 'error')
+        return redirect(url_for('login'))
+
+    result = load_user_agenda()
+    if result is None:
+        flash('Error loading agenda', 'error')
+        return redirect(url_for('dashboard'))
+
+    today, buckets = result
+    return render_template('agenda.html', today=today, buckets=buckets, titles=agenda.BUCKET_TITLES)
+
+@app.route('/api/agenda')
+def api_agenda():
+    """The agenda as JSON"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+
+    result = load_user_agenda()
+    if result is None:
+        return jsonify({'error': 'Database connection error'}), 503
+
+    today, buckets = result
+    return jsonify({
+        'today': today.isoformat(),
+        'timezone': session['timezone'] or agenda.DEFAULT_TIMEZONE,
+        'buckets': {name: [{**entry, 'due_date': entry['due_date'].isoformat()} for entry in entries]
+                    for name, entries in buckets.items()},
+    })
+
+@app.route('/settings')
+def settings():
+    """Account settings: the address due-date reminders go to, and the agenda's timezone"""
+    if 'user_id' not in session:
+        flash('Please log in first', 'error')
+        return redirect(url_for('login'))
+
+    conn = get_read_connection()
+    if not conn:
+        flash(db_error_message(), 'error')
+        return redirect(url_for('dashboard'))
+
+    try:
+        cur = conn.cursor()
+        cur.execute(queries.USER_SETTINGS, (session['user_id'],))
+        user = models.fetch_one(cur, models.UserSettings)
+        cur.close()
+        conn.close()
+    except Exception as e:
+        print(f"❌ Settings error: {e}")
+        if conn:
+            conn.close()
+        flash('Failed to load settings', 'error')
+        return redirect(url_for('dashboard'))
+
+    if not user:
+        session.clear()
+        return redirect(url_for('login'))
+    return render_template('settings.html', user=user, timezones=agenda.timezones(),
+                           default_timezone=agenda.DEFAULT_TIMEZONE)
+
+@app.route('/settings', methods=['POST'])
+def update_settings():
+    """Save account settings"""
+    if 'user_id' not in session:
+        flash('Please log in first', 'error')
+        return redirect(url_for('login'))
+
+    email = parse_email(request.form.get('email'))
+    if email is None:
+        flash('Please enter a valid email address or leave it empty', 'error')
+        return redirect(url_for('settings'))
+    timezone = request.form.get('timezone', '').strip() or None
+    if timezone is not None and not agenda.valid_timezone(timezone):
+        flash('Unknown timezone', 'error')
+        return redirect(url_for('settings'))
+
+    conn = get_db_connection()
+    if not conn:
+        flash(db_error_message(), 'error')
+        return redirect(url_for('settings'))
+
+    try:
+        cur = conn.cursor()
+        cur.execute(queries.UPDATE_USER_SETTINGS,
+                    {'email': email or None, 'timezone': timezone, 'user_id': session['user_id']})
+        conn.commit()
+        cur.close()
+        conn.close()
+        session['timezone'] = timezone
+        print(f"✅ Settings saved for user {session['user_id']}")
+        flash('Settings saved', 'success')
+    except Exception as e:
+        print(f"❌ Save settings error: {e}")
+        if conn:
+            conn.rollback()
+            conn.close()
+        flash('Failed to save settings', 'error')
+
+    return redirect(url_for('settings'))
+
+@app.route('/settings/calendar', methods=['POST'])
+@requires('calendar')
+def reset_calendar_link():
+    """Create the calendar feed URL, or replace it so the old one stops working"""
+    if 'user_id' not in session:
+        flash('Please log in first', 'error')
+        return redirect(url_for('login'))
+
+    conn = get_db_connection()
+    if not conn:
+        flash(db_error_message(), 'error')
+        return redirect(url_for('settings'))
+
+    try:
+        cur = conn.cursor()
+        cur.execute(queries.SET_ICAL_TOKEN, {'token': ical.new_token(), 'user_id': session['user_id']})
+        conn.commit()
+        cur.close()
+        conn.close()
+        print(f"✅ Calendar link reset for user {session['user_id']}")
+        flash('New calendar link created. Subscriptions to the old one have stopped updating.', 'success')
+    except Exception as e:
+        print(f"❌ Calendar link error: {e}")
+        if conn:
+            conn.rollback()
+            conn.close()
+        flash('Failed to create a calendar link', 'error')
+
+    return redirect(url_for('settings'))
+
+@app.route('/calendar/<token>.ics')
+@requires('calendar')
+def calendar_feed(token):
+    """A user's due dates as an iCalendar feed, found by the secret in its URL"""
+    conn = get_db_connection(readonly=True)
+    if not conn:
+        return Response('Database connection error', status=503, mimetype='text/plain')
+
+    try:
+        cur = conn.cursor()
+        cur.execute(queries.FEED_USER, (token,))
+        user = models.fetch_one(cur, models.FeedUser)
+        cur.close()
+        if not user:
+            conn.close()
+            return Response('Not found', status=404, mimetype='text/plain')
+
+        etag = ical.etag(user)
+        if is_resource_modified(request.environ, etag=etag):
+            events = conn.cursor(name='calendar_feed')
+            events.itersize = ical.FETCH_SIZE
+            events.execute(queries.FEED_TODOS, (user.id,))
+            # stream() hands the connection back once the feed is sent
+            response = Response(ical.stream(conn, events, request.host), mimetype='text/calendar')
+        else:
+            conn.close()
+            response = Response(status=304)
+    except Exception as e:
+        print(f"❌ Calendar feed error: {e}")
+        conn.close()
+        return Response('Calendar feed failed', status=500, mimetype='text/plain')
+
+    response.set_etag(etag)
+    # Clients may keep a copy but must check back with the ETag
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
 @app.route('/logout')
 def logout():
     """User logout"""
@@ -533,9 +1594,19 @@ def not_found(e):
 def server_error(e):
     return render_template('500.html'), 500
 
+@app.errorhandler(DatabaseBusy)
+def database_busy(e):
+    """Connection budget spent: turn the request away fast rather than queue it"""
+    headers = {'Retry-After': str(e.retry_after)}
+    if request.path.startswith('/api/'):
+        return jsonify({'error': 'Server busy, please retry'}), 503, headers
+    return render_template('503.html'), 503, headers
+
 # For Vercel deployment
 app = app
 
+startup_report['import_ms'] = round((time.perf_counter() - IMPORT_STARTED) * 1000, 1)
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     app.run(debug=False, host='0.0.0.0', port=port)
\ No newline at end of file
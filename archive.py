@@ -0,0 +1,129 @@
+# archive.py - Move old completed todos out of todo_items
+#
+# Completed todos older than --days are moved into todo_items_archive, along
+# with their subtasks, in small batches. Each batch is its own short
+# transaction and skips rows that a request is currently holding, so the job
+# never blocks the app for long.
+# Run it from cron (see render.yaml) or by hand:
+#
+#   python archive.py --days 30 [--tombstone-days 90] [--batch-size 500] [--pause 0.1]
+#
+# It also prunes sync tombstones older than --tombstone-days. Sync clients
+# whose cursor predates a pruned tombstone get a full reset instead.
+import argparse
+import sys
+import time
+
+from db import get_db_connection
+
+# Columns carried over into todo_items_archive
+ARCHIVE_COLUMNS = '''id, user_id, category_id, title, description, priority, status,
+                     due_date, created_at, updated_at, completed_at, parent_id, tags,
+                     series_id, occurrence_date'''
+
+# Rows completed before completed_at existed get their last update time
+BACKFILL_COMPLETED_AT = '''
+    UPDATE todo_items SET completed_at = updated_at
+    WHERE id IN (
+        SELECT id FROM todo_items
+        WHERE status = 'completed' AND completed_at IS NULL
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    )
+'''
+
+# Whole trees move at once: a completed top-level todo takes all of its
+# subtasks along, whatever their state, and a completed subtask stays put
+# while its parent is open
+ARCHIVE_BATCH = f'''
+    WITH RECURSIVE batch AS (
+        SELECT id FROM todo_items
+        WHERE status = 'completed' AND parent_id IS NULL
+          AND completed_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 day'
+        ORDER BY completed_at
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    ), tree AS (
+        SELECT id FROM batch
+        UNION ALL
+        SELECT t.id FROM todo_items t JOIN tree ON t.parent_id = tree.id
+    ), moved AS (
+        DELETE FROM todo_items t
+        USING tree
+        WHERE t.id = tree.id
+        RETURNING t.*
+    )
+    INSERT INTO todo_items_archive ({ARCHIVE_COLUMNS})
+    SELECT {ARCHIVE_COLUMNS} FROM moved
+'''
+
+# Drops a batch of old tombstones and raises each affected user's sync_floor
+# to the newest seq dropped; rowcount is the number of users touched
+PRUNE_TOMBSTONES = '''
+    WITH batch AS (
+        SELECT user_id, change_seq FROM todo_tombstones
+        WHERE deleted_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 day'
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    ), pruned AS (
+        DELETE FROM todo_tombstones t
+        USING batch
+        WHERE t.user_id = batch.user_id AND t.change_seq = batch.change_seq
+        RETURNING t.user_id, t.change_seq
+    )
+    UPDATE todo_users u
+    SET sync_floor = GREATEST(u.sync_floor, floors.change_seq)
+    FROM (SELECT user_id, MAX(change_seq) AS change_seq FROM pruned GROUP BY user_id) floors
+    WHERE u.id = floors.user_id
+'''
+
+def run_batches(conn, sql, params, pause, label):
+    """Run sql until it affects no rows, committing after every batch"""
+    cur = conn.cursor()
+    # Give up quickly rather than queue behind a long-running request
+    cur.execute("SET lock_timeout = '2s'")
+    total = 0
+    while True:
+        cur.execute(sql, params)
+        count = cur.rowcount
+        conn.commit()
+        if count <= 0:
+            break
+        total += count
+        print(f"🔵 {label}: {total} rows")
+        time.sleep(pause)
+    cur.close()
+    return total
+
+def archive_completed(days=30, batch_size=500, pause=0.1, tombstone_days=90):
+    """Move todos completed more than `days` ago into todo_items_archive"""
+    conn = get_db_connection()
+    if not conn:
+        print("❌ Cannot archive - no connection")
+        return False
+
+    try:
+        run_batches(conn, BACKFILL_COMPLETED_AT, (batch_size,), pause, 'Backfilled completed_at')
+        total = run_batches(conn, ARCHIVE_BATCH, (days, batch_size), pause, 'Archived')
+        print(f"✅ Archived {total} todos completed more than {days} days ago")
+        run_batches(conn, PRUNE_TOMBSTONES, (tombstone_days, batch_size), pause, 'Pruned tombstones (users)')
+        return True
+
+    except Exception as e:
+        print(f"❌ Archive error: {e}")
+        conn.rollback()
+        return False
+
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Move old completed todos into todo_items_archive')
+    parser.add_argument('--days', type=int, default=30, help='archive todos completed more than this many days ago')
+    parser.add_argument('--tombstone-days', type=int, default=90, help='prune sync tombstones older than this')
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--pause', type=float, default=0.1, help='seconds to sleep between batches')
+    args = parser.parse_args()
+
+    if not archive_completed(args.days, args.batch_size, args.pause, args.tombstone_days):
+        sys.exit(1)
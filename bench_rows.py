@@ -0,0 +1,82 @@
+# bench_rows.py - Memory per row for tuple, dict and models.Todo results
+#
+# Fetches --rows synthetic rows shaped like the dashboard query (same columns
+# and types, generated by the database, no tables needed) three ways and
+# reports what each result set keeps alive per row: plain psycopg2 tuples,
+# RealDictCursor dicts, and the models.Todo namedtuples the app uses.
+#
+#   python bench_rows.py [--rows 100000]
+import argparse
+import gc
+import sys
+import tracemalloc
+
+from psycopg2.extras import RealDictCursor
+
+from db import get_db_connection
+import models
+
+# The column list and types of queries.DASHBOARD_TODO_COLUMNS
+ROWS = '''
+    SELECT n AS id, 'Todo number ' || n AS title, repeat('x', n %% 300) AS description,
+           (ARRAY['low', 'medium', 'high'])[n %% 3 + 1] AS priority,
+           (ARRAY['pending', 'in_progress', 'completed'])[n %% 3 + 1] AS status,
+           'Work' AS category, '#667eea' AS category_color,
+           CURRENT_DATE + n %% 30 AS due_date, now() - n * interval '1 minute' AS created_at,
+           n %% 4 AS subtask_total, n %% 2 AS subtask_done, ARRAY['home', 'errand'] AS tags,
+           lpad(n::text, 6, '0') AS position_key, CURRENT_TIMESTAMP AS updated_at, 'owner' AS role
+    FROM generate_series(1, %s) AS n
+'''
+
+def measure(fetch):
+    """Bytes allocated and still held by the result of fetch(), and the result"""
+    gc.collect()
+    tracemalloc.start()
+    result = fetch()
+    held, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return held, result
+
+def container_size(rows):
+    """Bytes in the row objects themselves, leaving out the values they hold"""
+    size = sum(sys.getsizeof(row) for row in rows)
+    if rows and hasattr(rows[0], '__dict__'):
+        size += sum(sys.getsizeof(row.__dict__) for row in rows)
+    return size
+
+def bench(conn, n):
+    def tuples():
+        with conn.cursor() as cur:
+            cur.execute(ROWS, (n,))
+            return cur.fetchall()
+
+    def dicts():
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(ROWS, (n,))
+            return cur.fetchall()
+
+    def todos():
+        with conn.cursor() as cur:
+            cur.execute(ROWS, (n,))
+            return models.fetch_all(cur, models.Todo)
+
+    print(f"{'rows as':<12} {'held/row':>10} {'object/row':>11} {'total':>10}")
+    for name, fetch in (('tuple', tuples), ('dict', dicts), ('models.Todo', todos)):
+        held, rows = measure(fetch)
+        print(f"{name:<12} {held / n:>9.0f}B {container_size(rows) / n:>10.0f}B {held / 2**20:>8.1f}MB")
+        del rows
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare per-row memory of result row types')
+    parser.add_argument('--rows', type=int, default=100000)
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    if not conn:
+        print("❌ Cannot run the benchmark - no connection")
+        sys.exit(1)
+    try:
+        print(f"🚀 {args.rows} dashboard-shaped rows\n")
+        bench(conn, args.rows)
+    finally:
+        conn.close()
@@ -0,0 +1,132 @@
+# bench_storage.py - Compare the storage backends on the core routes
+#
+# Runs the app in-process (Flask test client, no HTTP server) once per
+# backend in a fresh interpreter, since storage.py picks the backend at
+# import. Each of --clients threads registers its own user and loops over
+# add, dashboard, card, status update and delete for --rounds rounds. A
+# request counts as an error unless it did what it was asked: routes that
+# fail flash an error and still redirect, so writes are judged by where they
+# redirect and what they flashed, and pages by what they show.
+# Postgres uses the usual DB_* / DATABASE_URL settings; SQLite gets a new
+# database file in a temporary directory.
+#
+#   python bench_storage.py [--backends postgres,sqlite] [--clients 4] [--rounds 200]
+import argparse
+import contextlib
+import io
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+ROUTES = ('add', 'dashboard', 'card', 'update', 'delete')
+
+def timed(latencies, errors, route, call, check):
+    started = time.perf_counter()
+    response = call()
+    latencies[route].append((time.perf_counter() - started) * 1000)
+    if not check(response):
+        errors[route] += 1
+    return response
+
+def flashed(client):
+    """Categories of the messages flashed so far, taken out of the session"""
+    with client.session_transaction() as session:
+        return [category for category, _ in session.pop('_flashes', [])]
+
+def write_succeeded(client):
+    """Check for a form post: back to the dashboard with only success messages"""
+    def check(response):
+        categories = flashed(client)
+        return (response.status_code == 302 and response.location.endswith('/dashboard')
+                and 'success' in categories and 'error' not in categories)
+    return check
+
+def dashboard_loaded(response):
+    return response.status_code == 200 and b'alert alert-error' not in response.get_data()
+
+def run_client(app, rounds, latencies, errors):
+    client = app.test_client()
+    username = f"bench_{uuid.uuid4().hex[:8]}"
+    client.post('/register', data={'username': username, 'password': 'bench-password'})
+    client.post('/login', data={'username': username, 'password': 'bench-password'})
+    flashed(client)
+
+    for n in range(rounds):
+        timed(latencies, errors, 'add', lambda: client.post('/add', data={
+            'title': f'Task {n}', 'description': 'benchmark task', 'priority': ('high', 'medium', 'low')[n % 3],
+            'tags': 'bench, storage'
+        }), write_succeeded(client))
+        page = timed(latencies, errors, 'dashboard', lambda: client.get('/dashboard'), dashboard_loaded).get_data()
+        todo_id = int(re.search(rb'id="todo-(\d+)"', page).group(1))
+        timed(latencies, errors, 'card', lambda: client.get(f'/todos/{todo_id}/card'),
+              lambda response: response.status_code == 200 and f'id="todo-{todo_id}"' in response.get_data(as_text=True))
+        timed(latencies, errors, 'update', lambda: client.post(f'/update/{todo_id}', data={'status': 'in_progress'}),
+              write_succeeded(client))
+        # Keep half of them so the dashboard grows as the run goes on
+        if n % 2:
+            timed(latencies, errors, 'delete', lambda: client.post(f'/delete/{todo_id}'), write_succeeded(client))
+
+def child(clients, rounds):
+    """Run the benchmark against the backend in STORAGE_BACKEND and print the results as JSON"""
+    latencies = {route: [] for route in ROUTES}
+    errors = {route: 0 for route in ROUTES}
+    # The routes log every request; keep that out of the results
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app
+        app.ensure_db_initialized()
+        threads = [threading.Thread(target=run_client, args=(app.app, rounds, latencies, errors))
+                   for _ in range(clients)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    print(json.dumps({'latencies': latencies, 'errors': errors, 'elapsed': elapsed}))
+
+def bench(backend, args, workdir):
+    # The routes' rate limits would throttle the clients long before the database does
+    env = dict(os.environ, STORAGE_BACKEND=backend, REALTIME='0', RATE_LIMITING='0')
+    if backend == 'sqlite':
+        env['SQLITE_PATH'] = os.path.join(workdir, 'bench.db')
+    result = subprocess.run([sys.executable, __file__, '--child', '--clients', str(args.clients),
+                             '--rounds', str(args.rounds)], env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(f"{backend:<9} ❌ benchmark failed:\n{result.stderr.strip()[-2000:]}")
+        return
+
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    requests = sum(len(times) for times in report['latencies'].values())
+    print(f"{backend:<9} {requests / report['elapsed']:>8.1f} req/s")
+    for route in ROUTES:
+        times = sorted(report['latencies'][route])
+        if not times:
+            continue
+        p95 = times[max(0, int(len(times) * 0.95) - 1)]
+        print(f"  {route:<10} {statistics.median(times):>8.2f}ms {p95:>8.2f}ms {times[-1]:>8.2f}ms "
+              f"{report['errors'][route]:>7}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare storage backends on the core routes')
+    parser.add_argument('--backends', default='postgres,sqlite')
+    parser.add_argument('--clients', type=int, default=4, help='concurrent client threads')
+    parser.add_argument('--rounds', type=int, default=200, help='add/dashboard/update rounds per client')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.clients, args.rounds)
+        sys.exit(0)
+
+    print(f"🚀 {args.clients} clients x {args.rounds} rounds per backend\n")
+    print(f"{'backend':<9} {'p50':>12} {'p95':>10} {'max':>10} {'errors':>7}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for backend in args.backends.split(','):
+            bench(backend.strip(), args, workdir)
@@ -0,0 +1,131 @@
+# bench_workers.py - Compare gunicorn worker models under concurrent load
+#
+# Starts gunicorn with gunicorn.conf.py once per worker class, logs a client
+# in, and has --clients threads hammer a mix of dashboard loads and logins
+# (the password hash is the slowest thing the app does) for --duration seconds.
+#
+#   python bench_workers.py [--classes sync,gthread,gevent] [--clients 32] [--duration 10]
+import argparse
+import http.client
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+import uuid
+
+USERNAME = f"bench_{uuid.uuid4().hex[:8]}"
+PASSWORD = 'bench-password'
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def request(port, method, path, body=None, cookie=None):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    headers = {}
+    if body is not None:
+        body = urllib.parse.urlencode(body)
+        headers['Content-Type'] = 'application/x-www-form-urlencoded'
+    if cookie:
+        headers['Cookie'] = cookie
+    conn.request(method, path, body=body, headers=headers)
+    response = conn.getresponse()
+    response.read()
+    conn.close()
+    return response
+
+def wait_until_up(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            return False
+        try:
+            request(port, 'GET', '/login')
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+def log_in(port):
+    request(port, 'POST', '/register', {'username': USERNAME, 'password': PASSWORD})
+    response = request(port, 'POST', '/login', {'username': USERNAME, 'password': PASSWORD})
+    cookie = response.getheader('Set-Cookie', '').split(';')[0]
+    if not cookie:
+        raise RuntimeError('could not log in the benchmark user')
+    return cookie
+
+def run_load(port, cookie, clients, duration, login_every):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def client():
+        n = 0
+        while time.monotonic() < stop_at:
+            n += 1
+            started = time.perf_counter()
+            try:
+                if n % login_every == 0:
+                    response = request(port, 'POST', '/login', {'username': USERNAME, 'password': PASSWORD})
+                else:
+                    response = request(port, 'GET', '/dashboard', cookie=cookie)
+                ok = response.status < 400
+            except OSError:
+                ok = False
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                (latencies if ok else errors).append(elapsed)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, errors
+
+def bench(worker_class, args):
+    port = free_port()
+    # The load is one client logging in over and over, which rate limiting would stop
+    env = dict(os.environ, GUNICORN_WORKER_CLASS=worker_class, PORT=str(port), RATE_LIMITING='0')
+    if args.workers:
+        env['GUNICORN_WORKERS'] = str(args.workers)
+    here = os.path.dirname(os.path.abspath(__file__))
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', 'app:app'], cwd=here, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not wait_until_up(port, process):
+            print(f"{worker_class:<8} ❌ gunicorn did not start (is the worker class installed?)")
+            return
+        cookie = log_in(port)
+        latencies, errors = run_load(port, cookie, args.clients, args.duration, args.login_every)
+    finally:
+        process.terminate()
+        process.wait()
+
+    if not latencies:
+        print(f"{worker_class:<8} ❌ every request failed")
+        return
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{worker_class:<8} {len(latencies) / args.duration:>8.1f} {statistics.median(latencies):>8.1f}ms "
+          f"{p95:>8.1f}ms {latencies[-1]:>8.1f}ms {len(errors):>7}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare gunicorn worker classes under load')
+    parser.add_argument('--classes', default='sync,gthread,gevent')
+    parser.add_argument('--clients', type=int, default=32, help='concurrent client threads')
+    parser.add_argument('--duration', type=float, default=10, help='seconds of load per worker class')
+    parser.add_argument('--workers', type=int, help='fix the worker count instead of sizing from cores')
+    parser.add_argument('--login-every', type=int, default=10, help='every Nth request is a login')
+    args = parser.parse_args()
+
+    print(f"🚀 {args.clients} clients for {args.duration:g}s each, 1 in {args.login_every} requests a login\n")
+    print(f"{'class':<8} {'req/s':>8} {'p50':>10} {'p95':>10} {'max':>10} {'errors':>7}")
+    for worker_class in args.classes.split(','):
+        bench(worker_class.strip(), args)
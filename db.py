@@ -0,0 +1,351 @@
+# db.py - Database connection helpers shared by the app and the maintenance scripts
+import psycopg2
+import os
+import random
+import threading
+import time
+
+try:
+    from flask import has_request_context, request
+except ImportError:  # maintenance scripts can run without Flask installed
+    has_request_context = lambda: False
+    request = None
+
+# Optional read replicas, e.g. DATABASE_REPLICA_URLS=postgres://a/db,postgres://b/db
+REPLICA_URLS = [url.strip() for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+
+# Connection budget. The database is shared with another app (see render.yaml),
+# so DB_MAX_CONNECTIONS is the most this app may hold open across all of its
+# worker processes; each process gets an equal share. With live updates on,
+# a process also keeps one LISTEN connection open for as long as it runs
+# (see realtime.py), outside the pool, so its pool is one smaller.
+DB_MAX_CONNECTIONS = int(os.environ.get('DB_MAX_CONNECTIONS', 10))
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 1))
+LISTEN_CONNECTIONS = 1 if os.environ.get('REALTIME', '0').lower() in ('1', 'true', 'yes') else 0
+POOL_SIZE = max(1, DB_MAX_CONNECTIONS // max(1, WEB_CONCURRENCY) - LISTEN_CONNECTIONS)
+# Requests allowed to wait for a free connection, and for how long, before
+# they are turned away with a 503
+DB_QUEUE_LIMIT = int(os.environ.get('DB_QUEUE_LIMIT', POOL_SIZE * 2))
+DB_QUEUE_TIMEOUT = float(os.environ.get('DB_QUEUE_TIMEOUT', 2))
+
+# Behind PgBouncer in transaction pooling mode consecutive transactions may
+# run on different server connections, so nothing may rely on session state:
+# settings are applied with SET LOCAL for each transaction instead.
+DB_PGBOUNCER = os.environ.get('DB_PGBOUNCER', '').lower() in ('1', 'true', 'yes')
+
+# statement_timeout (ms) per Flask endpoint. Only applied inside a request;
+# maintenance scripts keep the server default.
+DB_STATEMENT_TIMEOUT = int(os.environ.get('DB_STATEMENT_TIMEOUT', 5000))
+STATEMENT_TIMEOUTS = {
+    'login': 2000,
+    'register': 3000,
+    'dashboard': 3000,
+    'add_todo': 2000,
+    'update_todo_status': 2000,
+    'delete_todo': 2000,
+    'update_todo_tags': 2000,
+    'move_todo': 5000,
+    'update_occurrence': 2000,
+    'delete_series': 2000,
+    'add_category': 2000,
+    'category_members': 2000,
+    'add_category_member': 2000,
+    'remove_category_member': 2000,
+    'todo_card': 2000,
+    'occurrences': 2000,
+    'todo_subtasks': 2000,
+    'api_todo_tree': 5000,
+    'api_todo_description': 2000,
+    'history': 5000,
+    'api_history': 5000,
+    'analytics_page': 3000,
+    'api_analytics': 3000,
+    'api_sync': 5000,
+    'api_sync_push': 5000,
+    'agenda_page': 3000,
+    'api_agenda': 3000,
+    'settings': 2000,
+    'update_settings': 2000,
+    'reset_calendar_link': 2000,
+    'calendar_feed': 5000,
+}
+
+# Circuit breaker. Connection attempts give up after DB_CONNECT_TIMEOUT
+# seconds; after DB_BREAKER_FAILURES consecutive failures the circuit opens
+# and requests fail immediately for DB_BREAKER_RESET seconds, after which a
+# single trial connection decides whether it closes again.
+DB_CONNECT_TIMEOUT = int(os.environ.get('DB_CONNECT_TIMEOUT', 3))
+DB_BREAKER_FAILURES = int(os.environ.get('DB_BREAKER_FAILURES', 3))
+DB_BREAKER_RESET = float(os.environ.get('DB_BREAKER_RESET', 15))
+
+class DatabaseBusy(Exception):
+    """Raised when the connection budget is spent and the wait queue is full"""
+
+    def __init__(self, retry_after=1):
+        super().__init__('Database connection budget exhausted')
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """closed -> open after repeated failures -> half_open trial -> closed"""
+
+    def __init__(self, name):
+        self.name = name
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """True if a connection attempt may go ahead"""
+        with self.lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self.opened_at >= DB_BREAKER_RESET:
+                # Let exactly one request through to probe the database
+                self.state = 'half_open'
+                print(f"🟡 Circuit for {self.name} half-open, trying the database again")
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            if self.state != 'closed':
+                print(f"✅ Circuit for {self.name} closed, database is back")
+            self.state = 'closed'
+            self.failures = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= DB_BREAKER_FAILURES:
+                if self.state != 'open':
+                    print(f"⚡ Circuit for {self.name} open after {self.failures} failures")
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+                # Pooled connections to a database that went away are dead too
+                for conn in _idle.pop(self.name, []):
+                    conn.close()
+
+_breakers = {}
+
+def get_breaker(key):
+    if key not in _breakers:
+        _breakers.setdefault(key, CircuitBreaker(key))
+    return _breakers[key]
+
+def circuit_open(key='primary'):
+    """True while requests to `key` are being failed fast"""
+    return get_breaker(key).state != 'closed'
+
+_slots = threading.BoundedSemaphore(POOL_SIZE)
+_queue_lock = threading.Lock()
+_waiting = 0
+_idle = {}  # dsn key -> idle psycopg2 connections
+
+def acquire_slot():
+    """Take one unit of the connection budget, waiting in a bounded queue"""
+    global _waiting
+    if _slots.acquire(blocking=False):
+        return
+
+    with _queue_lock:
+        if _waiting >= DB_QUEUE_LIMIT:
+            raise DatabaseBusy(retry_after=max(1, round(DB_QUEUE_TIMEOUT)))
+        _waiting += 1
+    try:
+        acquired = _slots.acquire(timeout=DB_QUEUE_TIMEOUT)
+    finally:
+        with _queue_lock:
+            _waiting -= 1
+    if not acquired:
+        raise DatabaseBusy(retry_after=max(1, round(DB_QUEUE_TIMEOUT)))
+
+def release_slot():
+    _slots.release()
+
+def current_statement_timeout():
+    if not has_request_context():
+        return None
+    return STATEMENT_TIMEOUTS.get(request.endpoint, DB_STATEMENT_TIMEOUT)
+
+class PooledConnection:
+    """A psycopg2 connection on loan from the pool
+
+    Behaves like the underlying connection, except that close() hands it
+    back to the pool and frees its slot in the connection budget.
+    """
+
+    def __init__(self, raw, key):
+        object.__setattr__(self, '_raw', raw)
+        object.__setattr__(self, '_key', key)
+        object.__setattr__(self, '_released', False)
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._raw, name, value)
+
+    def close(self):
+        if self._released:
+            return
+        object.__setattr__(self, '_released', True)
+        raw = self._raw
+        try:
+            if not raw.closed:
+                raw.rollback()
+                raw.autocommit = False
+                _idle.setdefault(self._key, []).append(raw)
+        except Exception:
+            raw.close()
+        finally:
+            release_slot()
+
+    # A connection a route forgot to close still goes back to the pool
+    __del__ = close
+
+def apply_statement_timeout(conn, timeout):
+    """Set statement_timeout (ms) for the next use of conn; None means the server default"""
+    if DB_PGBOUNCER:
+        # Scoped to the transaction this SET LOCAL opens
+        if timeout is not None:
+            cur = conn.cursor()
+            cur.execute('SET LOCAL statement_timeout = %s', (timeout,))
+            cur.close()
+    elif getattr(conn, 'statement_timeout_ms', None) != timeout:
+        # Session-wide, so a pooled connection only pays for it when it changes
+        cur = conn.cursor()
+        if timeout is None:
+            cur.execute('RESET statement_timeout')
+        else:
+            cur.execute('SET statement_timeout = %s', (timeout,))
+        cur.close()
+        conn.commit()
+        conn.statement_timeout_ms = timeout
+
+def checkout(key, connect):
+    """Borrow an idle connection for `key`, or open one with connect()
+
+    Returns None if a new connection cannot be opened or the circuit for
+    `key` is open, and raises DatabaseBusy if the connection budget is spent.
+    """
+    # The slot comes first: once allow() has let a half-open probe through,
+    # every way out below must record how the probe went
+    acquire_slot()
+    breaker = get_breaker(key)
+    if not breaker.allow():
+        release_slot()
+        print(f"⚡ Circuit for {key} open, skipping database")
+        return None
+
+    timeout = current_statement_timeout()
+    raw = None
+    try:
+        idle = _idle.get(key, [])
+        while idle and raw is None:
+            candidate = idle.pop()
+            if candidate.closed:
+                continue
+            try:
+                apply_statement_timeout(candidate, timeout)
+                raw = candidate
+            except Exception as e:
+                # Most likely dropped by a server restart; a fresh connection
+                # decides whether the database is really down
+                print(f"⚠️ Discarding stale pooled connection: {e}")
+                candidate.close()
+        if raw is None:
+            raw = connect()
+            apply_statement_timeout(raw, timeout)
+    except Exception as e:
+        if raw is not None:
+            raw.close()
+        release_slot()
+        breaker.record_failure()
+        print(f"❌ Database connection error: {e}")
+        print(f"❌ Error type: {type(e).__name__}")
+        return None
+
+    breaker.record_success()
+    return PooledConnection(raw, key)
+
+def close_idle_connections():
+    """Close every pooled connection, e.g. in the gunicorn master before it forks"""
+    for key in list(_idle):
+        for conn in _idle.pop(key, []):
+            conn.close()
+
+class _Connection(psycopg2.extensions.connection):
+    """psycopg2 connection that can remember the statement_timeout it was given"""
+
+def connect_replica(db_url):
+    if db_url.startswith('postgres://'):
+        db_url = db_url.replace('postgres://', 'postgresql://', 1)
+    # Same TLS default as the primary unless the URL says otherwise
+    if 'sslmode=' in db_url:
+        conn = psycopg2.connect(db_url, connect_timeout=DB_CONNECT_TIMEOUT,
+                                connection_factory=_Connection)
+    else:
+        conn = psycopg2.connect(db_url, sslmode='require', connect_timeout=DB_CONNECT_TIMEOUT,
+                                connection_factory=_Connection)
+    conn.set_session(readonly=True)
+    print("✅ Connected to read replica")
+    return conn
+
+def get_replica_connection():
+    """Connect to a read replica, trying them in random order; None if all are down"""
+    for db_url in random.sample(REPLICA_URLS, len(REPLICA_URLS)):
+        conn = checkout(db_url, lambda: connect_replica(db_url))
+        if conn:
+            return conn
+    return None
+
+def connect_primary():
+    """Open a new connection to the primary database"""
+    # Try DATABASE_URL first (for deployment platforms like Vercel, Heroku)
+    db_url = os.environ.get('DATABASE_URL')
+
+    if db_url:
+        print(f"🔵 Using DATABASE_URL")
+        # Fix postgres:// to postgresql:// (required for psycopg2)
+        if db_url.startswith('postgres://'):
+            db_url = db_url.replace('postgres://', 'postgresql://', 1)
+
+        print(f"🔵 Connecting to database...")
+        conn = psycopg2.connect(db_url, sslmode='require', connect_timeout=DB_CONNECT_TIMEOUT,
+                                connection_factory=_Connection)
+        print("✅ Database connected successfully via DATABASE_URL")
+        return conn
+    else:
+        # Fallback to individual parameters (for local development)
+        print("🔵 Using individual DB parameters")
+        conn = psycopg2.connect(
+            dbname=os.environ.get('DB_NAME', 'todo_db'),
+            user=os.environ.get('DB_USER', 'todo_user'),
+            password=os.environ.get('DB_PASSWORD', 'thinkpad'),
+            host=os.environ.get('DB_HOST', 'localhost'),
+            port=os.environ.get('DB_PORT', '5432'),
+            connect_timeout=DB_CONNECT_TIMEOUT,
+            connection_factory=_Connection
+        )
+        print("✅ Database connected successfully via parameters")
+        return conn
+
+def get_db_connection(readonly=False):
+    """Establish database connection with comprehensive error handling
+
+    Connections come from a per-process pool capped by the connection
+    budget; close() returns them to it. Returns None if the database cannot
+    be reached and raises DatabaseBusy if the budget is spent.
+
+    readonly=True allows the connection to come from a read replica when
+    DATABASE_REPLICA_URLS is set. Replicas lag the primary slightly, so only
+    pass it for reads that may be a moment stale.
+    """
+    if readonly and REPLICA_URLS:
+        conn = get_replica_connection()
+        if conn:
+            return conn
+        print("⚠️ No read replica available, falling back to the primary")
+
+    return checkout('primary', connect_primary)
@@ -0,0 +1,92 @@
+# fragments.py - Rendered todo cards, cached between dashboard renders
+#
+# Most cards on a dashboard are unchanged since the last time it was shown,
+# yet every render ran _todo_card.html again for each of them. Cards are
+# cached here as rendered HTML, keyed by everything the markup depends on:
+# the todo's id and updated_at, plus what changes without touching
+# updated_at (its category's name and color, the subtask counters the
+# trigger keeps, its manual-order key) and how it is shown (the viewer's
+# role, the dashboard order, read-only mode). A changed todo simply gets a
+# new key; its old entry ages out of the LRU.
+#
+# The cache is per process and bounded by FRAGMENT_CACHE_BYTES of HTML
+# (0 turns it off). Hit rates are in stats(), served at /api/fragment-cache.
+import os
+import threading
+from collections import OrderedDict
+
+from flask import current_app
+from markupsafe import Markup
+
+FRAGMENT_CACHE_BYTES = int(os.environ.get('FRAGMENT_CACHE_BYTES', 8 * 1024 * 1024))
+
+class FragmentCache:
+    """An LRU of rendered fragments bounded by their total size"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = self.misses = self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            html = self.entries.get(key)
+            if html is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return html
+
+    def put(self, key, html):
+        # Sized in characters; cards are mostly ASCII
+        if len(html) > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self.entries[key] = html
+            self.size += len(html)
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+            }
+
+cards = FragmentCache(FRAGMENT_CACHE_BYTES)
+
+def card_key(todo, order, degraded):
+    return (todo.id, todo.updated_at, todo.category, todo.category_color, todo.subtask_total,
+            todo.subtask_done, todo.position, todo.role, order, degraded)
+
+def render_card(todo, order='priority', degraded=False):
+    """_todo_card.html for a models.Todo, from the cache when nothing it shows has changed"""
+    # The dashboard's fallback render passes neither
+    order, degraded = order or 'priority', bool(degraded)
+    if not cards.max_bytes:
+        return Markup(render(todo, order, degraded))
+    key = card_key(todo, order, degraded)
+    html = cards.get(key)
+    if html is None:
+        html = render(todo, order, degraded)
+        cards.put(key, html)
+    return Markup(html)
+
+def render(todo, order, degraded):
+    template = current_app.jinja_env.get_template('_todo_card.html')
+    return template.render(todo=todo, order=order, degraded=degraded)
@@ -0,0 +1,174 @@
+# group_commit.py - Batch status updates from concurrent requests into one transaction
+#
+# With GROUP_COMMIT=1, update_todo_status hands its UPDATE to a background
+# thread instead of committing it itself. The thread waits at most
+# GROUP_COMMIT_WINDOW_MS after the first update for others to arrive, applies
+# them all with one UPDATE ... FROM (VALUES ...) and one commit, and tells each
+# request how its own row fared. A batch that fails is retried row by row, so
+# one bad update only fails its own request.
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+
+from psycopg2.extras import execute_values
+
+import db
+import queries
+import realtime
+from schema import STATUSES
+
+GROUP_COMMIT = os.environ.get('GROUP_COMMIT', '').lower() in ('1', 'true', 'yes')
+# Longest an update waits for company before its batch is sent
+GROUP_COMMIT_WINDOW_MS = float(os.environ.get('GROUP_COMMIT_WINDOW_MS', 5))
+GROUP_COMMIT_MAX_BATCH = int(os.environ.get('GROUP_COMMIT_MAX_BATCH', 200))
+# A request gives up on its update after this long
+GROUP_COMMIT_TIMEOUT = float(os.environ.get('GROUP_COMMIT_TIMEOUT', 10))
+
+BATCH_UPDATE_STATUS = '''
+    UPDATE todo_items t
+    SET status = v.status::todo_status,
+        completed_at = CASE WHEN v.status::todo_status = 'completed'
+                            THEN COALESCE(t.completed_at, CURRENT_TIMESTAMP) END,
+        updated_at = CURRENT_TIMESTAMP
+    FROM (VALUES %s) AS v(todo_id, user_id, status)
+    WHERE t.id = v.todo_id
+      AND (t.user_id = v.user_id
+           OR t.category_id IN (SELECT id FROM todo_categories WHERE user_id = v.user_id)
+           OR t.category_id IN (SELECT category_id FROM todo_category_members
+                                WHERE user_id = v.user_id AND role <> 'viewer'))
+    RETURNING t.id, v.user_id, t.status, t.parent_id, t.category_id
+'''
+
+# The (todo, requester) pairs in a batch where the requester may edit the todo
+BATCH_EDITABLE = '''
+    SELECT v.todo_id, v.user_id
+    FROM (VALUES %s) AS v(todo_id, user_id)
+    JOIN todo_items t ON t.id = v.todo_id
+    WHERE t.user_id = v.user_id
+       OR t.category_id IN (SELECT id FROM todo_categories WHERE user_id = v.user_id)
+       OR t.category_id IN (SELECT category_id FROM todo_category_members
+                            WHERE user_id = v.user_id AND role <> 'viewer')
+'''
+
+def set_timeout(cur):
+    """The statement_timeout the request would have had on its own"""
+    cur.execute('SET LOCAL statement_timeout = %s', (db.STATEMENT_TIMEOUTS['update_todo_status'],))
+
+class DatabaseUnavailable(Exception):
+    """No connection could be opened for the batch"""
+
+class GroupCommitter:
+    def __init__(self):
+        self.pending = queue.Queue()
+        self.lock = threading.Lock()
+        self.worker_pid = None
+
+    def update_status(self, user_id, todo_id, status):
+        """Queue one status update and wait for its batch; returns the rows updated (0 or 1)"""
+        if status not in STATUSES:
+            raise ValueError(f"invalid status {status!r}")
+        self.ensure_worker()
+        future = Future()
+        self.pending.put((todo_id, user_id, status, future))
+        try:
+            return future.result(timeout=GROUP_COMMIT_TIMEOUT)
+        except TimeoutError:
+            raise DatabaseUnavailable('status update timed out waiting for its batch')
+
+    def ensure_worker(self):
+        # Checked against the pid so a forked worker starts its own thread
+        with self.lock:
+            if self.worker_pid == os.getpid():
+                return
+            self.worker_pid = os.getpid()
+        threading.Thread(target=self.run, name='group-commit', daemon=True).start()
+
+    def run(self):
+        while True:
+            batch = [self.pending.get()]
+            deadline = time.monotonic() + GROUP_COMMIT_WINDOW_MS / 1000
+            while len(batch) < GROUP_COMMIT_MAX_BATCH:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self.flush(batch)
+            except Exception as e:
+                for *_, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def flush(self, batch):
+        conn = db.get_db_connection()
+        if not conn:
+            raise DatabaseUnavailable('no database connection')
+
+        try:
+            cur = conn.cursor()
+            try:
+                updated = self.apply_batch(cur, batch)
+                conn.commit()
+            except Exception as e:
+                print(f"⚠️ Group commit of {len(batch)} updates failed, retrying one by one: {e}")
+                conn.rollback()
+                self.apply_one_by_one(conn, cur, batch)
+            else:
+                # Results are handed out only once the commit has succeeded
+                for todo_id, user_id, _, future in batch:
+                    future.set_result(1 if (todo_id, user_id) in updated else 0)
+            cur.close()
+        finally:
+            conn.close()
+
+    def apply_batch(self, cur, batch):
+        """Run the batched UPDATE; returns the (todo id, user id) requests it applied"""
+        set_timeout(cur)
+        # Permissions are checked per request before updates are merged, so
+        # someone who may not edit a todo can neither displace nor take credit
+        # for its owner's update
+        requests = {(todo_id, user_id) for todo_id, user_id, _, _ in batch}
+        editable = {tuple(row) for row in execute_values(cur, BATCH_EDITABLE, list(requests),
+                                                         page_size=len(requests), fetch=True)}
+        # If one row is toggled twice in a batch, by its owner or by people it
+        # is shared with, the later click wins and each of them sees it applied
+        latest = {}
+        for todo_id, user_id, status, _ in batch:
+            if (todo_id, user_id) in editable:
+                latest[todo_id] = (user_id, status)
+        if not latest:
+            return set()
+        rows = execute_values(cur, BATCH_UPDATE_STATUS,
+                              [(todo_id, user_id, status) for todo_id, (user_id, status) in latest.items()],
+                              page_size=len(latest), fetch=True)
+        for todo_id, user_id, status, parent_id, category_id in rows:
+            realtime.publish_shared(cur, user_id, category_id, 'todo_updated', id=todo_id, status=status)
+            realtime.publish_parent(cur, user_id, parent_id)
+        updated = {row[0] for row in rows}
+        return {request for request in editable if request[0] in updated}
+
+    def apply_one_by_one(self, conn, cur, batch):
+        for todo_id, user_id, status, future in batch:
+            try:
+                set_timeout(cur)
+                cur.execute(queries.UPDATE_TODO_STATUS, {
+                    'status': status, 'todo_id': todo_id, 'user_id': user_id
+                })
+                row = cur.fetchone()
+                updated = cur.rowcount
+                if row:
+                    parent_id, category_id = row
+                    realtime.publish_shared(cur, user_id, category_id, 'todo_updated', id=todo_id, status=status)
+                    realtime.publish_parent(cur, user_id, parent_id)
+                conn.commit()
+                future.set_result(updated)
+            except Exception as e:
+                conn.rollback()
+                future.set_exception(e)
+
+committer = GroupCommitter()
@@ -0,0 +1,95 @@
+# gunicorn.conf.py - Production server settings
+#
+# Used by the Procfile and render.yaml (`gunicorn -c gunicorn.conf.py app:app`);
+# a bare `gunicorn app:app` also picks it up from the working directory. Pick
+# the worker model with GUNICORN_WORKER_CLASS:
+#
+#   sync     one request per process; simplest, but a slow request holds a process
+#   gthread  a few threads per process (default); psycopg2 and the password hash
+#            release the GIL, so threads overlap the waits
+#   gevent   many greenlets per process; needs `pip install gevent psycogreen`
+#
+# Every open dashboard with live updates (see realtime.py) holds a stream for
+# up to REALTIME_STREAM_SECONDS, which takes a whole sync worker or gthread
+# thread, so a few dozen open tabs would starve everything else. Live updates
+# are therefore on by default only with gevent, and REALTIME=1 with another
+# worker class is refused.
+#
+# GUNICORN_WORKERS, GUNICORN_THREADS and GUNICORN_WORKER_CONNECTIONS override
+# the sizes derived from the CPU count below.
+import os
+
+def available_cores():
+    try:
+        # Respects container CPU pinning, unlike cpu_count()
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+cores = available_cores()
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+
+if worker_class == 'sync':
+    default_workers = cores * 2 + 1
+elif worker_class == 'gthread':
+    default_workers = cores + 1
+    threads = int(os.environ.get('GUNICORN_THREADS', 4))
+elif worker_class == 'gevent':
+    default_workers = cores
+    worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 100))
+else:
+    raise ValueError(f"GUNICORN_WORKER_CLASS must be sync, gthread or gevent, not {worker_class!r}")
+
+realtime = os.environ.setdefault('REALTIME', '1' if worker_class == 'gevent' else '0').lower() in ('1', 'true', 'yes')
+if realtime and worker_class != 'gevent':
+    raise ValueError(f"REALTIME=1 needs GUNICORN_WORKER_CLASS=gevent; each live-update stream "
+                     f"would hold a {worker_class} worker's thread")
+
+workers = int(os.environ.get('GUNICORN_WORKERS', os.environ.get('WEB_CONCURRENCY', default_workers)))
+# db.py splits DB_MAX_CONNECTIONS between this many processes
+os.environ['WEB_CONCURRENCY'] = str(workers)
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 20
+keepalive = 5
+# Recycle workers now and then; jitter keeps them from restarting together
+max_requests = 1000
+max_requests_jitter = 100
+
+accesslog = '-'
+errorlog = '-'
+
+# Import the app once in the master so workers fork with it already loaded.
+# app.py runs init_db() at import time, which therefore happens once rather
+# than once per worker. gevent patches the standard library when a worker
+# starts, and locks created by an earlier import would not be patched, so the
+# app is imported in each worker instead.
+preload_app = worker_class != 'gevent'
+
+def on_starting(server):
+    print(f"🚀 gunicorn: {workers} {worker_class} workers"
+          + (f" x {threads} threads" if worker_class == 'gthread' else '')
+          + f" on {cores} cores, live updates {'on' if realtime else 'off'}")
+    # db.py takes each worker's LISTEN connection out of its share of the budget
+    budget = int(os.environ.get('DB_MAX_CONNECTIONS', 10))
+    if realtime and budget < workers * 2:
+        print(f"⚠️ DB_MAX_CONNECTIONS={budget} is too small for {workers} workers with live updates: "
+              f"each holds a pooled and a LISTEN connection, {workers * 2} in all")
+
+def pre_fork(server, worker):
+    # Connections opened by init_db() in the master must not be shared with
+    # the children: two processes on one socket corrupt the protocol stream
+    if preload_app:
+        import db
+        db.close_idle_connections()
+
+def post_fork(server, worker):
+    if worker_class == 'gevent':
+        # psycopg2 blocks in C; this makes it yield to other greenlets instead
+        try:
+            from psycogreen.gevent import patch_psycopg
+        except ImportError:
+            raise RuntimeError("GUNICORN_WORKER_CLASS=gevent needs: pip install gevent psycogreen")
+        patch_psycopg()
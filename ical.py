@@ -0,0 +1,97 @@
+# ical.py - Due dates as an iCalendar feed (RFC 5545)
+#
+# A user can create a secret feed URL on the settings page and subscribe to
+# it from a calendar app; every open todo with a due date is an all-day
+# event. Calendar apps poll their feeds often and most polls find nothing
+# new. The ETag is the user's change_seq, which the schema.py triggers bump
+# on every change to their todos and categories, so an unchanged poll is
+# answered with 304 after one todo_users lookup, without reading todo_items.
+# There is no Last-Modified: a timestamp in whole seconds can miss a change
+# that a sequence number cannot.
+# A changed feed is streamed from a server-side cursor FETCH_SIZE events at
+# a time instead of being built in memory.
+import secrets
+from datetime import timedelta
+
+import models
+
+PRODID = '-//Todo List Manager//Due dates//EN'
+# iCalendar priorities run from 1 (highest) to 9 (lowest)
+PRIORITY = {'high': 1, 'medium': 5, 'low': 9}
+FETCH_SIZE = 500
+# Octets per line before folding
+LINE_LENGTH = 75
+
+def new_token():
+    """A fresh feed secret; replacing it cuts off every existing subscription"""
+    return secrets.token_urlsafe(24)
+
+def etag(user):
+    """The feed's version, from a FEED_USER row"""
+    return f'{user.id}-{user.change_seq}'
+
+def escape(text):
+    return (text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n').replace('\r', '\\n'))
+
+def fold(line):
+    """line as one or more CRLF-terminated lines of at most LINE_LENGTH octets"""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= LINE_LENGTH:
+        return line + '\r\n'
+    parts = []
+    start, limit = 0, LINE_LENGTH
+    while start < len(encoded):
+        end = min(start + limit, len(encoded))
+        # Never split a UTF-8 sequence: back up to the start of a character
+        while end < len(encoded) and encoded[end] & 0xC0 == 0x80:
+            end -= 1
+        parts.append(encoded[start:end].decode('utf-8'))
+        # Continuation lines start with a space, which counts towards the limit
+        start, limit = end, LINE_LENGTH - 1
+    return '\r\n '.join(parts) + '\r\n'
+
+def timestamp(value):
+    """A TIMESTAMP column, which holds UTC, in iCalendar's UTC form"""
+    return value.strftime('%Y%m%dT%H%M%SZ')
+
+def event(todo, host):
+    """One FeedTodo as a VEVENT"""
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:todo-{todo.id}@{host}',
+        f'DTSTAMP:{timestamp(todo.updated_at)}',
+        f'LAST-MODIFIED:{timestamp(todo.updated_at)}',
+        f"DTSTART;VALUE=DATE:{todo.due_date.strftime('%Y%m%d')}",
+        f"DTEND;VALUE=DATE:{(todo.due_date + timedelta(days=1)).strftime('%Y%m%d')}",
+        f'SUMMARY:{escape(todo.title)}',
+        f'PRIORITY:{PRIORITY[todo.priority]}',
+        'TRANSP:TRANSPARENT',
+    ]
+    if todo.category:
+        lines.append(f'CATEGORIES:{escape(todo.category)}')
+    if todo.description:
+        lines.append(f'DESCRIPTION:{escape(todo.description)}')
+    lines.append('END:VEVENT')
+    return ''.join(map(fold, lines))
+
+def stream(conn, cur, host):
+    """The feed's text in chunks, from cur (a named cursor that ran FEED_TODOS)
+
+    Closes cur and hands conn back when done, or when the client goes away.
+    """
+    try:
+        yield ''.join(map(fold, ['BEGIN:VCALENDAR', 'VERSION:2.0', f'PRODID:{PRODID}',
+                                 'CALSCALE:GREGORIAN', 'X-WR-CALNAME:Todo due dates']))
+        while True:
+            rows = cur.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            yield ''.join(event(models.FeedTodo._make(row), host) for row in rows)
+        yield fold('END:VCALENDAR')
+    except Exception as e:
+        # Headers are already out; all that is left is to cut the feed short
+        print(f"❌ Calendar feed error: {e}")
+    finally:
+        cur.close()
+        conn.close()
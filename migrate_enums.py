@@ -0,0 +1,221 @@
+# migrate_enums.py - Convert todo_items.status/priority from VARCHAR to enums online
+#
+# ALTER COLUMN ... TYPE would rewrite todo_items under an exclusive lock, so
+# this works through shadow columns instead:
+#
+#   1. create the todo_status/todo_priority types
+#   2. add nullable status_v2/priority_v2 columns and a trigger that keeps
+#      them in step with every INSERT and UPDATE
+#   3. backfill existing rows in small committed batches; the change_seq
+#      trigger ignores the shadow columns, so sync clients and calendar
+#      feeds do not see this as a change to every todo
+#   4. validate a NOT NULL check and build the new indexes concurrently
+#   5. swap the columns in one short transaction
+#   6. rebuild, concurrently, any other index the dropped columns took along
+#
+# Safe to re-run; it exits immediately once the table has been converted.
+#
+#   python migrate_enums.py [--batch-size 1000] [--pause 0.05]
+import argparse
+import sys
+import time
+
+from db import get_db_connection
+from migrate_indexes import build_indexes
+from schema import TYPES, TRIGGERS, needs_enum_migration
+
+SHADOW_COLUMNS = [
+    'ALTER TABLE todo_items ADD COLUMN IF NOT EXISTS status_v2 todo_status',
+    'ALTER TABLE todo_items ADD COLUMN IF NOT EXISTS priority_v2 todo_priority',
+]
+
+SYNC_TRIGGER = [
+    '''
+    CREATE OR REPLACE FUNCTION todo_items_enum_sync() RETURNS trigger AS $$
+    BEGIN
+        NEW.status_v2 := COALESCE(NEW.status, 'pending')::todo_status;
+        NEW.priority_v2 := COALESCE(NEW.priority, 'medium')::todo_priority;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    ''',
+    'DROP TRIGGER IF EXISTS todo_items_enum_sync ON todo_items',
+    '''
+    CREATE TRIGGER todo_items_enum_sync
+    BEFORE INSERT OR UPDATE ON todo_items
+    FOR EACH ROW EXECUTE FUNCTION todo_items_enum_sync()
+    ''',
+]
+
+BACKFILL_BATCH = '''
+    UPDATE todo_items
+    SET status_v2 = COALESCE(status, 'pending')::todo_status,
+        priority_v2 = COALESCE(priority, 'medium')::todo_priority
+    WHERE id IN (
+        SELECT id FROM todo_items
+        WHERE id > %s AND status_v2 IS NULL
+        ORDER BY id
+        LIMIT %s
+    )
+    RETURNING id
+'''
+
+# Built before the swap under temporary names; renamed in place afterwards
+SHADOW_INDEXES = [
+    ('idx_todos_user_top_order_v2', 'idx_todos_user_top_order',
+     'ON todo_items (user_id, status_v2, priority_v2, created_at DESC) WHERE parent_id IS NULL'),
+    ('idx_todos_user_open_due_v2', 'idx_todos_user_open_due',
+     "ON todo_items (user_id, due_date) WHERE status_v2 <> 'completed'"),
+]
+
+SWAP = [
+    "SET LOCAL lock_timeout = '5s'",
+    'LOCK TABLE todo_items IN ACCESS EXCLUSIVE MODE',
+    'DROP TRIGGER todo_items_enum_sync ON todo_items',
+    'DROP FUNCTION todo_items_enum_sync()',
+    # Triggers that fire on UPDATE OF status block the DROP COLUMN; they are
+    # created again, on the new column, below
+    'DROP TRIGGER IF EXISTS todo_items_subtask_counts ON todo_items',
+    # Drops the old CHECK constraints and every index that used the VARCHARs
+    'ALTER TABLE todo_items DROP COLUMN status, DROP COLUMN priority',
+    'ALTER TABLE todo_items RENAME COLUMN status_v2 TO status',
+    'ALTER TABLE todo_items RENAME COLUMN priority_v2 TO priority',
+    # The validated CHECK constraints let SET NOT NULL skip the table scan
+    '''
+    ALTER TABLE todo_items
+        ALTER COLUMN status SET DEFAULT 'pending',
+        ALTER COLUMN status SET NOT NULL,
+        ALTER COLUMN priority SET DEFAULT 'medium',
+        ALTER COLUMN priority SET NOT NULL
+    ''',
+    '''
+    ALTER TABLE todo_items
+        DROP CONSTRAINT todo_items_status_v2_not_null,
+        DROP CONSTRAINT todo_items_priority_v2_not_null
+    ''',
+]
+
+def run_all(conn, statements):
+    cur = conn.cursor()
+    for statement in statements:
+        cur.execute(statement)
+    conn.commit()
+    cur.close()
+
+def backfill(conn, batch_size, pause):
+    """Copy existing rows into the shadow columns, one short transaction per batch"""
+    cur = conn.cursor()
+    last_id = 0
+    total = 0
+    while True:
+        cur.execute(BACKFILL_BATCH, (last_id, batch_size))
+        ids = [row[0] for row in cur.fetchall()]
+        conn.commit()
+        if not ids:
+            break
+        last_id = max(ids)
+        total += len(ids)
+        print(f"🔵 Backfilled {total} rows (up to id {last_id})")
+        time.sleep(pause)
+    cur.close()
+    return total
+
+def add_not_null_checks(conn):
+    """Add NOT VALID checks, then validate them without blocking writes"""
+    cur = conn.cursor()
+    for column in ('status_v2', 'priority_v2'):
+        name = f'todo_items_{column}_not_null'
+        cur.execute('SELECT 1 FROM pg_constraint WHERE conname = %s', (name,))
+        if not cur.fetchone():
+            cur.execute(f'ALTER TABLE todo_items ADD CONSTRAINT {name} CHECK ({column} IS NOT NULL) NOT VALID')
+            conn.commit()
+        cur.execute(f'ALTER TABLE todo_items VALIDATE CONSTRAINT {name}')
+        conn.commit()
+    cur.close()
+
+def build_shadow_indexes(conn):
+    """CREATE INDEX CONCURRENTLY cannot run inside a transaction block"""
+    conn.autocommit = True
+    cur = conn.cursor()
+    for name, _, definition in SHADOW_INDEXES:
+        # A failed concurrent build leaves an INVALID index behind; start over
+        cur.execute(
+            'SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)',
+            (name,)
+        )
+        row = cur.fetchone()
+        if row and not row[0]:
+            cur.execute(f'DROP INDEX CONCURRENTLY {name}')
+        print(f"🔵 Building {name}...")
+        cur.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} {definition}')
+    cur.close()
+    conn.autocommit = False
+
+def swap(conn):
+    cur = conn.cursor()
+    try:
+        for statement in SWAP:
+            cur.execute(statement)
+        for temporary, final, _ in SHADOW_INDEXES:
+            cur.execute(f'ALTER INDEX {temporary} RENAME TO {final}')
+        for statement in TRIGGERS:
+            cur.execute(statement)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+def migrate(batch_size=1000, pause=0.05):
+    conn = get_db_connection()
+    if not conn:
+        print("❌ Cannot migrate - no connection")
+        return False
+
+    try:
+        cur = conn.cursor()
+        pending = needs_enum_migration(cur)
+        cur.close()
+        conn.commit()
+        if not pending:
+            print("✅ todo_items already uses enums - nothing to do")
+            return True
+
+        print("🔵 Creating enum types and shadow columns...")
+        run_all(conn, TYPES + SHADOW_COLUMNS + SYNC_TRIGGER)
+
+        print("🔵 Backfilling existing rows...")
+        backfill(conn, batch_size, pause)
+
+        print("🔵 Validating NOT NULL checks...")
+        add_not_null_checks(conn)
+
+        build_shadow_indexes(conn)
+
+        print("🔵 Swapping columns...")
+        swap(conn)
+
+        # Any other index that referenced the old columns went with them
+        print("🔵 Restoring remaining indexes...")
+        build_indexes(conn)
+
+        print("✅ status and priority converted to enums")
+        return True
+
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+        conn.rollback()
+        return False
+
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert status/priority columns to enums without long locks')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--pause', type=float, default=0.05, help='seconds to sleep between batches')
+    args = parser.parse_args()
+
+    if not migrate(args.batch_size, args.pause):
+        sys.exit(1)
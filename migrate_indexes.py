@@ -0,0 +1,75 @@
+# migrate_indexes.py - Apply schema.INDEXES to an existing database online
+#
+# init_db() builds the indexes only when it creates the tables: a plain
+# CREATE INDEX on a populated todo_items blocks every write until the build
+# is done. This script makes whatever index changes are pending with
+# CREATE/DROP INDEX CONCURRENTLY instead, which lets writes carry on:
+#
+#   1. create any missing tables and columns the indexes refer to
+#   2. drop what a failed concurrent build left behind as INVALID
+#   3. build the missing indexes and drop the retired ones, one at a time
+#
+# Safe to re-run; it exits immediately once nothing is pending. Run it after
+# deploying a release that changes INDEXES (see Procfile).
+#
+#   python migrate_indexes.py
+import re
+import sys
+
+from db import get_db_connection
+from schema import create_schema, index_name, pending_indexes
+
+CONCURRENTLY = re.compile(r'^(\s*(?:CREATE (?:UNIQUE )?|DROP )INDEX) ')
+
+def concurrently(statement):
+    return CONCURRENTLY.sub(r'\1 CONCURRENTLY ', statement, count=1)
+
+def build_indexes(conn):
+    """Apply the pending INDEXES statements; CONCURRENTLY cannot run inside a transaction block"""
+    cur = conn.cursor()
+    pending = pending_indexes(cur)
+    conn.commit()
+
+    conn.autocommit = True
+    try:
+        for statement in pending:
+            name = index_name(statement)
+            if statement.lstrip().startswith('DROP'):
+                print(f"🔵 Dropping {name}...")
+            else:
+                # A failed concurrent build leaves an INVALID index behind; start over
+                cur.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+                print(f"🔵 Building {name}...")
+            cur.execute(concurrently(statement))
+    finally:
+        conn.autocommit = False
+        cur.close()
+    return len(pending)
+
+def migrate():
+    conn = get_db_connection()
+    if not conn:
+        print("❌ Cannot migrate - no connection")
+        return False
+
+    try:
+        cur = conn.cursor()
+        create_schema(cur, indexes=False)
+        conn.commit()
+        cur.close()
+
+        applied = build_indexes(conn)
+        print(f"✅ Indexes up to date ({applied} changes applied)")
+        return True
+
+    except Exception as e:
+        print(f"❌ Index migration failed: {e}")
+        conn.rollback()
+        return False
+
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    if not migrate():
+        sys.exit(1)
@@ -0,0 +1,106 @@
+# models.py - Row types for query results
+#
+# Each type names the columns of one query in queries.py, in SELECT order, so
+# routes and templates say todo.status instead of todo[4]. They are
+# namedtuples: a row costs what the plain tuple from psycopg2 costs, with no
+# per-row __dict__ as a dict row or a regular class would have (see
+# bench_rows.py). Add a field here whenever a column is added to its query.
+from collections import namedtuple
+
+import queries
+
+def fetch_one(cur, row_type):
+    """The cursor's next row as row_type, or None"""
+    row = cur.fetchone()
+    return row_type._make(row) if row is not None else None
+
+def fetch_all(cur, row_type):
+    """The cursor's remaining rows as row_type"""
+    return list(map(row_type._make, cur))
+
+# Login lookup
+User = namedtuple('User', 'id username password timezone')
+
+# queries.USER_SETTINGS
+UserSettings = namedtuple('UserSettings', 'username email timezone ical_token')
+
+# queries.CATEGORIES_FOR_USER; owner is None for the user's own categories
+Category = namedtuple('Category', 'id name color role shared owner')
+
+# queries.CATEGORY_MEMBERS
+CategoryMember = namedtuple('CategoryMember', 'id username role added_at')
+
+# queries.USER_TAGS
+TagCount = namedtuple('TagCount', 'tag count')
+
+# queries.DASHBOARD_STATS; SUM() over no rows is NULL, hence from_row
+class DashboardStats(namedtuple('DashboardStats', 'total completed pending in_progress')):
+    __slots__ = ()
+
+    @classmethod
+    def from_row(cls, row):
+        return cls._make(value or 0 for value in row)
+
+    def counted(self, todos):
+        """These stats with todos fetched separately (shared ones) counted in"""
+        statuses = [todo.status for todo in todos]
+        return DashboardStats(self.total + len(statuses), self.completed + statuses.count('completed'),
+                              self.pending + statuses.count('pending'),
+                              self.in_progress + statuses.count('in_progress'))
+
+DashboardStats.EMPTY = DashboardStats(0, 0, 0, 0)
+
+class DescriptionPreview:
+    """For rows whose description is the DESCRIPTION_PREVIEW slice of the column"""
+    __slots__ = ()
+
+    @property
+    def description_truncated(self):
+        return bool(self.description) and len(self.description) > queries.DESCRIPTION_PREVIEW_LENGTH
+
+    @property
+    def description_preview(self):
+        if self.description_truncated:
+            return self.description[:queries.DESCRIPTION_PREVIEW_LENGTH]
+        return self.description
+
+TODO_FIELDS = ('id title description priority status category category_color due_date created_at '
+               'subtask_total subtask_done tags')
+
+# queries.DASHBOARD_TODOS / SHARED_TODOS / DASHBOARD_TODO: DASHBOARD_TODO_COLUMNS
+# (with the manual-order key and the update time fragments.py keys cards by)
+# and the user's role (sharing.ROLES) for this todo
+class Todo(DescriptionPreview, namedtuple('Todo', TODO_FIELDS + ' position updated_at role')):
+    __slots__ = ()
+
+# queries.TODO_TREE: a Todo plus where it sits in the tree, and the user's
+# role for it (None for a subtask someone else filed outside any shared category)
+class TreeTodo(DescriptionPreview, namedtuple('TreeTodo', TODO_FIELDS + ' parent_id depth role')):
+    __slots__ = ()
+
+# queries.AGENDA_TODOS
+AgendaTodo = namedtuple('AgendaTodo', 'id title priority status category category_color due_date parent_id')
+
+# queries.FEED_USER / FEED_TODOS
+FeedUser = namedtuple('FeedUser', 'id change_seq')
+FeedTodo = namedtuple('FeedTodo', 'id title description priority due_date category updated_at')
+
+# queries.HISTORY_PAGE
+ArchivedTodo = namedtuple('ArchivedTodo', 'id title description priority status category category_color '
+                                          'due_date created_at completed_at')
+
+# queries.SYNC_TODO_COLUMNS
+SyncTodo = namedtuple('SyncTodo', 'id title description priority status category_id due_date created_at '
+                                  'updated_at completed_at change_seq parent_id subtask_total subtask_done tags')
+
+# queries.SYNC_CATEGORIES / SYNC_TOMBSTONES
+SyncCategory = namedtuple('SyncCategory', 'id name color change_seq')
+Tombstone = namedtuple('Tombstone', 'todo_id change_seq')
+
+# queries.SERIES_IN_WINDOW / SERIES_RULE
+Series = namedtuple('Series', 'id title description priority category category_color category_id tags '
+                              'frequency every starts_on ends_on')
+SeriesRule = namedtuple('SeriesRule', 'frequency every starts_on ends_on')
+
+# reminders.CLAIM_REMINDERS; stale ones are too far overdue to be worth sending
+Reminder = namedtuple('Reminder', 'id user_id username email title due_date priority stale')
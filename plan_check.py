@@ -0,0 +1,323 @@
+# plan_check.py - Check that the hot queries are served by indexes
+#
+# Builds the schema in a throwaway Postgres schema, fills it with synthetic
+# data, runs EXPLAIN on the dashboard, sharing, manual order, stats, tag
+# filter, subtask tree, recurrence, delete, sync, analytics, agenda, calendar
+# feed and reminder queries and fails if any of them falls back to a
+# sequential scan, if no index can return the dashboard list in display
+# order, or if a reminder claim reads past the todos it claims. Everything
+# happens inside one transaction that is rolled back, so it is safe to point
+# at a live database.
+#
+#   python plan_check.py                  # 500 users x 200 todos
+#   python plan_check.py --users 2000 --todos-per-user 500
+import argparse
+import json
+import sys
+from datetime import date, timedelta
+
+from db import get_db_connection
+from schema import create_schema
+import queries
+import reminders
+
+SCRATCH_SCHEMA = 'plan_check'
+
+def seed(cur, users, todos_per_user, categories_per_user):
+    """Fill the scratch tables with a realistic spread of data"""
+    # Numbering change_seq row by row through the triggers is slow; it is
+    # done in one pass at the end instead
+    cur.execute('ALTER TABLE todo_items DISABLE TRIGGER USER')
+    cur.execute('ALTER TABLE todo_categories DISABLE TRIGGER USER')
+    cur.execute(
+        '''INSERT INTO todo_users (username, password, ical_token)
+           SELECT 'user' || n, 'x', CASE WHEN n %% 4 = 0 THEN md5(n::text) END
+           FROM generate_series(1, %s) n''',
+        (users,)
+    )
+    cur.execute(
+        '''INSERT INTO todo_categories (user_id, name)
+           SELECT u.id, 'category' || n
+           FROM todo_users u, generate_series(1, %s) n''',
+        (categories_per_user,)
+    )
+    # Everyone shares their first category with the next user as an editor
+    # and the one after as a viewer
+    cur.execute(
+        '''INSERT INTO todo_category_members (category_id, user_id, role)
+           SELECT c.id, u.id, CASE u.id - c.user_id WHEN 1 THEN 'editor' ELSE 'viewer' END
+           FROM todo_categories c JOIN todo_users u ON u.id IN (c.user_id + 1, c.user_id + 2)
+           WHERE c.name = 'category1' '''
+    )
+    # Most todos end up completed, as they do in real accounts
+    cur.execute(
+        '''INSERT INTO todo_items (user_id, category_id, title, description, priority, status, due_date, created_at)
+           SELECT u.id,
+                  CASE WHEN random() < 0.7 THEN
+                      (SELECT c.id FROM todo_categories c WHERE c.user_id = u.id
+                       ORDER BY c.id LIMIT 1 OFFSET (n %% %s))
+                  END,
+                  'todo ' || n,
+                  repeat('x', (random() * 200)::int),
+                  ((ARRAY['low', 'medium', 'high'])[1 + (random() * 2)::int])::todo_priority,
+                  (CASE WHEN random() < 0.75 THEN 'completed'
+                        WHEN random() < 0.5 THEN 'pending'
+                        ELSE 'in_progress' END)::todo_status,
+                  CASE WHEN random() < 0.4 THEN CURRENT_DATE + (random() * 60 - 30)::int END,
+                  CURRENT_TIMESTAMP - (random() * 365) * INTERVAL '1 day'
+           FROM todo_users u, generate_series(1, %s) n''',
+        (categories_per_user, todos_per_user)
+    )
+    # Every tenth todo becomes a subtask of the one before it
+    cur.execute(
+        '''UPDATE todo_items t SET parent_id = n.prev
+           FROM (SELECT id, lag(id) OVER (PARTITION BY user_id ORDER BY id) AS prev,
+                        row_number() OVER (PARTITION BY user_id ORDER BY id) AS n
+                 FROM todo_items) n
+           WHERE t.id = n.id AND n.n % 10 = 0'''
+    )
+    # A third of the todos carry one or two of 30 tags
+    cur.execute(
+        '''UPDATE todo_items SET tags = ARRAY['tag' || (id % 30), 'tag' || (id % 7)]
+           WHERE id % 3 = 0'''
+    )
+    # Manual-order keys on most top-level todos; the rest predate manual ordering
+    cur.execute(
+        '''UPDATE todo_items SET position_key = lpad(to_hex(id), 8, '0')
+           WHERE parent_id IS NULL AND id % 50 <> 0'''
+    )
+    # The reminder worker has caught up: everything due up to today is
+    # reminded, while open todos due weeks or months from now wait their turn
+    cur.execute(
+        '''UPDATE todo_items SET reminded_at = CURRENT_TIMESTAMP
+           WHERE due_date <= CURRENT_DATE AND status <> 'completed' '''
+    )
+    cur.execute(
+        '''UPDATE todo_items SET due_date = CURRENT_DATE + 30 + id % 300
+           WHERE due_date IS NULL AND status <> 'completed' AND id % 2 = 0'''
+    )
+    # Two recurring series per user; every twentieth todo is a stored
+    # occurrence of the first, and the second has a few skipped dates
+    cur.execute(
+        '''INSERT INTO todo_series (user_id, title, frequency, starts_on)
+           SELECT u.id, 'series ' || n, (ARRAY['daily', 'weekly'])[n], CURRENT_DATE - 365
+           FROM todo_users u, generate_series(1, 2) n'''
+    )
+    cur.execute(
+        '''UPDATE todo_items t SET series_id = s.id, occurrence_date = s.starts_on + n.n::int
+           FROM todo_series s,
+                (SELECT id, user_id, row_number() OVER (PARTITION BY user_id ORDER BY id) AS n
+                 FROM todo_items WHERE id % 20 = 0) n
+           WHERE t.id = n.id AND s.user_id = n.user_id AND s.frequency = 'daily' '''
+    )
+    cur.execute(
+        '''INSERT INTO todo_series_exceptions (series_id, occurrence_date)
+           SELECT s.id, CURRENT_DATE - 7 * n
+           FROM todo_series s, generate_series(1, 10) n
+           WHERE s.frequency = 'weekly' '''
+    )
+    cur.execute(
+        '''UPDATE todo_items t SET change_seq = n.seq
+           FROM (SELECT id, row_number() OVER (PARTITION BY user_id ORDER BY created_at) AS seq
+                 FROM todo_items) n
+           WHERE t.id = n.id'''
+    )
+    cur.execute('UPDATE todo_users u SET change_seq = (SELECT COUNT(*) FROM todo_items t WHERE t.user_id = u.id)')
+    cur.execute(
+        '''INSERT INTO todo_daily_stats (user_id, day, category_key, created, completed)
+           SELECT user_id, created_at::date, COALESCE(category_id, 0), COUNT(*),
+                  COUNT(*) FILTER (WHERE status = 'completed')
+           FROM todo_items GROUP BY 1, 2, 3'''
+    )
+    cur.execute('ALTER TABLE todo_items ENABLE TRIGGER USER')
+    cur.execute('ALTER TABLE todo_categories ENABLE TRIGGER USER')
+    cur.execute('ANALYZE todo_users')
+    cur.execute('ANALYZE todo_categories')
+    cur.execute('ANALYZE todo_category_members')
+    cur.execute('ANALYZE todo_items')
+    cur.execute('ANALYZE todo_daily_stats')
+    cur.execute('ANALYZE todo_series')
+    cur.execute('ANALYZE todo_series_exceptions')
+
+def walk(plan):
+    """Yield every node of an EXPLAIN (FORMAT JSON) plan tree"""
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from walk(child)
+
+def explain(cur, sql, params, analyze=False):
+    cur.execute(f"EXPLAIN ({'ANALYZE, ' if analyze else ''}FORMAT JSON) " + sql, params)
+    plan = cur.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']
+
+def check(cur, name, sql, params, tables, presorted=False, max_rows=None):
+    """Print the scans used for the given tables and return False on a sequential scan
+
+    With presorted=True an index must also be able to return the rows in the
+    requested order. The planner may still prefer a bitmap scan plus a small
+    in-memory sort for a few hundred rows, so that is checked with sorting
+    disabled rather than by rejecting the planner's choice.
+
+    With max_rows the query is run (and rolled back) and no scan of the given
+    tables may read more rows than that, counting those its filter threw away:
+    an index scan can still walk far more of the index than the query needs.
+    """
+    ok = True
+    scans = []
+    for node in walk(explain(cur, sql, params)):
+        node_type = node['Node Type']
+        if node_type in ('Sort', 'Incremental Sort'):
+            scans.append(f"{node_type} on {', '.join(node['Sort Key'])}")
+            continue
+        if node_type == 'Bitmap Index Scan':
+            scans.append(f"  via {node['Index Name']}")
+            continue
+        # DELETE/UPDATE nodes name the table too; the scan beneath them is what matters
+        if node_type == 'ModifyTable' or node.get('Relation Name') not in tables:
+            continue
+        if node_type == 'Seq Scan':
+            ok = False
+        scans.append(f"{node['Relation Name']}: {node_type} {node.get('Index Name', '')}".rstrip())
+
+    if presorted:
+        cur.execute('SET LOCAL enable_sort = off')
+        cur.execute('SET LOCAL enable_incremental_sort = off')
+        ordered = [node for node in walk(explain(cur, sql, params))
+                   if node['Node Type'] in ('Sort', 'Incremental Sort')]
+        cur.execute('SET LOCAL enable_incremental_sort = on')
+        cur.execute('SET LOCAL enable_sort = on')
+        if ordered:
+            ok = False
+            scans.append("no index provides the ORDER BY")
+        else:
+            scans.append("index order available without a sort")
+
+    if max_rows is not None:
+        cur.execute('SAVEPOINT plan_check_analyze')
+        read = max((
+            (node['Actual Rows'] + node.get('Rows Removed by Filter', 0)
+             + node.get('Rows Removed by Index Recheck', 0)) * node['Actual Loops']
+            for node in walk(explain(cur, sql, params, analyze=True))
+            if node.get('Relation Name') in tables and 'Scan' in node['Node Type']
+        ), default=0)
+        cur.execute('ROLLBACK TO SAVEPOINT plan_check_analyze')
+        if read > max_rows:
+            ok = False
+        scans.append(f"at most {read} rows read by one scan (limit {max_rows})")
+
+    print(f"{'✅' if ok else '❌'} {name}")
+    for scan in scans:
+        print(f"     {scan}")
+    return ok
+
+def run(users, todos_per_user, categories_per_user):
+    conn = get_db_connection()
+    if not conn:
+        print("❌ Cannot run plan check - no connection")
+        return False
+
+    try:
+        cur = conn.cursor()
+        cur.execute(f'CREATE SCHEMA {SCRATCH_SCHEMA}')
+        cur.execute(f'SET LOCAL search_path TO {SCRATCH_SCHEMA}')
+        create_schema(cur)
+
+        print(f"🔵 Seeding {users} users x {todos_per_user} todos...")
+        seed(cur, users, todos_per_user, categories_per_user)
+
+        # Pick a user and a category from the middle of the data set
+        cur.execute('SELECT id FROM todo_users ORDER BY id OFFSET %s LIMIT 1', (users // 2,))
+        user_id = cur.fetchone()[0]
+        cur.execute('SELECT id FROM todo_categories WHERE user_id = %s LIMIT 1', (user_id,))
+        category_id = cur.fetchone()[0]
+        cur.execute('SELECT id FROM todo_items WHERE user_id = %s LIMIT 1', (user_id,))
+        todo_id = cur.fetchone()[0]
+        cur.execute('SELECT parent_id FROM todo_items WHERE user_id = %s AND parent_id IS NOT NULL LIMIT 1',
+                    (user_id,))
+        parent_id = cur.fetchone()[0]
+        cur.execute('SELECT id FROM todo_series WHERE user_id = %s', (user_id,))
+        series_ids = [row[0] for row in cur.fetchall()]
+        # A todo someone else filed under a category shared with the user
+        cur.execute(
+            '''SELECT t.id FROM todo_items t JOIN todo_category_members m ON m.category_id = t.category_id
+               WHERE m.user_id = %s AND t.parent_id IS NULL LIMIT 1''',
+            (user_id,)
+        )
+        shared_todo_id = cur.fetchone()[0]
+        params = {'user_id': user_id, 'tags': None}
+        tagged = {'user_id': user_id, 'tags': ['tag1', 'tag2']}
+        sharing = ('todo_categories', 'todo_category_members')
+
+        results = [
+            check(cur, 'dashboard categories', queries.CATEGORIES_FOR_USER, params, sharing),
+            check(cur, 'dashboard todos', queries.DASHBOARD_TODOS, params, ('todo_items',), presorted=True),
+            check(cur, 'dashboard todos, manual order', queries.DASHBOARD_TODOS_MANUAL, params, ('todo_items',),
+                  presorted=True),
+            check(cur, 'manual order, first key', queries.FIRST_POSITION, (user_id,), ('todo_items',)),
+            check(cur, 'manual order, move', queries.MOVE_TODO,
+                  {'key': 'V', 'todo_id': todo_id, 'user_id': user_id}, ('todo_items',)),
+            check(cur, 'manual order, users to rebalance', queries.USERS_TO_REBALANCE, (100,), ('todo_items',)),
+            check(cur, 'dashboard shared todos', queries.SHARED_TODOS, params, ('todo_items',) + sharing),
+            check(cur, 'dashboard stats', queries.DASHBOARD_STATS, params, ('todo_items',)),
+            check(cur, 'dashboard tag list', queries.USER_TAGS, (user_id,), ('todo_items',)),
+            check(cur, 'dashboard todos, any of two tags', queries.DASHBOARD_TODOS_TAGGED['any'],
+                  tagged, ('todo_items',)),
+            check(cur, 'dashboard stats, all of two tags', queries.DASHBOARD_STATS_TAGGED['all'],
+                  tagged, ('todo_items',)),
+            check(cur, 'permission cache', queries.CATEGORY_ROLES, params, sharing),
+            check(cur, 'shared todo card', queries.DASHBOARD_TODO,
+                  {'user_id': user_id, 'todo_id': shared_todo_id}, ('todo_items',) + sharing),
+            check(cur, 'shared todo description', queries.TODO_DESCRIPTION,
+                  {'user_id': user_id, 'todo_id': shared_todo_id}, ('todo_items',) + sharing),
+            check(cur, 'status update with permission check', queries.UPDATE_TODO_STATUS,
+                  {'user_id': user_id, 'todo_id': shared_todo_id, 'status': 'completed'}, ('todo_items',) + sharing),
+            check(cur, 'category members', queries.CATEGORY_MEMBERS, (category_id,), ('todo_category_members',)),
+            check(cur, 'subtask tree', queries.TODO_TREE,
+                  {'user_id': user_id, 'root_id': parent_id}, ('todo_items',) + sharing),
+            check(cur, 'whole todo tree', queries.TODO_TREE,
+                  {'user_id': user_id, 'root_id': None}, ('todo_items',) + sharing),
+            check(cur, 'recurring series in window', queries.SERIES_IN_WINDOW,
+                  {'user_id': user_id, 'start': date.today(), 'end': date.today() + timedelta(days=6)},
+                  ('todo_series',)),
+            check(cur, 'recurring overrides in window', queries.SERIES_OVERRIDES,
+                  {'series_ids': series_ids, 'start': date.today(), 'end': date.today() + timedelta(days=6)},
+                  ('todo_items', 'todo_series_exceptions')),
+            check(cur, 'delete todo', queries.DELETE_TODO, {'todo_id': todo_id, 'user_id': user_id},
+                  ('todo_items',) + sharing),
+            check(cur, 'category delete (ON DELETE SET NULL)', queries.CLEAR_CATEGORY, (category_id,), ('todo_items',)),
+            check(cur, 'sync changes', queries.SYNC_TODOS,
+                  {'user_id': user_id, 'since': 0, 'upto': 2 ** 62, 'limit': 500}, ('todo_items',), presorted=True),
+            check(cur, 'analytics daily', queries.ANALYTICS_DAILY,
+                  {'user_id': user_id, 'days': 30}, ('todo_daily_stats',)),
+            check(cur, 'overdue count', queries.OVERDUE_COUNT, (user_id,), ('todo_items',)),
+            check(cur, 'agenda', queries.AGENDA_TODOS, (user_id,), ('todo_items',)),
+            check(cur, 'calendar feed owner', queries.FEED_USER, ('some-token',), ('todo_users',)),
+            check(cur, 'calendar feed events', queries.FEED_TODOS, (user_id,), ('todo_items',)),
+            check(cur, 'reminder claim', reminders.CLAIM_REMINDERS,
+                  {'lead_days': 1, 'limit': 200, 'max_overdue_days': 7}, ('todo_items', 'todo_users'),
+                  presorted=True, max_rows=200),
+        ]
+        return all(results)
+
+    except Exception as e:
+        print(f"❌ Plan check error: {e}")
+        return False
+
+    finally:
+        conn.rollback()
+        conn.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check that the hot queries use index scans')
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--todos-per-user', type=int, default=200)
+    parser.add_argument('--categories-per-user', type=int, default=4)
+    args = parser.parse_args()
+
+    if run(args.users, args.todos_per_user, args.categories_per_user):
+        print("\n✅ All queries use index scans")
+    else:
+        print("\n❌ Some queries fall back to sequential scans")
+        sys.exit(1)
@@ -0,0 +1,106 @@
+# positions.py - Manual ordering of the dashboard with fractional position keys
+#
+# Each top-level todo has a position_key: the digits of a fraction between 0
+# and 1 in base 62, compared as plain strings (COLLATE "C"). There is always
+# a key between any two others, so dragging a todo to a new place rewrites
+# only that todo's key and never renumbers its neighbours. Keys never end in
+# '0', which keeps room below every key.
+#
+# A todo put at either end of the list steps the end key's leading digit
+# down or up, so new todos (which go on top) add one character only every 60
+# or so adds. Keys get one character longer every few moves into the same
+# gap between two todos. Keys are handed out with the user's row locked, so
+# two todos added or moved at once never get the same key. rebalance.py
+# rewrites a user's keys as short, evenly spaced ones once any grows past
+# REBALANCE_KEY_LENGTH or two are equal, and assigns keys to todos that have
+# none (those from before manual ordering, added through sync or started
+# from a recurring series).
+from schema import REBALANCE_KEY_LENGTH
+from storage import queries
+
+DIGITS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+
+ORDERS = ('priority', 'manual')
+
+def midpoint(low, high):
+    """A key strictly between low ('' for the start) and high (None for the end)"""
+    if high is not None:
+        # Keep the common prefix and split the rest
+        n = 0
+        while n < len(high) and (low[n] if n < len(low) else '0') == high[n]:
+            n += 1
+        if n:
+            return high[:n] + midpoint(low[n:], high[n:])
+    low_digit = DIGITS.index(low[0]) if low else 0
+    high_digit = DIGITS.index(high[0]) if high is not None else len(DIGITS)
+    if high_digit - low_digit > 1:
+        return DIGITS[(low_digit + high_digit) // 2]
+    # Adjacent digits: high's first digit alone is between them, or go one deeper
+    if high is not None and len(high) > 1:
+        return high[0]
+    return DIGITS[low_digit] + midpoint(low[1:], None)
+
+def key_before(high):
+    """A short key below high, for the top of the list"""
+    digit = DIGITS.index(high[0])
+    if digit > 1:
+        return DIGITS[digit - 1]
+    if digit == 1:
+        # '1' itself is below '1...', and '0z' below '1'
+        return high[0] if len(high) > 1 else DIGITS[0] + DIGITS[-1]
+    return DIGITS[0] + key_before(high[1:])
+
+def key_after(low):
+    """A short key above low, for the bottom of the list"""
+    digit = DIGITS.index(low[0])
+    if digit < len(DIGITS) - 1:
+        return DIGITS[digit + 1]
+    return DIGITS[-1] + key_after(low[1:]) if len(low) > 1 else DIGITS[-1] + DIGITS[1]
+
+def key_between(before, after):
+    """The key for a todo dropped between the todos with keys before and after (either may be None)"""
+    if before is not None and after is not None:
+        if before >= after:
+            raise ValueError(f"position keys out of order: {before!r} >= {after!r}")
+        return midpoint(before, after)
+    if after is not None:
+        return key_before(after)
+    if before is not None:
+        return key_after(before)
+    return midpoint('', None)
+
+def evenly_spaced(count):
+    """count ascending keys spread over the whole range, as short as they can be"""
+    width = 1
+    while len(DIGITS) ** width <= count:
+        width += 1
+    span = len(DIGITS) ** width
+    keys = []
+    for n in range(1, count + 1):
+        value = n * span // (count + 1)
+        digits = ''
+        for _ in range(width):
+            value, digit = divmod(value, len(DIGITS))
+            digits = DIGITS[digit] + digits
+        keys.append(digits.rstrip('0'))
+    return keys
+
+def lock(cur, user_id):
+    """Hold the user's row until commit, so nobody else hands out one of their keys meanwhile"""
+    cur.execute(queries.LOCK_POSITIONS, (user_id,))
+
+def first_key(cur, user_id):
+    """The key for a new todo, which goes to the top of the user's list"""
+    lock(cur, user_id)
+    cur.execute(queries.FIRST_POSITION, (user_id,))
+    row = cur.fetchone()
+    return key_between(None, row[0] if row else None)
+
+def rebalance(cur, user_id):
+    """Give all of a user's top-level todos fresh keys, keeping their manual order; returns how many"""
+    lock(cur, user_id)
+    cur.execute(queries.MANUAL_ORDER_IDS, (user_id,))
+    ids = [row[0] for row in cur.fetchall()]
+    if ids:
+        cur.execute(queries.SET_POSITIONS, {'ids': ids, 'keys': evenly_spaced(len(ids))})
+    return len(ids)
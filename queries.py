@@ -0,0 +1,489 @@
+# queries.py - SQL shared by the routes in app.py and by plan_check.py
+#
+# Keep these in step with the indexes in schema.py.
+from schema import PRIORITIES, REBALANCE_KEY_LENGTH, STATUSES
+
+USER_BY_USERNAME = 'SELECT id, username, password, timezone FROM todo_users WHERE username = %s'
+
+USERNAME_TAKEN = 'SELECT id FROM todo_users WHERE username = %s'
+
+INSERT_USER = 'INSERT INTO todo_users (username, password, email) VALUES (%s, %s, %s) RETURNING id'
+
+# The settings page
+USER_SETTINGS = 'SELECT username, email, timezone, ical_token FROM todo_users WHERE id = %s'
+
+SET_ICAL_TOKEN = 'UPDATE todo_users SET ical_token = %(token)s WHERE id = %(user_id)s'
+
+UPDATE_USER_SETTINGS = '''
+    UPDATE todo_users SET email = %(email)s, timezone = %(timezone)s WHERE id = %(user_id)s
+'''
+
+INSERT_CATEGORY = 'INSERT INTO todo_categories (user_id, name, color) VALUES (%s, %s, %s) RETURNING id'
+
+# Shared categories (sharing.py). Every category a user can reach and their
+# role in it: 'owner' of their own, their member role in others'. Permission
+# checks join against this inside the data query instead of looking up each
+# todo's category separately.
+CATEGORY_ROLES = '''
+    SELECT id AS category_id, 'owner' AS role FROM todo_categories WHERE user_id = %(user_id)s
+    UNION ALL
+    SELECT category_id, role FROM todo_category_members WHERE user_id = %(user_id)s
+'''
+
+EDITABLE_CATEGORIES = f"SELECT category_id FROM ({CATEGORY_ROLES}) roles WHERE role <> 'viewer'"
+
+# The same, narrowed to categories other people can see too
+SHARED_CATEGORY_ROLES = '''
+    SELECT id AS category_id, 'owner' AS role FROM todo_categories c
+    WHERE user_id = %(user_id)s AND EXISTS (SELECT 1 FROM todo_category_members m WHERE m.category_id = c.id)
+    UNION ALL
+    SELECT category_id, role FROM todo_category_members WHERE user_id = %(user_id)s
+'''
+
+# The user's own categories and those shared with them, with their role,
+# whether anyone else can see it, and the owner's name if it is not theirs.
+# The dashboard fills the per-request permission cache from these rows. The
+# lateral probe keeps "shared" on the members primary key; as an EXISTS the
+# planner may hash the whole table instead.
+CATEGORIES_FOR_USER = '''
+    SELECT c.id, c.name, c.color, 'owner' AS role, m.category_id IS NOT NULL AS shared, NULL AS owner
+    FROM todo_categories c
+    LEFT JOIN LATERAL (SELECT category_id FROM todo_category_members
+                       WHERE category_id = c.id LIMIT 1) m ON true
+    WHERE c.user_id = %(user_id)s
+    UNION ALL
+    SELECT c.id, c.name, c.color, m.role, true, u.username
+    FROM todo_category_members m
+    JOIN todo_categories c ON c.id = m.category_id
+    JOIN todo_users u ON u.id = c.user_id
+    WHERE m.user_id = %(user_id)s
+    ORDER BY name
+'''
+
+CATEGORY_MEMBERS = '''
+    SELECT u.id, u.username, m.role, m.added_at
+    FROM todo_category_members m
+    JOIN todo_users u ON u.id = m.user_id
+    WHERE m.category_id = %s
+    ORDER BY u.username
+'''
+
+# Adds a member by username, or changes their role; nothing if no such user
+# or it is the owner
+UPSERT_CATEGORY_MEMBER = '''
+    INSERT INTO todo_category_members (category_id, user_id, role)
+    SELECT c.id, u.id, %(role)s
+    FROM todo_categories c, todo_users u
+    WHERE c.id = %(category_id)s AND u.username = %(username)s AND u.id <> c.user_id
+    ON CONFLICT (category_id, user_id) DO UPDATE SET role = EXCLUDED.role
+    RETURNING user_id
+'''
+
+DELETE_CATEGORY_MEMBER = 'DELETE FROM todo_category_members WHERE category_id = %s AND user_id = %s'
+
+# List views carry only the start of each description: one character past
+# the preview length tells the template there is more. substr() detoasts just
+# that slice, so long descriptions cost nothing until /api/todos/<id>/description.
+DESCRIPTION_PREVIEW_LENGTH = 200
+DESCRIPTION_PREVIEW = f'substr(t.description, 1, {DESCRIPTION_PREVIEW_LENGTH + 1})'
+
+DASHBOARD_TODO_COLUMNS = f'''t.id, t.title, {DESCRIPTION_PREVIEW}, t.priority, t.status,
+           c.name, c.color, t.due_date, t.created_at, t.subtask_total, t.subtask_done,
+           t.tags, t.position_key, t.updated_at'''
+
+# Optional tag filters for the dashboard queries, taking the tag array as
+# %(tags)s. Both operators are served by idx_todos_tags.
+TAG_FILTERS = {
+    'any': ' AND t.tags && %(tags)s::text[]',
+    'all': ' AND t.tags @> %(tags)s::text[]',
+}
+
+# The dashboard's two orders (positions.ORDERS): by status and priority, or
+# the user's own drag-and-drop order, with todos that have no key yet last.
+# Each has an index that returns the rows already sorted.
+ORDER_BY = {
+    'priority': 't.status, t.priority, t.created_at DESC',
+    'manual': 't.position_key, t.created_at DESC',
+}
+
+# Top-level todos only; subtasks show up as their parent's progress. The
+# user created these, so they may do anything with them.
+def dashboard_todos(tag_filter='', order='priority'):
+    return f'''
+    SELECT {DASHBOARD_TODO_COLUMNS}, 'owner' AS role
+    FROM todo_items t
+    LEFT JOIN todo_categories c ON t.category_id = c.id
+    WHERE t.user_id = %(user_id)s AND t.parent_id IS NULL{tag_filter}
+    ORDER BY {ORDER_BY[order]}
+'''
+
+# Other people's top-level todos in categories shared with the user or that
+# they share, with the user's role in each. Only run for users who have such
+# categories; the dashboard merges them into the list above and its stats.
+def shared_todos(tag_filter=''):
+    return f'''
+    SELECT {DASHBOARD_TODO_COLUMNS}, s.role
+    FROM ({SHARED_CATEGORY_ROLES}) s
+    JOIN todo_items t ON t.category_id = s.category_id
+    JOIN todo_categories c ON c.id = s.category_id
+    WHERE t.user_id <> %(user_id)s AND t.parent_id IS NULL{tag_filter}
+    ORDER BY {ORDER_BY['priority']}
+'''
+
+def dashboard_stats(tag_filter=''):
+    return f'''
+    SELECT
+        COUNT(*) as total,
+        SUM(CASE WHEN status = 'completed' THEN 1 ELSE 0 END) as completed,
+        SUM(CASE WHEN status = 'pending' THEN 1 ELSE 0 END) as pending,
+        SUM(CASE WHEN status = 'in_progress' THEN 1 ELSE 0 END) as in_progress
+    FROM todo_items t
+    WHERE t.user_id = %(user_id)s AND t.parent_id IS NULL{tag_filter}
+'''
+
+DASHBOARD_TODOS = dashboard_todos()
+DASHBOARD_STATS = dashboard_stats()
+SHARED_TODOS = shared_todos()
+DASHBOARD_TODOS_TAGGED = {match: dashboard_todos(sql) for match, sql in TAG_FILTERS.items()}
+DASHBOARD_TODOS_MANUAL = dashboard_todos(order='manual')
+DASHBOARD_TODOS_MANUAL_TAGGED = {match: dashboard_todos(sql, 'manual') for match, sql in TAG_FILTERS.items()}
+DASHBOARD_STATS_TAGGED = {match: dashboard_stats(sql) for match, sql in TAG_FILTERS.items()}
+SHARED_TODOS_TAGGED = {match: shared_todos(sql) for match, sql in TAG_FILTERS.items()}
+
+# One dashboard row, own or shared, for re-rendering a single card after a
+# realtime event
+DASHBOARD_TODO = f'''
+    SELECT {DASHBOARD_TODO_COLUMNS}, CASE WHEN t.user_id = %(user_id)s THEN 'owner' ELSE r.role END
+    FROM todo_items t
+    LEFT JOIN todo_categories c ON t.category_id = c.id
+    LEFT JOIN ({CATEGORY_ROLES}) r ON r.category_id = t.category_id
+    WHERE t.id = %(todo_id)s AND t.parent_id IS NULL AND (t.user_id = %(user_id)s OR r.role IS NOT NULL)
+'''
+
+# Every tag the user has on a top-level todo, for the filter list
+USER_TAGS = '''
+    SELECT tag, COUNT(*)
+    FROM todo_items t, unnest(t.tags) AS tag
+    WHERE t.user_id = %s AND t.parent_id IS NULL
+    GROUP BY tag
+    ORDER BY tag
+'''
+
+# A todo and all of its descendants, or with root_id NULL every todo the user
+# has, in one recursive query. Rows come out depth-first with siblings in
+# creation order, so a flat list indented by depth reads as the tree. The
+# depth cap only matters if a cycle was ever written by hand.
+TODO_TREE = f'''
+    WITH RECURSIVE tree AS (
+        SELECT t.id, t.title, {DESCRIPTION_PREVIEW} AS description, t.priority, t.status,
+               t.category_id, t.due_date, t.created_at, t.subtask_total, t.subtask_done, t.tags,
+               t.parent_id, t.user_id, 0 AS depth, ARRAY[t.id] AS path
+        FROM todo_items t
+        WHERE (t.id = %(root_id)s
+               AND (t.user_id = %(user_id)s OR t.category_id IN (SELECT category_id FROM ({CATEGORY_ROLES}) r)))
+           OR (%(root_id)s::integer IS NULL AND t.user_id = %(user_id)s AND t.parent_id IS NULL)
+        UNION ALL
+        SELECT c.id, c.title, substr(c.description, 1, {DESCRIPTION_PREVIEW_LENGTH + 1}), c.priority, c.status,
+               c.category_id, c.due_date, c.created_at, c.subtask_total, c.subtask_done, c.tags,
+               c.parent_id, c.user_id, tree.depth + 1, tree.path || c.id
+        FROM tree
+        JOIN todo_items c ON c.parent_id = tree.id
+        WHERE tree.depth < 100
+    )
+    SELECT tree.id, tree.title, tree.description, tree.priority, tree.status,
+           c.name, c.color, tree.due_date, tree.created_at, tree.subtask_total, tree.subtask_done,
+           tree.tags, tree.parent_id, tree.depth,
+           CASE WHEN tree.user_id = %(user_id)s THEN 'owner' ELSE r.role END
+    FROM tree
+    LEFT JOIN ({CATEGORY_ROLES}) r ON r.category_id = tree.category_id
+    LEFT JOIN todo_categories c ON c.id = r.category_id
+    ORDER BY tree.path
+'''
+
+# Readable and writable todos: the user's own, or in a category shared with
+# them (as an editor, for writes). The subtree of a readable todo is
+# readable through TODO_TREE.
+READABLE_TODO = f'(user_id = %(user_id)s OR category_id IN (SELECT category_id FROM ({CATEGORY_ROLES}) r))'
+EDITABLE_TODO = f'(user_id = %(user_id)s OR category_id IN ({EDITABLE_CATEGORIES}))'
+
+TODO_DESCRIPTION = f'SELECT description FROM todo_items WHERE id = %(todo_id)s AND {READABLE_TODO}'
+
+# The parent a new subtask hangs off, if the user may change it. Subtasks
+# are filed under their parent's category, so they are shared along with it.
+EDITABLE_PARENT = f'SELECT id, category_id FROM todo_items WHERE id = %(todo_id)s AND {EDITABLE_TODO}'
+
+INSERT_TODO = '''
+    INSERT INTO todo_items (user_id, title, description, priority, category_id, due_date, status, parent_id, tags,
+                            position_key)
+    VALUES (%s, %s, %s, %s, %s, %s, 'pending', %s, %s::text[], %s)
+    RETURNING id
+'''
+
+# Manual order (positions.py). Keys are handed out with the user's row
+# locked; NO KEY so it does not hold up inserts referencing the user.
+LOCK_POSITIONS = 'SELECT 1 FROM todo_users WHERE id = %s FOR NO KEY UPDATE'
+
+# The smallest key, for a todo added on top
+FIRST_POSITION = '''
+    SELECT position_key FROM todo_items
+    WHERE user_id = %s AND parent_id IS NULL AND position_key IS NOT NULL
+    ORDER BY position_key
+    LIMIT 1
+'''
+
+# The keys either side of where a todo was dropped
+POSITIONS = '''
+    SELECT id, position_key FROM todo_items
+    WHERE id = ANY(%(ids)s) AND user_id = %(user_id)s AND parent_id IS NULL
+'''
+
+MOVE_TODO = '''
+    UPDATE todo_items SET position_key = %(key)s
+    WHERE id = %(todo_id)s AND user_id = %(user_id)s AND parent_id IS NULL
+'''
+
+# A user's top-level todos in manual order, locked while they are rekeyed
+MANUAL_ORDER_IDS = f'''
+    SELECT id FROM todo_items t
+    WHERE user_id = %s AND parent_id IS NULL
+    ORDER BY {ORDER_BY['manual']}
+    FOR UPDATE
+'''
+
+SET_POSITIONS = '''
+    UPDATE todo_items t SET position_key = v.key
+    FROM unnest(%(ids)s::integer[], %(keys)s::text[]) AS v(id, key)
+    WHERE t.id = v.id
+'''
+
+# Users with a todo whose key is missing or has grown long (idx_todos_rebalance)
+USERS_TO_REBALANCE = f'''
+    SELECT DISTINCT user_id FROM todo_items
+    WHERE parent_id IS NULL AND (position_key IS NULL OR length(position_key) > {REBALANCE_KEY_LENGTH})
+    LIMIT %s
+'''
+
+# Users with two top-level todos on the same key, left by adds that raced
+# before keys were handed out under a lock. One pass over the whole of
+# idx_todos_user_manual_order, so it is for the rebalance job only.
+DUPLICATE_POSITION_USERS = '''
+    SELECT user_id FROM todo_items
+    WHERE parent_id IS NULL AND position_key IS NOT NULL
+    GROUP BY user_id, position_key
+    HAVING count(*) > 1
+'''
+
+UPDATE_TODO_STATUS = f'''
+    UPDATE todo_items
+    SET status = %(status)s,
+        completed_at = CASE WHEN %(status)s::todo_status = 'completed'
+                            THEN COALESCE(completed_at, CURRENT_TIMESTAMP) END,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE id = %(todo_id)s AND {EDITABLE_TODO}
+    RETURNING parent_id, category_id
+'''
+
+UPDATE_TODO_TAGS = f'''
+    UPDATE todo_items SET tags = %(tags)s::text[], updated_at = CURRENT_TIMESTAMP
+    WHERE id = %(todo_id)s AND {EDITABLE_TODO}
+    RETURNING category_id
+'''
+
+DELETE_TODO = f'''
+    DELETE FROM todo_items WHERE id = %(todo_id)s AND {EDITABLE_TODO}
+    RETURNING parent_id, category_id
+'''
+
+# What the ON DELETE SET NULL trigger runs when a category is removed
+CLEAR_CATEGORY = 'UPDATE todo_items SET category_id = NULL WHERE category_id = %s'
+
+# History: archived todos, newest first. The (completed_at, id) pair of the
+# last row on a page is the cursor for the next one. Subtasks are archived
+# along with their parent and are not listed on their own.
+HISTORY_PAGE = '''
+    SELECT a.id, a.title, a.description, a.priority, a.status,
+           c.name, c.color, a.due_date, a.created_at, a.completed_at
+    FROM todo_items_archive a
+    LEFT JOIN todo_categories c ON a.category_id = c.id
+    WHERE a.user_id = %(user_id)s AND a.parent_id IS NULL
+      AND (%(before_completed)s::timestamp IS NULL
+           OR (a.completed_at, a.id) < (%(before_completed)s, %(before_id)s))
+    ORDER BY a.completed_at DESC, a.id DESC
+    LIMIT %(limit)s
+'''
+
+# Delta sync. Each query is bounded by the user's change_seq read first, so
+# changes committed meanwhile wait for the next sync instead of being skipped.
+SYNC_STATE = 'SELECT change_seq, sync_floor FROM todo_users WHERE id = %s'
+
+SYNC_TODO_COLUMNS = '''id, title, description, priority, status, category_id,
+                       due_date, created_at, updated_at, completed_at, change_seq,
+                       parent_id, subtask_total, subtask_done, tags'''
+
+SYNC_TODOS = f'''
+    SELECT {SYNC_TODO_COLUMNS}
+    FROM todo_items
+    WHERE user_id = %(user_id)s AND change_seq > %(since)s AND change_seq <= %(upto)s
+    ORDER BY change_seq
+    LIMIT %(limit)s
+'''
+
+SYNC_CATEGORIES = '''
+    SELECT id, name, color, change_seq
+    FROM todo_categories
+    WHERE user_id = %(user_id)s AND change_seq > %(since)s AND change_seq <= %(upto)s
+    ORDER BY change_seq
+    LIMIT %(limit)s
+'''
+
+SYNC_TOMBSTONES = '''
+    SELECT todo_id, change_seq
+    FROM todo_tombstones
+    WHERE user_id = %(user_id)s AND change_seq > %(since)s AND change_seq <= %(upto)s
+    ORDER BY change_seq
+    LIMIT %(limit)s
+'''
+
+SYNC_TODO = f'SELECT {SYNC_TODO_COLUMNS} FROM todo_items WHERE id = %s AND user_id = %s'
+
+# Offline mutations. A category or parent id the user does not own becomes NULL.
+OWNED_CATEGORY = '(SELECT id FROM todo_categories WHERE id = %(category_id)s AND user_id = %(user_id)s)'
+OWNED_PARENT = '(SELECT id FROM todo_items WHERE id = %(parent_id)s AND user_id = %(user_id)s)'
+
+SYNC_INSERT_TODO = f'''
+    INSERT INTO todo_items (user_id, title, description, priority, status, category_id, due_date, completed_at,
+                            parent_id, tags)
+    VALUES (%(user_id)s, %(title)s, %(description)s, %(priority)s, %(status)s, {OWNED_CATEGORY}, %(due_date)s,
+            CASE WHEN %(status)s::todo_status = 'completed' THEN CURRENT_TIMESTAMP END, {OWNED_PARENT},
+            %(tags)s::text[])
+    RETURNING id, change_seq, parent_id
+'''
+
+# Only applied if nobody changed the row after the client last saw it
+SYNC_DELETE_TODO = '''
+    DELETE FROM todo_items
+    WHERE id = %(id)s AND user_id = %(user_id)s
+      AND (%(base_seq)s::bigint IS NULL OR change_seq <= %(base_seq)s)
+    RETURNING id, parent_id
+'''
+
+# Recurring todos (recurrence.py). Series overlapping a window of dates:
+SERIES_IN_WINDOW = '''
+    SELECT s.id, s.title, s.description, s.priority, c.name, c.color, s.category_id, s.tags,
+           s.frequency, s.every, s.starts_on, s.ends_on
+    FROM todo_series s
+    LEFT JOIN todo_categories c ON c.id = s.category_id
+    WHERE s.user_id = %(user_id)s AND s.starts_on <= %(end)s
+      AND (s.ends_on IS NULL OR s.ends_on >= %(start)s)
+'''
+
+# Dates in the window already covered by a stored todo or an exception
+SERIES_OVERRIDES = '''
+    SELECT series_id, occurrence_date FROM todo_items
+    WHERE series_id = ANY(%(series_ids)s) AND occurrence_date BETWEEN %(start)s AND %(end)s
+    UNION ALL
+    SELECT series_id, occurrence_date FROM todo_series_exceptions
+    WHERE series_id = ANY(%(series_ids)s) AND occurrence_date BETWEEN %(start)s AND %(end)s
+'''
+
+SERIES_RULE = 'SELECT frequency, every, starts_on, ends_on FROM todo_series WHERE id = %s AND user_id = %s'
+
+INSERT_SERIES = '''
+    INSERT INTO todo_series (user_id, title, description, priority, category_id, tags, frequency, every, starts_on)
+    VALUES (%(user_id)s, %(title)s, %(description)s, %(priority)s, %(category_id)s, %(tags)s::text[],
+            %(frequency)s, %(every)s, %(starts_on)s)
+    RETURNING id
+'''
+
+# Turns a virtual occurrence into a real todo, copying the series' fields
+MATERIALIZE_OCCURRENCE = '''
+    INSERT INTO todo_items (user_id, title, description, priority, category_id, tags, status, due_date,
+                            completed_at, series_id, occurrence_date)
+    SELECT s.user_id, s.title, s.description, s.priority, s.category_id, s.tags, %(status)s, %(date)s,
+           CASE WHEN %(status)s::todo_status = 'completed' THEN CURRENT_TIMESTAMP END, s.id, %(date)s
+    FROM todo_series s
+    WHERE s.id = %(series_id)s AND s.user_id = %(user_id)s
+    ON CONFLICT (series_id, occurrence_date) WHERE series_id IS NOT NULL DO NOTHING
+    RETURNING id
+'''
+
+SKIP_OCCURRENCE = '''
+    INSERT INTO todo_series_exceptions (series_id, occurrence_date) VALUES (%s, %s)
+    ON CONFLICT DO NOTHING
+'''
+
+# Stored occurrences stay as ordinary todos
+DELETE_SERIES = 'DELETE FROM todo_series WHERE id = %s AND user_id = %s'
+
+# Analytics reads only todo_daily_stats rows inside the window, so its cost
+# does not grow with a user's history
+ANALYTICS_DAILY = '''
+    SELECT day, SUM(created), SUM(completed), SUM(completed_late)
+    FROM todo_daily_stats
+    WHERE user_id = %(user_id)s AND day > CURRENT_DATE - %(days)s
+    GROUP BY day
+    ORDER BY day
+'''
+
+ANALYTICS_CATEGORIES = '''
+    SELECT s.category_key, c.name, c.color,
+           SUM(s.completed), SUM(s.completed_late), SUM(s.completion_seconds)::bigint
+    FROM todo_daily_stats s
+    LEFT JOIN todo_categories c ON c.id = s.category_key
+    WHERE s.user_id = %(user_id)s AND s.day > CURRENT_DATE - %(days)s
+    GROUP BY s.category_key, c.name, c.color
+    HAVING SUM(s.completed) > 0
+    ORDER BY SUM(s.completed) DESC
+'''
+
+# Agenda (agenda.py): every open todo with a due date, earliest first, as
+# one range scan of idx_todos_user_open_due. Buckets are cut in Python,
+# where "today" is known in the user's timezone.
+def agenda_todos(priority='t.priority'):
+    return f'''
+    SELECT t.id, t.title, t.priority, t.status, c.name, c.color, t.due_date, t.parent_id
+    FROM todo_items t
+    LEFT JOIN todo_categories c ON c.id = t.category_id
+    WHERE t.user_id = %s AND t.status <> 'completed' AND t.due_date IS NOT NULL
+    ORDER BY t.due_date, {priority}
+'''
+
+AGENDA_TODOS = agenda_todos()
+
+def rank(column, labels):
+    """CASE expression giving each label its position in labels"""
+    whens = ' '.join(f"WHEN '{label}' THEN {n}" for n, label in enumerate(labels))
+    return f'(CASE {column} {whens} END)'
+
+def use_text_enum_order():
+    """Sort by status and priority in enum order while todo_items still stores them as VARCHAR
+
+    Until migrate_enums.py has run, the plain columns would sort
+    alphabetically. CASE expressions give the right order, though no index
+    can return it presorted. schema.init_db() calls this when it finds the
+    old columns.
+    """
+    global DASHBOARD_TODOS, DASHBOARD_TODOS_TAGGED, SHARED_TODOS, SHARED_TODOS_TAGGED, AGENDA_TODOS
+    ORDER_BY['priority'] = f"{rank('t.status', STATUSES)}, {rank('t.priority', PRIORITIES)}, t.created_at DESC"
+    DASHBOARD_TODOS = dashboard_todos()
+    DASHBOARD_TODOS_TAGGED = {match: dashboard_todos(sql) for match, sql in TAG_FILTERS.items()}
+    SHARED_TODOS = shared_todos()
+    SHARED_TODOS_TAGGED = {match: shared_todos(sql) for match, sql in TAG_FILTERS.items()}
+    AGENDA_TODOS = agenda_todos(rank('t.priority', PRIORITIES))
+
+# Calendar feed (ical.py). The feed's owner and version, by the secret in its URL:
+FEED_USER = 'SELECT id, change_seq FROM todo_users WHERE ical_token = %s'
+
+# Its events: open todos with a due date, off idx_todos_user_open_due
+FEED_TODOS = '''
+    SELECT t.id, t.title, t.description, t.priority, t.due_date, c.name, COALESCE(t.updated_at, t.created_at)
+    FROM todo_items t
+    LEFT JOIN todo_categories c ON c.id = t.category_id
+    WHERE t.user_id = %s AND t.status <> 'completed' AND t.due_date IS NOT NULL
+'''
+
+# Open todos past their due date, straight off idx_todos_user_open_due
+OVERDUE_COUNT = '''
+    SELECT COUNT(*) FROM todo_items
+    WHERE user_id = %s AND status <> 'completed' AND due_date < CURRENT_DATE
+'''
@@ -0,0 +1,176 @@
+# ratelimit.py - Token-bucket rate limits per route class
+#
+# Each limited endpoint belongs to a class with its own buckets, one per
+# client IP and one per logged-in user. A bucket holds up to `capacity`
+# tokens and refills at `capacity / period` per second; a request takes one
+# token from each of its buckets, and only if none of them is empty.
+# Otherwise it is turned away with a 429 and takes nothing, so a client
+# throttled on one bucket does not keep draining the other.
+#
+# Buckets live in process memory by default, so every gunicorn worker counts
+# on its own. Set RATE_LIMIT_REDIS_URL to share them between workers and
+# instances through Redis or anything that speaks its protocol and runs Lua
+# scripts (a local redis-server, KeyDB, Valkey...). If that backend is
+# unreachable the in-process buckets take over rather than failing requests.
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:  # only needed with RATE_LIMIT_REDIS_URL
+    redis = None
+
+RATE_LIMITING = os.environ.get('RATE_LIMITING', '1').lower() in ('1', 'true', 'yes')
+RATE_LIMIT_REDIS_URL = os.environ.get('RATE_LIMIT_REDIS_URL')
+
+# class -> (capacity, period in seconds)
+LIMITS = {
+    # Password hashing is the most expensive thing the app does
+    'auth': (20, 60),
+    'mutation': (60, 60),
+}
+
+# Only these (endpoint, method) pairs are limited; everything else returns
+# from check() after one dict lookup
+ROUTE_CLASSES = {
+    ('login', 'POST'): 'auth',
+    ('register', 'POST'): 'auth',
+    ('add_todo', 'POST'): 'mutation',
+    ('update_todo_status', 'POST'): 'mutation',
+    ('delete_todo', 'POST'): 'mutation',
+    ('update_todo_tags', 'POST'): 'mutation',
+    ('move_todo', 'POST'): 'mutation',
+    ('update_occurrence', 'POST'): 'mutation',
+    ('delete_series', 'POST'): 'mutation',
+    ('add_category', 'POST'): 'mutation',
+    ('add_category_member', 'POST'): 'mutation',
+    ('remove_category_member', 'POST'): 'mutation',
+    ('api_sync_push', 'POST'): 'mutation',
+    ('update_settings', 'POST'): 'mutation',
+    ('reset_calendar_link', 'POST'): 'mutation',
+}
+
+MAX_LOCAL_BUCKETS = 50000
+
+class Decision:
+    """Outcome of one check, with what the RateLimit-* headers report"""
+    __slots__ = ('allowed', 'limit', 'remaining', 'reset')
+
+    def __init__(self, allowed, limit, remaining, reset):
+        self.allowed = allowed
+        self.limit = limit
+        self.remaining = remaining
+        self.reset = reset
+
+    def headers(self):
+        headers = {
+            'RateLimit-Limit': str(self.limit),
+            'RateLimit-Remaining': str(self.remaining),
+            'RateLimit-Reset': str(self.reset),
+        }
+        if not self.allowed:
+            headers['Retry-After'] = str(self.reset)
+        return headers
+
+class LocalBuckets:
+    """Token buckets in this process's memory, at most MAX_LOCAL_BUCKETS of them"""
+
+    def __init__(self):
+        # key -> [tokens, updated_at], least recently used first
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def take(self, keys, capacity, rate, now):
+        """Take a token from every bucket in keys if each has one; returns (allowed, fewest tokens left)"""
+        with self.lock:
+            levels = []
+            for key in keys:
+                bucket = self.buckets.get(key)
+                levels.append(capacity if bucket is None else min(capacity, bucket[0] + (now - bucket[1]) * rate))
+            if min(levels) < 1:
+                # Nothing is taken or created for a request that is turned away
+                return False, min(levels)
+            for key, tokens in zip(keys, levels):
+                if key in self.buckets:
+                    self.buckets.move_to_end(key)
+                elif len(self.buckets) >= MAX_LOCAL_BUCKETS:
+                    # The least recently used bucket is the one most likely
+                    # to have refilled anyway
+                    self.buckets.popitem(last=False)
+                self.buckets[key] = [tokens - 1, now]
+            return True, min(levels) - 1
+
+# KEYS buckets; ARGV capacity, rate (tokens/s), now. Either every bucket gives
+# up a token or none is touched. Tokens come back as a string because Redis
+# truncates Lua numbers to integers.
+TAKE_SCRIPT = '''
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local levels = {}
+local fewest = capacity
+for i, key in ipairs(KEYS) do
+    local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or capacity
+    local ts = tonumber(bucket[2]) or now
+    levels[i] = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    fewest = math.min(fewest, levels[i])
+end
+if fewest < 1 then
+    return {0, tostring(fewest)}
+end
+for i, key in ipairs(KEYS) do
+    redis.call('HSET', key, 'tokens', tostring(levels[i] - 1), 'ts', tostring(now))
+    redis.call('EXPIRE', key, math.ceil(capacity / rate) + 1)
+end
+return {1, tostring(fewest - 1)}
+'''
+
+class RedisBuckets:
+    """Token buckets shared through Redis, updated atomically by a Lua script"""
+
+    def __init__(self, url):
+        self.client = redis.Redis.from_url(url, socket_timeout=0.2, socket_connect_timeout=0.2)
+        self.script = self.client.register_script(TAKE_SCRIPT)
+
+    def take(self, keys, capacity, rate, now):
+        allowed, tokens = self.script(keys=[f'ratelimit:{key}' for key in keys], args=[capacity, rate, now])
+        return bool(allowed), float(tokens)
+
+local_buckets = LocalBuckets()
+shared_buckets = None
+if RATE_LIMIT_REDIS_URL:
+    if redis is None:
+        print("⚠️ RATE_LIMIT_REDIS_URL is set but the redis package is not installed - "
+              "rate limits are per process")
+    else:
+        shared_buckets = RedisBuckets(RATE_LIMIT_REDIS_URL)
+
+def take(keys, capacity, rate, now):
+    if shared_buckets is not None:
+        try:
+            return shared_buckets.take(keys, capacity, rate, now)
+        except Exception as e:
+            print(f"⚠️ Rate limit backend error, using in-process buckets: {e}")
+    return local_buckets.take(keys, capacity, rate, now)
+
+def check(endpoint, method, ip, user):
+    """Decision for a request, or None if its endpoint is not rate limited"""
+    route_class = ROUTE_CLASSES.get((endpoint, method))
+    if route_class is None or not RATE_LIMITING:
+        return None
+
+    capacity, period = LIMITS[route_class]
+    rate = capacity / period
+    keys = [f'{route_class}:{scope}:{value}'
+            for scope, value in (('ip', ip), ('user', user)) if value is not None]
+    if not keys:
+        return None
+    allowed, remaining = take(keys, capacity, rate, time.time())
+
+    # Seconds until the emptiest bucket has a token again
+    reset = 0 if remaining >= 1 else max(1, math.ceil((1 - remaining) / rate))
+    return Decision(allowed, capacity, int(remaining), reset)
@@ -0,0 +1,189 @@
+# realtime.py - Push todo changes to open dashboards
+#
+# Mutations publish a small JSON event with pg_notify() inside their own
+# transaction, so it is delivered only if they commit. Each process keeps a
+# single LISTEN connection, started on the first subscriber, and hands every
+# event to the Server-Sent Events streams of the user it belongs to.
+import json
+import os
+import queue
+import select
+import threading
+import time
+
+import psycopg2
+
+import db
+import storage
+
+CHANNEL = 'todo_events'
+
+# Off unless asked for: every open dashboard holds a stream, and with it a
+# thread of a sync or gthread worker, for STREAM_SECONDS at a time. The
+# gunicorn config turns it on for gevent workers, where a stream is only a
+# greenlet. Serverless functions cannot hold a stream open at all.
+REALTIME_ENABLED = os.environ.get('REALTIME', '0').lower() in ('1', 'true', 'yes')
+# LISTEN needs a session of its own; PgBouncer in transaction pooling mode
+# cannot provide one, so point this at the database directly in that case
+LISTEN_URL = os.environ.get('DATABASE_LISTEN_URL')
+# Streams end after this long and the browser reconnects, which keeps a sync
+# gunicorn worker from being killed by its timeout mid-stream
+STREAM_SECONDS = int(os.environ.get('REALTIME_STREAM_SECONDS', 25))
+HEARTBEAT_SECONDS = 10
+SUBSCRIBER_QUEUE_SIZE = 100
+
+def publish(cur, user_id, event, **data):
+    """Queue an event for user_id's dashboards; sent when cur's transaction commits"""
+    if not storage.supports('realtime'):
+        return
+    payload = json.dumps({'user_id': user_id, 'event': event, **data}, default=str)
+    cur.execute('SELECT pg_notify(%s, %s)', (CHANNEL, payload))
+
+# Everyone other than the acting user who sees a category's todos: its owner
+# and members, reached with one statement however many there are
+NOTIFY_CATEGORY = '''
+    SELECT pg_notify(%(channel)s, (%(payload)s::jsonb || jsonb_build_object('user_id', audience.user_id))::text)
+    FROM (SELECT user_id FROM todo_categories WHERE id = %(category_id)s
+          UNION
+          SELECT user_id FROM todo_category_members WHERE category_id = %(category_id)s) audience
+    WHERE audience.user_id <> %(user_id)s
+'''
+
+def publish_shared(cur, user_id, category_id, event, **data):
+    """publish() to user_id and to everyone else the todo's category is shared with"""
+    publish(cur, user_id, event, **data)
+    if category_id is None or not storage.supports('realtime'):
+        return
+    cur.execute(NOTIFY_CATEGORY, {
+        'channel': CHANNEL, 'payload': json.dumps({'event': event, **data}, default=str),
+        'category_id': category_id, 'user_id': user_id
+    })
+
+def publish_parent(cur, user_id, parent_id):
+    """A subtask was added, changed or removed: its parent's progress counts moved with it"""
+    if parent_id is not None:
+        publish(cur, user_id, 'todo_updated', id=parent_id)
+
+def available():
+    return REALTIME_ENABLED and storage.supports('realtime') and (LISTEN_URL or not db.DB_PGBOUNCER)
+
+def connect_listener():
+    # Not taken from the pool: db.POOL_SIZE already leaves room for it
+    if LISTEN_URL:
+        url = LISTEN_URL.replace('postgres://', 'postgresql://', 1)
+        return psycopg2.connect(url, connect_timeout=db.DB_CONNECT_TIMEOUT)
+    return db.connect_primary()
+
+class Subscription:
+    """One open event stream"""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.events = queue.Queue(SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+
+    def put(self, event):
+        try:
+            self.events.put_nowait(event)
+        except queue.Full:
+            # A stalled browser; it reloads instead of replaying the backlog
+            self.overflowed = True
+
+class Broker:
+    """Fans NOTIFY payloads out to the subscriptions of this process"""
+
+    def __init__(self):
+        self.subscriptions = {}  # user_id -> set of Subscription
+        self.lock = threading.Lock()
+        self.listener_pid = None
+
+    def subscribe(self, user_id):
+        self.ensure_listener()
+        subscription = Subscription(user_id)
+        with self.lock:
+            self.subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscribers = self.subscriptions.get(subscription.user_id, set())
+            subscribers.discard(subscription)
+            if not subscribers:
+                self.subscriptions.pop(subscription.user_id, None)
+
+    def dispatch(self, event, user_id=None):
+        with self.lock:
+            if user_id is None:
+                targets = [s for subscribers in self.subscriptions.values() for s in subscribers]
+            else:
+                targets = list(self.subscriptions.get(user_id, ()))
+        for subscription in targets:
+            subscription.put(event)
+
+    def ensure_listener(self):
+        # Checked against the pid so a forked worker starts its own thread
+        with self.lock:
+            if self.listener_pid == os.getpid():
+                return
+            self.listener_pid = os.getpid()
+        threading.Thread(target=self.listen, name='realtime-listener', daemon=True).start()
+
+    def listen(self):
+        backoff = 1
+        connected_before = False
+        while True:
+            conn = None
+            try:
+                conn = connect_listener()
+                conn.autocommit = True
+                cur = conn.cursor()
+                cur.execute(f'LISTEN {CHANNEL}')
+                print("✅ Listening for todo events")
+                if connected_before:
+                    # Events sent while we were disconnected are lost
+                    self.dispatch({'event': 'resync'})
+                connected_before = True
+                backoff = 1
+                while True:
+                    if select.select([conn], [], [], 30) == ([], [], []):
+                        cur.execute('SELECT 1')  # notices a dead connection
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        try:
+                            event = json.loads(notify.payload)
+                        except ValueError:
+                            continue
+                        user_id = event.pop('user_id', None)
+                        if user_id is not None:
+                            self.dispatch(event, user_id)
+            except Exception as e:
+                print(f"❌ Realtime listener error: {e}")
+                if conn:
+                    conn.close()
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+
+broker = Broker()
+
+def stream(user_id):
+    """Server-Sent Events for one user's dashboard"""
+    subscription = broker.subscribe(user_id)
+    deadline = time.monotonic() + STREAM_SECONDS
+    try:
+        yield 'retry: 1000\n\n'
+        while time.monotonic() < deadline:
+            if subscription.overflowed:
+                yield 'event: resync\ndata: {}\n\n'
+                return
+            try:
+                event = subscription.events.get(timeout=HEARTBEAT_SECONDS)
+            except queue.Empty:
+                yield ': ping\n\n'
+                continue
+            # The same dict goes to every stream of this user, so leave it intact
+            data = {key: value for key, value in event.items() if key != 'event'}
+            yield f"event: {event['event']}\ndata: {json.dumps(data)}\n\n"
+    finally:
+        broker.unsubscribe(subscription)
@@ -0,0 +1,74 @@
+# rebalance.py - Rewrite long manual-order keys (see positions.py)
+#
+# Finds users with a top-level todo whose position_key is missing or longer
+# than REBALANCE_KEY_LENGTH, through the small idx_todos_rebalance index,
+# then in one pass those with two top-level todos on the same key, and gives
+# each of them fresh evenly spaced keys in their current order.
+# Each user is one short transaction, so the job never holds anyone's list
+# for long. Run it from cron (see render.yaml) or by hand:
+#
+#   python rebalance.py [--batch-size 100] [--pause 0.1]
+#
+# Works with either storage backend.
+import argparse
+import sys
+import time
+
+import positions
+import storage
+from storage import queries
+
+def rebalance_all(batch_size=100, pause=0.1):
+    """Rekey every user that needs it; returns the number of users done, or None on error"""
+    conn = storage.get_db_connection()
+    if not conn:
+        print("❌ Cannot rebalance - no connection")
+        return None
+
+    users = todos = 0
+    try:
+        cur = conn.cursor()
+        if storage.BACKEND == 'postgres':
+            # Give up quickly rather than queue behind a long-running request
+            cur.execute("SET lock_timeout = '2s'")
+        while True:
+            cur.execute(queries.USERS_TO_REBALANCE, (batch_size,))
+            batch = [row[0] for row in cur.fetchall()]
+            conn.commit()
+            if not batch:
+                break
+            for user_id in batch:
+                todos += positions.rebalance(cur, user_id)
+                conn.commit()
+            users += len(batch)
+            print(f"🔵 Rebalanced: {users} users, {todos} todos")
+            time.sleep(pause)
+        cur.execute(queries.DUPLICATE_POSITION_USERS)
+        duplicated = sorted({row[0] for row in cur.fetchall()})
+        conn.commit()
+        for user_id in duplicated:
+            todos += positions.rebalance(cur, user_id)
+            conn.commit()
+        if duplicated:
+            users += len(duplicated)
+            print(f"🔵 Rebalanced {len(duplicated)} users with duplicate keys")
+        cur.close()
+        print(f"✅ Rebalanced manual order for {users} users")
+        return users
+
+    except Exception as e:
+        print(f"❌ Rebalance error: {e}")
+        conn.rollback()
+        return None
+
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rewrite long manual-order position keys')
+    parser.add_argument('--batch-size', type=int, default=100, help='users per batch')
+    parser.add_argument('--pause', type=float, default=0.1, help='seconds to sleep between batches')
+    args = parser.parse_args()
+
+    if rebalance_all(args.batch_size, args.pause) is None:
+        sys.exit(1)
@@ -0,0 +1,104 @@
+# recurrence.py - Recurring todos, expanded only for the dates being viewed
+#
+# A series is one todo_series row: what to do, how often (daily, weekly or
+# monthly, every N) and from when. Its occurrences are not stored. Pages ask
+# for the occurrences inside the window they show and get them computed here,
+# minus the dates that already have something stored for them:
+#
+#   - an occurrence that was started or completed becomes a real todo_items
+#     row (series_id, occurrence_date) and from then on is an ordinary todo;
+#   - a skipped one gets a todo_series_exceptions row.
+#
+# So storage grows with what people actually did, not with the calendar.
+import calendar
+from datetime import timedelta
+
+import models
+import queries
+from schema import PRIORITIES
+
+FREQUENCIES = ('daily', 'weekly', 'monthly')
+MAX_EVERY = 365
+# The dashboard shows occurrences due from today through this many days ahead
+DASHBOARD_DAYS = 7
+
+def add_months(day, months):
+    """The same day of the month `months` later, clamped to the month's last day"""
+    month_index = day.month - 1 + months
+    year, month = day.year + month_index // 12, month_index % 12 + 1
+    return day.replace(year=year, month=month, day=min(day.day, calendar.monthrange(year, month)[1]))
+
+def occurrences(frequency, every, starts_on, ends_on, start, end):
+    """Dates of a series that fall within [start, end], in order"""
+    if ends_on is not None:
+        end = min(end, ends_on)
+    if end < starts_on or end < start:
+        return
+
+    if frequency == 'monthly':
+        # Counted from starts_on each time, so the 31st stays the 31st
+        # after a short month
+        skipped = (start.year - starts_on.year) * 12 + start.month - starts_on.month - 1
+        n = max(0, skipped // every * every)
+        while True:
+            day = add_months(starts_on, n)
+            if day > end:
+                return
+            if day >= start:
+                yield day
+            n += every
+    else:
+        step = every * (7 if frequency == 'weekly' else 1)
+        n = max(0, -(-(start - starts_on).days // step))
+        day = starts_on + timedelta(days=n * step)
+        while day <= end:
+            yield day
+            day += timedelta(days=step)
+
+def is_occurrence(frequency, every, starts_on, ends_on, day):
+    return next(occurrences(frequency, every, starts_on, ends_on, day, day), None) == day
+
+def describe(frequency, every):
+    """'daily', 'every 2 weeks'..."""
+    if every == 1:
+        return frequency
+    unit = {'daily': 'days', 'weekly': 'weeks', 'monthly': 'months'}[frequency]
+    return f'every {every} {unit}'
+
+def expand(cur, user_id, start, end, tag_filter=None, tag_match='any'):
+    """Virtual occurrences of the user's series due within [start, end]
+
+    Two queries whatever the window: the series that overlap it, and the
+    stored todos and exceptions that already cover some of its dates.
+    Occurrences come back as dicts ordered by date, then priority.
+    """
+    cur.execute(queries.SERIES_IN_WINDOW, {'user_id': user_id, 'start': start, 'end': end})
+    series = models.fetch_all(cur, models.Series)
+    if tag_filter:
+        matches = all if tag_match == 'all' else any
+        series = [s for s in series if matches(tag in s.tags for tag in tag_filter)]
+    if not series:
+        return []
+
+    cur.execute(queries.SERIES_OVERRIDES, {'series_ids': [s.id for s in series], 'start': start, 'end': end})
+    covered = set(cur.fetchall())
+
+    result = []
+    for s in series:
+        for day in occurrences(s.frequency, s.every, s.starts_on, s.ends_on, start, end):
+            if (s.id, day) in covered:
+                continue
+            result.append({
+                'series_id': s.id,
+                'date': day,
+                'title': s.title,
+                'description': s.description,
+                'priority': s.priority,
+                'category': s.category,
+                'category_color': s.category_color,
+                'category_id': s.category_id,
+                'tags': s.tags,
+                'repeats': describe(s.frequency, s.every),
+            })
+    result.sort(key=lambda o: (o['date'], PRIORITIES.index(o['priority'])))
+    return result
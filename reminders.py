@@ -0,0 +1,213 @@
+# reminders.py - Send reminders for todos coming due
+#
+# A worker claims a batch of open todos that are due within
+# REMINDER_LEAD_DAYS (or overdue) and not yet reminded, marks them reminded
+# and commits, then hands the batch to the notifier, one message per user.
+# Claims use FOR UPDATE SKIP LOCKED, so any number of workers can run side
+# by side without two of them claiming the same todo. Because the claim is
+# committed before delivery, a todo is reminded at most once; a delivery the
+# notifier reports as failed is released for a later batch, and a worker
+# killed between claim and delivery drops that batch's reminders rather than
+# sending them twice. Changing a todo's due date through sync clears its
+# reminder.
+#
+# Claims read idx_todos_reminder_queue, which holds only todos still waiting
+# for a reminder, so a claim costs the same however large todo_items grows.
+# Run it as a worker (see Procfile and render.yaml) or from cron with --once:
+#
+#   python reminders.py [--once] [--batch-size 200] [--interval 60]
+#
+# Needs the PostgreSQL backend.
+import argparse
+import json
+import os
+import smtplib
+import sys
+import time
+from email.message import EmailMessage
+
+import models
+from db import get_db_connection
+
+# Remind this many days ahead of the due date (0: on the day)
+REMINDER_LEAD_DAYS = int(os.environ.get('REMINDER_LEAD_DAYS', '1'))
+# Todos overdue for longer than this are marked reminded without a message,
+# so a first run over old data does not flood anyone's inbox
+REMINDER_MAX_OVERDUE_DAYS = int(os.environ.get('REMINDER_MAX_OVERDUE_DAYS', '7'))
+# 'file' (development) or 'smtp'
+REMINDER_NOTIFIER = os.environ.get('REMINDER_NOTIFIER', 'file').lower()
+REMINDER_FILE = os.environ.get('REMINDER_FILE', 'reminders.log')
+
+SMTP_HOST = os.environ.get('SMTP_HOST', 'localhost')
+SMTP_PORT = int(os.environ.get('SMTP_PORT', '25'))
+SMTP_USER = os.environ.get('SMTP_USER')
+SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD')
+SMTP_STARTTLS = os.environ.get('SMTP_STARTTLS', '0') == '1'
+SMTP_FROM = os.environ.get('SMTP_FROM', 'todo-reminders@localhost')
+
+# Marks a batch of todos due by the lead date as reminded and returns them
+# with their owner's name and address. The owner lookups are per claimed row
+# on the primary key, so they stay cheap however many users there are.
+# Setting reminded_at is not a change as far as change_seq is concerned (see
+# schema.py), so a claim takes no todo_users locks. SKIP LOCKED never waits
+# on a row another worker holds, so the order rows are locked in does not
+# matter; earliest due first is the order the index already has.
+CLAIM_REMINDERS = '''
+    WITH batch AS (
+        SELECT id FROM todo_items
+        WHERE reminded_at IS NULL AND due_date IS NOT NULL AND status <> 'completed'
+          AND due_date <= CURRENT_DATE + %(lead_days)s
+        ORDER BY due_date, id
+        LIMIT %(limit)s
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE todo_items t SET reminded_at = CURRENT_TIMESTAMP
+    FROM batch
+    WHERE t.id = batch.id
+    RETURNING t.id, t.user_id,
+              (SELECT username FROM todo_users WHERE id = t.user_id),
+              (SELECT email FROM todo_users WHERE id = t.user_id),
+              t.title, t.due_date, t.priority,
+              t.due_date < CURRENT_DATE - %(max_overdue_days)s AS stale
+'''
+
+# Puts back reminders whose delivery failed
+RELEASE_REMINDERS = 'UPDATE todo_items SET reminded_at = NULL WHERE id = ANY(%s)'
+
+def message_text(reminders):
+    """Subject and body of one user's reminder message"""
+    if len(reminders) == 1:
+        subject = f"Reminder: {reminders[0].title} is due {reminders[0].due_date.isoformat()}"
+    else:
+        subject = f"Reminder: {len(reminders)} todos are due soon"
+    lines = [f"- {r.title} (due {r.due_date.isoformat()}, {r.priority} priority)" for r in reminders]
+    return subject, '\n'.join(lines) + '\n'
+
+class FileNotifier:
+    """Appends one JSON line per message to a file; for development and testing"""
+
+    def __init__(self, path=REMINDER_FILE):
+        self.path = path
+
+    def send(self, messages):
+        """Deliver {user_id: [Reminder, ...]}; returns the user ids that failed"""
+        try:
+            with open(self.path, 'a') as f:
+                for user_id, reminders in messages.items():
+                    subject, _ = message_text(reminders)
+                    f.write(json.dumps({'user_id': user_id, 'username': reminders[0].username,
+                                        'email': reminders[0].email, 'subject': subject,
+                                        'todos': [r.id for r in reminders]}) + '\n')
+        except OSError as e:
+            print(f"❌ Reminder file error: {e}")
+            return set(messages)
+        return set()
+
+class SmtpNotifier:
+    """Sends one email per user over a single SMTP connection per batch"""
+
+    def send(self, messages):
+        """Deliver {user_id: [Reminder, ...]}; returns the user ids that failed"""
+        # Without an address there is nobody to tell; those count as done
+        addressed = {user_id: reminders for user_id, reminders in messages.items() if reminders[0].email}
+        if not addressed:
+            return set()
+        failed = set()
+        try:
+            with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30) as smtp:
+                if SMTP_STARTTLS:
+                    smtp.starttls()
+                if SMTP_USER:
+                    smtp.login(SMTP_USER, SMTP_PASSWORD)
+                for user_id, reminders in addressed.items():
+                    subject, body = message_text(reminders)
+                    message = EmailMessage()
+                    message['From'] = SMTP_FROM
+                    message['To'] = reminders[0].email
+                    message['Subject'] = subject
+                    message.set_content(body)
+                    try:
+                        smtp.send_message(message)
+                    except smtplib.SMTPRecipientsRefused:
+                        # Retrying a refused address would only fail again
+                        print(f"⚠️ Reminder address refused for user {user_id}")
+                    except smtplib.SMTPException as e:
+                        print(f"❌ Reminder to user {user_id} failed: {e}")
+                        failed.add(user_id)
+        except (smtplib.SMTPException, OSError) as e:
+            print(f"❌ SMTP error: {e}")
+            return set(addressed)
+        return failed
+
+NOTIFIERS = {'file': FileNotifier, 'smtp': SmtpNotifier}
+
+def get_notifier():
+    if REMINDER_NOTIFIER not in NOTIFIERS:
+        raise ValueError(f"REMINDER_NOTIFIER must be one of {', '.join(NOTIFIERS)}, not {REMINDER_NOTIFIER!r}")
+    return NOTIFIERS[REMINDER_NOTIFIER]()
+
+def dispatch_batch(conn, notifier, batch_size):
+    """Claim and deliver one batch; returns (claimed, failed) todo counts"""
+    cur = conn.cursor()
+    cur.execute(CLAIM_REMINDERS, {'lead_days': REMINDER_LEAD_DAYS, 'limit': batch_size,
+                                  'max_overdue_days': REMINDER_MAX_OVERDUE_DAYS})
+    claimed = models.fetch_all(cur, models.Reminder)
+    conn.commit()
+
+    messages = {}
+    for reminder in claimed:
+        if not reminder.stale:
+            messages.setdefault(reminder.user_id, []).append(reminder)
+    failed = notifier.send(messages) if messages else set()
+
+    released = [reminder.id for user_id in failed for reminder in messages[user_id]]
+    if released:
+        cur.execute(RELEASE_REMINDERS, (released,))
+        conn.commit()
+    cur.close()
+    return len(claimed), len(released)
+
+def dispatch(notifier, batch_size=200):
+    """Send everything currently due; returns the number of todos claimed, or None on error"""
+    conn = get_db_connection()
+    if not conn:
+        print("❌ Cannot send reminders - no connection")
+        return None
+
+    total = 0
+    try:
+        with conn.cursor() as cur:
+            # Give up quickly rather than queue behind a long-running request
+            cur.execute("SET lock_timeout = '2s'")
+        while True:
+            claimed, failed = dispatch_batch(conn, notifier, batch_size)
+            total += claimed
+            if claimed:
+                print(f"🔵 Reminders: {total} todos claimed, {failed} released after failed delivery")
+            # A failed delivery waits for the next run instead of being retried at once
+            if claimed < batch_size or failed:
+                break
+        return total
+
+    except Exception as e:
+        print(f"❌ Reminder error: {e}")
+        conn.rollback()
+        return None
+
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Send reminders for todos coming due')
+    parser.add_argument('--once', action='store_true', help='send what is due now and exit')
+    parser.add_argument('--batch-size', type=int, default=200, help='todos claimed per transaction')
+    parser.add_argument('--interval', type=float, default=60, help='seconds between runs when not --once')
+    args = parser.parse_args()
+
+    notifier = get_notifier()
+    print(f"✅ Reminder worker started ({REMINDER_NOTIFIER}, {REMINDER_LEAD_DAYS} days ahead)")
+    while True:
+        sent = dispatch(notifier, args.batch_size)
+        if args.once:
+            sys.exit(1 if sent is None else 0)
+        time.sleep(args.interval)
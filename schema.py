@@ -0,0 +1,564 @@
+# schema.py - Table and index definitions for the todo app
+import re
+
+from db import get_db_connection
+
+# Enum labels are declared in dashboard display order, so sorting by the
+# column itself gives in_progress > pending > completed and high > medium > low
+# without a CASE expression. Each value takes 4 bytes instead of a VARCHAR.
+STATUSES = ('in_progress', 'pending', 'completed')
+PRIORITIES = ('high', 'medium', 'low')
+# What a member of someone else's category may do (see sharing.py)
+MEMBER_ROLES = ('viewer', 'editor')
+# Manual-order keys longer than this are rewritten by rebalance.py; part of
+# the idx_todos_rebalance predicate, so changing it means a new index
+REBALANCE_KEY_LENGTH = 12
+
+TYPES = [
+    f"""
+    DO $$ BEGIN
+        CREATE TYPE todo_status AS ENUM ({', '.join(repr(s) for s in STATUSES)});
+    EXCEPTION WHEN duplicate_object THEN NULL;
+    END $$
+    """,
+    f"""
+    DO $$ BEGIN
+        CREATE TYPE todo_priority AS ENUM ({', '.join(repr(p) for p in PRIORITIES)});
+    EXCEPTION WHEN duplicate_object THEN NULL;
+    END $$
+    """,
+]
+
+TABLES = [
+    # Users table
+    '''
+    CREATE TABLE IF NOT EXISTS todo_users (
+        id SERIAL PRIMARY KEY,
+        username VARCHAR(50) UNIQUE NOT NULL,
+        password VARCHAR(255) NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        change_seq BIGINT NOT NULL DEFAULT 0,
+        sync_floor BIGINT NOT NULL DEFAULT 0,
+        email VARCHAR(255),
+        timezone VARCHAR(64),
+        ical_token VARCHAR(64)
+    )
+    ''',
+    # Categories table
+    '''
+    CREATE TABLE IF NOT EXISTS todo_categories (
+        id SERIAL PRIMARY KEY,
+        user_id INTEGER REFERENCES todo_users(id) ON DELETE CASCADE,
+        name VARCHAR(100) NOT NULL,
+        color VARCHAR(7) DEFAULT '#667eea',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        change_seq BIGINT NOT NULL DEFAULT 0,
+        UNIQUE(user_id, name)
+    )
+    ''',
+    # People a category is shared with. The owner (todo_categories.user_id)
+    # is not listed; their todos and everyone's todos filed under the
+    # category are visible to all members, and editable by editors.
+    f'''
+    CREATE TABLE IF NOT EXISTS todo_category_members (
+        category_id INTEGER REFERENCES todo_categories(id) ON DELETE CASCADE,
+        user_id INTEGER REFERENCES todo_users(id) ON DELETE CASCADE,
+        role VARCHAR(10) NOT NULL CHECK (role IN ({', '.join(repr(r) for r in MEMBER_ROLES)})),
+        added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (category_id, user_id)
+    )
+    ''',
+    # Recurring todos: one row per series, expanded by recurrence.py
+    '''
+    CREATE TABLE IF NOT EXISTS todo_series (
+        id SERIAL PRIMARY KEY,
+        user_id INTEGER REFERENCES todo_users(id) ON DELETE CASCADE,
+        category_id INTEGER REFERENCES todo_categories(id) ON DELETE SET NULL,
+        title VARCHAR(255) NOT NULL,
+        description TEXT,
+        priority todo_priority NOT NULL DEFAULT 'medium',
+        tags TEXT[] NOT NULL DEFAULT '{}',
+        frequency VARCHAR(10) NOT NULL CHECK (frequency IN ('daily', 'weekly', 'monthly')),
+        every INTEGER NOT NULL DEFAULT 1 CHECK (every > 0),
+        starts_on DATE NOT NULL,
+        ends_on DATE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    # Skipped occurrences of a series
+    '''
+    CREATE TABLE IF NOT EXISTS todo_series_exceptions (
+        series_id INTEGER REFERENCES todo_series(id) ON DELETE CASCADE,
+        occurrence_date DATE NOT NULL,
+        PRIMARY KEY (series_id, occurrence_date)
+    )
+    ''',
+    # Todos table
+    '''
+    CREATE TABLE IF NOT EXISTS todo_items (
+        id SERIAL PRIMARY KEY,
+        user_id INTEGER REFERENCES todo_users(id) ON DELETE CASCADE,
+        category_id INTEGER REFERENCES todo_categories(id) ON DELETE SET NULL,
+        title VARCHAR(255) NOT NULL,
+        description TEXT,
+        priority todo_priority NOT NULL DEFAULT 'medium',
+        status todo_status NOT NULL DEFAULT 'pending',
+        due_date DATE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        completed_at TIMESTAMP,
+        change_seq BIGINT NOT NULL DEFAULT 0,
+        parent_id INTEGER REFERENCES todo_items(id) ON DELETE CASCADE,
+        subtask_total INTEGER NOT NULL DEFAULT 0,
+        subtask_done INTEGER NOT NULL DEFAULT 0,
+        tags TEXT[] NOT NULL DEFAULT '{}',
+        series_id INTEGER REFERENCES todo_series(id) ON DELETE SET NULL,
+        occurrence_date DATE,
+        reminded_at TIMESTAMP
+    )
+    ''',
+    # Completed todos moved out of todo_items by archive.py. Ids are kept so
+    # links to an archived todo stay meaningful.
+    '''
+    CREATE TABLE IF NOT EXISTS todo_items_archive (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER REFERENCES todo_users(id) ON DELETE CASCADE,
+        category_id INTEGER REFERENCES todo_categories(id) ON DELETE SET NULL,
+        title VARCHAR(255) NOT NULL,
+        description TEXT,
+        priority todo_priority NOT NULL,
+        status todo_status NOT NULL,
+        due_date DATE,
+        created_at TIMESTAMP,
+        updated_at TIMESTAMP,
+        completed_at TIMESTAMP,
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        parent_id INTEGER,
+        tags TEXT[] NOT NULL DEFAULT '{}',
+        series_id INTEGER,
+        occurrence_date DATE
+    )
+    ''',
+    # Deleted (and archived) todos, so sync clients learn about removals.
+    # archive.py prunes old ones and raises todo_users.sync_floor to match.
+    '''
+    CREATE TABLE IF NOT EXISTS todo_tombstones (
+        user_id INTEGER REFERENCES todo_users(id) ON DELETE CASCADE,
+        change_seq BIGINT NOT NULL,
+        todo_id INTEGER NOT NULL,
+        deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (user_id, change_seq)
+    )
+    ''',
+    # Daily rollups for the analytics page, kept current by the
+    # todo_items_daily_stats trigger. category_key is 0 for uncategorized.
+    # Deleting or archiving a todo leaves its counts in place: they are history.
+    '''
+    CREATE TABLE IF NOT EXISTS todo_daily_stats (
+        user_id INTEGER REFERENCES todo_users(id) ON DELETE CASCADE,
+        day DATE NOT NULL,
+        category_key INTEGER NOT NULL,
+        created INTEGER NOT NULL DEFAULT 0,
+        completed INTEGER NOT NULL DEFAULT 0,
+        completed_late INTEGER NOT NULL DEFAULT 0,
+        completion_seconds BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, day, category_key)
+    )
+    ''',
+]
+
+# Columns added after the first release. ADD COLUMN with no default or a
+# constant one only touches the catalog, but ALTER TABLE takes an ACCESS
+# EXCLUSIVE lock even when IF NOT EXISTS makes it a no-op, so
+# create_schema() runs only the ones pending_columns() finds missing.
+COLUMNS = [
+    'ALTER TABLE todo_items ADD COLUMN IF NOT EXISTS completed_at TIMESTAMP',
+    # Delta sync: every change takes the next value of the user's counter
+    'ALTER TABLE todo_users ADD COLUMN IF NOT EXISTS change_seq BIGINT NOT NULL DEFAULT 0',
+    'ALTER TABLE todo_users ADD COLUMN IF NOT EXISTS sync_floor BIGINT NOT NULL DEFAULT 0',
+    'ALTER TABLE todo_items ADD COLUMN IF NOT EXISTS change_seq BIGINT NOT NULL DEFAULT 0',
+    'ALTER TABLE todo_categories ADD COLUMN IF NOT EXISTS change_seq BIGINT NOT NULL DEFAULT 0',
+    # Subtasks: deleting a todo deletes its whole subtree. The counters cover
+    # direct children and are kept by the todo_items_subtask_counts trigger.
+    'ALTER TABLE todo_items ADD COLUMN IF NOT EXISTS parent_id INTEGER REFERENCES todo_items(id) ON DELETE CASCADE',
+    'ALTER TABLE todo_items ADD COLUMN IF NOT EXISTS subtask_total INTEGER NOT NULL DEFAULT 0',
+    'ALTER TABLE todo_items ADD COLUMN IF NOT EXISTS subtask_done INTEGER NOT NULL DEFAULT 0',
+    'ALTER TABLE todo_items_archive ADD COLUMN IF NOT EXISTS parent_id INTEGER',
+    # Tags (see tags.py)
+    "ALTER TABLE todo_items ADD COLUMN IF NOT EXISTS tags TEXT[] NOT NULL DEFAULT '{}'",
+    "ALTER TABLE todo_items_archive ADD COLUMN IF NOT EXISTS tags TEXT[] NOT NULL DEFAULT '{}'",
+    # Occurrences of a series that were started or completed (see recurrence.py)
+    'ALTER TABLE todo_items ADD COLUMN IF NOT EXISTS series_id INTEGER REFERENCES todo_series(id) ON DELETE SET NULL',
+    'ALTER TABLE todo_items ADD COLUMN IF NOT EXISTS occurrence_date DATE',
+    'ALTER TABLE todo_items_archive ADD COLUMN IF NOT EXISTS series_id INTEGER',
+    'ALTER TABLE todo_items_archive ADD COLUMN IF NOT EXISTS occurrence_date DATE',
+    # Manual order (see positions.py). The "C" collation compares keys byte
+    # by byte, as Python compares the strings that generated them.
+    'ALTER TABLE todo_items ADD COLUMN IF NOT EXISTS position_key TEXT COLLATE "C"',
+    # Due-date reminders (see reminders.py): where to send them, and which
+    # todos have had theirs
+    'ALTER TABLE todo_users ADD COLUMN IF NOT EXISTS email VARCHAR(255)',
+    'ALTER TABLE todo_items ADD COLUMN IF NOT EXISTS reminded_at TIMESTAMP',
+    # IANA zone the agenda's "today" is computed in; NULL for agenda.DEFAULT_TIMEZONE
+    'ALTER TABLE todo_users ADD COLUMN IF NOT EXISTS timezone VARCHAR(64)',
+    # Calendar feed (see ical.py): the secret in its URL
+    'ALTER TABLE todo_users ADD COLUMN IF NOT EXISTS ical_token VARCHAR(64)',
+    # The feed's Last-Modified, from the transaction start in whole seconds:
+    # it could trail a change, so clients got 304s for feeds that had changed.
+    # The change_seq ETag alone decides now.
+    'ALTER TABLE todo_users DROP COLUMN IF EXISTS changed_at',
+]
+
+def create_trigger_once(name, table, definition):
+    """CREATE TRIGGER only if missing, so restarts never lock the table to replace it"""
+    return f'''
+    DO $$ BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = '{name}' AND tgrelid = '{table}'::regclass) THEN
+            CREATE TRIGGER {name} {definition};
+        END IF;
+    END $$
+    '''
+
+# Bumping todo_users.change_seq locks the user's row until commit, so a
+# user's changes are numbered in commit order and a sync client that has
+# seen seq N has seen everything up to N. Updates that only touch
+# bookkeeping columns nobody syncs (CHANGE_SEQ_IGNORED) are not changes:
+# migrate_enums.py's backfill and reminders.py's claims must not make every
+# client download those todos again, nor lock their owners' rows.
+CHANGE_SEQ_IGNORED = ('change_seq', 'status_v2', 'priority_v2', 'reminded_at')
+
+TRIGGERS = [
+    f'''
+    CREATE OR REPLACE FUNCTION todo_bump_change_seq() RETURNS trigger AS $$
+    DECLARE
+        seq BIGINT;
+    BEGIN
+        IF TG_OP = 'UPDATE' AND to_jsonb(NEW) - '{{{','.join(CHANGE_SEQ_IGNORED)}}}'::text[]
+                                = to_jsonb(OLD) - '{{{','.join(CHANGE_SEQ_IGNORED)}}}'::text[] THEN
+            RETURN NEW;
+        END IF;
+        UPDATE todo_users SET change_seq = change_seq + 1
+        WHERE id = NEW.user_id
+        RETURNING change_seq INTO seq;
+        NEW.change_seq := COALESCE(seq, NEW.change_seq);
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    ''',
+    '''
+    CREATE OR REPLACE FUNCTION todo_items_tombstone() RETURNS trigger AS $$
+    DECLARE
+        seq BIGINT;
+    BEGIN
+        UPDATE todo_users SET change_seq = change_seq + 1
+        WHERE id = OLD.user_id
+        RETURNING change_seq INTO seq;
+        -- No row when the whole user is being deleted
+        IF seq IS NOT NULL THEN
+            INSERT INTO todo_tombstones (user_id, change_seq, todo_id) VALUES (OLD.user_id, seq, OLD.id);
+        END IF;
+        RETURN OLD;
+    END
+    $$ LANGUAGE plpgsql
+    ''',
+    # Adds (sign=1) or removes (sign=-1) one todo's share of the daily rollups
+    '''
+    CREATE OR REPLACE FUNCTION todo_daily_stats_add(p_user INTEGER, p_category INTEGER, p_created TIMESTAMP,
+                                                    p_completed TIMESTAMP, p_due DATE, p_sign INTEGER)
+    RETURNS void AS $$
+    BEGIN
+        IF p_user IS NULL THEN
+            RETURN;
+        END IF;
+        IF p_created IS NOT NULL THEN
+            INSERT INTO todo_daily_stats (user_id, day, category_key, created)
+            VALUES (p_user, p_created::date, COALESCE(p_category, 0), p_sign)
+            ON CONFLICT (user_id, day, category_key)
+            DO UPDATE SET created = todo_daily_stats.created + EXCLUDED.created;
+        END IF;
+        IF p_completed IS NOT NULL THEN
+            INSERT INTO todo_daily_stats (user_id, day, category_key, completed, completed_late, completion_seconds)
+            VALUES (p_user, p_completed::date, COALESCE(p_category, 0), p_sign,
+                    p_sign * COALESCE((p_due < p_completed::date)::int, 0),
+                    p_sign * COALESCE(EXTRACT(EPOCH FROM p_completed - p_created)::bigint, 0))
+            ON CONFLICT (user_id, day, category_key)
+            DO UPDATE SET completed = todo_daily_stats.completed + EXCLUDED.completed,
+                          completed_late = todo_daily_stats.completed_late + EXCLUDED.completed_late,
+                          completion_seconds = todo_daily_stats.completion_seconds + EXCLUDED.completion_seconds;
+        END IF;
+    END
+    $$ LANGUAGE plpgsql
+    ''',
+    '''
+    CREATE OR REPLACE FUNCTION todo_items_daily_stats() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'UPDATE' THEN
+            -- Title, priority and in-progress edits leave every count where it is
+            IF (OLD.user_id, OLD.category_id, OLD.created_at, OLD.completed_at, OLD.due_date)
+               IS NOT DISTINCT FROM (NEW.user_id, NEW.category_id, NEW.created_at, NEW.completed_at, NEW.due_date) THEN
+                RETURN NULL;
+            END IF;
+            PERFORM todo_daily_stats_add(OLD.user_id, OLD.category_id, OLD.created_at,
+                                         OLD.completed_at, OLD.due_date, -1);
+        END IF;
+        PERFORM todo_daily_stats_add(NEW.user_id, NEW.category_id, NEW.created_at,
+                                     NEW.completed_at, NEW.due_date, 1);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    ''',
+    # Keeps a parent's subtask_total/subtask_done in step with its direct
+    # children, so showing progress never counts them. The parent's own row
+    # update bumps its change_seq, so sync clients see the new counts too.
+    '''
+    CREATE OR REPLACE FUNCTION todo_items_subtask_counts() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'UPDATE' THEN
+            IF (OLD.parent_id, OLD.status) IS NOT DISTINCT FROM (NEW.parent_id, NEW.status) THEN
+                RETURN NULL;
+            END IF;
+        END IF;
+        IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.parent_id IS NOT NULL THEN
+            UPDATE todo_items
+            SET subtask_total = subtask_total - 1,
+                subtask_done = subtask_done - (OLD.status = 'completed')::int
+            WHERE id = OLD.parent_id;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.parent_id IS NOT NULL THEN
+            UPDATE todo_items
+            SET subtask_total = subtask_total + 1,
+                subtask_done = subtask_done + (NEW.status = 'completed')::int
+            WHERE id = NEW.parent_id;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    ''',
+    # Deleting a stored occurrence must not bring the virtual one back, so
+    # upcoming dates become exceptions. Past dates are never expanded again.
+    '''
+    CREATE OR REPLACE FUNCTION todo_items_series_exception() RETURNS trigger AS $$
+    BEGIN
+        IF OLD.series_id IS NOT NULL AND OLD.occurrence_date >= CURRENT_DATE THEN
+            INSERT INTO todo_series_exceptions (series_id, occurrence_date)
+            VALUES (OLD.series_id, OLD.occurrence_date)
+            ON CONFLICT DO NOTHING;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    ''',
+    create_trigger_once('todo_items_change_seq', 'todo_items',
+                        'BEFORE INSERT OR UPDATE ON todo_items FOR EACH ROW EXECUTE FUNCTION todo_bump_change_seq()'),
+    create_trigger_once('todo_categories_change_seq', 'todo_categories',
+                        'BEFORE INSERT OR UPDATE ON todo_categories FOR EACH ROW EXECUTE FUNCTION todo_bump_change_seq()'),
+    create_trigger_once('todo_items_tombstone', 'todo_items',
+                        'AFTER DELETE ON todo_items FOR EACH ROW EXECUTE FUNCTION todo_items_tombstone()'),
+    create_trigger_once('todo_items_daily_stats', 'todo_items',
+                        'AFTER INSERT OR UPDATE ON todo_items FOR EACH ROW EXECUTE FUNCTION todo_items_daily_stats()'),
+    create_trigger_once('todo_items_subtask_counts', 'todo_items',
+                        'AFTER INSERT OR DELETE OR UPDATE OF parent_id, status ON todo_items '
+                        'FOR EACH ROW EXECUTE FUNCTION todo_items_subtask_counts()'),
+    create_trigger_once('todo_items_series_exception', 'todo_items',
+                        'AFTER DELETE ON todo_items FOR EACH ROW EXECUTE FUNCTION todo_items_series_exception()'),
+]
+
+# Indexes are shaped after the queries in queries.py; run `python plan_check.py`
+# after changing either side. init_db() builds them only in a new database:
+# on a populated todo_items a plain CREATE INDEX blocks writes for the whole
+# build, so existing databases get them from migrate_indexes.py.
+INDEXES = [
+    # Replaced by the composite per-user indexes below: a bare user_id index
+    # is a prefix of them, and status alone has only three distinct values.
+    'DROP INDEX IF EXISTS idx_todos_user_id',
+    'DROP INDEX IF EXISTS idx_todos_status',
+    # CASE-expression ordering index from before the enums, the stats index
+    # that became a prefix of the ordering index, and the ordering index from
+    # before subtasks were left off the dashboard
+    'DROP INDEX IF EXISTS idx_todos_user_sort',
+    'DROP INDEX IF EXISTS idx_todos_user_status',
+    'DROP INDEX IF EXISTS idx_todos_user_order',
+    # Reminder claims by due date alone, then by (user_id, id), which had
+    # every claim walk the todos due months from now as well
+    'DROP INDEX IF EXISTS idx_todos_reminder_due',
+    'DROP INDEX IF EXISTS idx_todos_reminder_claim',
+
+    # Dashboard list and stats: the enum order is the display order, so each
+    # user's top-level todos are read straight off the index without a sort step
+    '''
+    CREATE INDEX IF NOT EXISTS idx_todos_user_top_order
+    ON todo_items (user_id, status, priority, created_at DESC)
+    WHERE parent_id IS NULL
+    ''',
+    # The dashboard in manual order, read straight off the index like the one above
+    '''
+    CREATE INDEX IF NOT EXISTS idx_todos_user_manual_order
+    ON todo_items (user_id, position_key, created_at DESC)
+    WHERE parent_id IS NULL
+    ''',
+    # Only the few todos rebalance.py has to rekey
+    f'''
+    CREATE INDEX IF NOT EXISTS idx_todos_rebalance ON todo_items (user_id)
+    WHERE parent_id IS NULL AND (position_key IS NULL OR length(position_key) > {REBALANCE_KEY_LENGTH})
+    ''',
+    # Subtree loading walks parent -> children; also serves the ON DELETE CASCADE
+    'CREATE INDEX IF NOT EXISTS idx_todos_parent_id ON todo_items (parent_id) WHERE parent_id IS NOT NULL',
+    # Open work only; completed todos pile up and are never looked up by due
+    # date. Serves the agenda and the overdue count.
+    '''
+    CREATE INDEX IF NOT EXISTS idx_todos_user_open_due ON todo_items (user_id, due_date)
+    WHERE status <> 'completed'
+    ''',
+    # Tag filters: && (any of) and @> (all of). The planner combines it with
+    # the per-user index when a tag is common across users.
+    'CREATE INDEX IF NOT EXISTS idx_todos_tags ON todo_items USING GIN (tags)',
+    # Foreign key lookups for ON DELETE SET NULL from todo_categories
+    'CREATE INDEX IF NOT EXISTS idx_todos_category_id ON todo_items (category_id)',
+
+    'CREATE INDEX IF NOT EXISTS idx_categories_user_id ON todo_categories(user_id)',
+    # Calendar feed lookups by their secret
+    '''
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_users_ical_token ON todo_users (ical_token)
+    WHERE ical_token IS NOT NULL
+    ''',
+    # Categories shared with a user; the primary key serves the other direction
+    'CREATE INDEX IF NOT EXISTS idx_category_members_user_id ON todo_category_members (user_id)',
+
+    # Reminder claims, earliest due first. Only todos still waiting for a
+    # reminder are in it, and a claim reads no further than the lead date:
+    # claiming one or completing it drops it out, so a claim costs the same
+    # however large todo_items grows.
+    '''
+    CREATE INDEX IF NOT EXISTS idx_todos_reminder_queue ON todo_items (due_date, id)
+    WHERE reminded_at IS NULL AND due_date IS NOT NULL AND status <> 'completed'
+    ''',
+
+    # Archive job: oldest completed todos first
+    '''
+    CREATE INDEX IF NOT EXISTS idx_todos_completed_at ON todo_items (completed_at)
+    WHERE status = 'completed'
+    ''',
+    # History view, newest first, paged by (completed_at, id)
+    '''
+    CREATE INDEX IF NOT EXISTS idx_archive_user_completed
+    ON todo_items_archive (user_id, completed_at DESC, id DESC)
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_archive_category_id ON todo_items_archive (category_id)',
+    # Delta sync: a user's changes after a cursor, in change order
+    'CREATE INDEX IF NOT EXISTS idx_todos_user_change_seq ON todo_items (user_id, change_seq)',
+    # Recurring todos: a user's series, and the stored occurrences that
+    # cover a window's dates (also one per series and date)
+    'CREATE INDEX IF NOT EXISTS idx_series_user_id ON todo_series (user_id)',
+    'CREATE INDEX IF NOT EXISTS idx_series_category_id ON todo_series (category_id)',
+    '''
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_todos_series_occurrence ON todo_items (series_id, occurrence_date)
+    WHERE series_id IS NOT NULL
+    ''',
+    # Tombstone pruning in archive.py
+    'CREATE INDEX IF NOT EXISTS idx_tombstones_deleted_at ON todo_tombstones (deleted_at)',
+]
+
+INDEX_NAME = re.compile(r'INDEX IF (?:NOT )?EXISTS (\w+)')
+COLUMN_CHANGE = re.compile(r'ALTER TABLE (\w+) (ADD|DROP) COLUMN IF (?:NOT )?EXISTS (\w+)')
+
+def create_schema(cur, indexes=True):
+    """Create all types, tables, triggers and (unless indexes=False) indexes with the given cursor"""
+    for statement in TYPES + TABLES:
+        cur.execute(statement)
+    columns = pending_columns(cur)
+    if columns:
+        # Behind a long-running reader the ALTER would queue every other
+        # query on the table behind it; fail the start instead and retry
+        cur.execute("SET LOCAL lock_timeout = '5s'")
+        for statement in columns:
+            cur.execute(statement)
+    # Triggers are created only if missing (create_trigger_once), and
+    # replacing a function takes no lock on the tables that use it
+    for statement in TRIGGERS:
+        cur.execute(statement)
+    if indexes:
+        for statement in INDEXES:
+            cur.execute(statement)
+
+def pending_columns(cur):
+    """The COLUMNS statements the database still needs: columns to add that
+    are missing and columns to drop that are still there"""
+    cur.execute(
+        """SELECT table_name, column_name FROM information_schema.columns
+           WHERE table_schema = current_schema()"""
+    )
+    existing = set(cur.fetchall())
+    pending = []
+    for statement in COLUMNS:
+        table, action, column = COLUMN_CHANGE.search(statement).groups()
+        if ((table, column) in existing) != (action == 'ADD'):
+            pending.append(statement)
+    return pending
+
+def index_name(statement):
+    return INDEX_NAME.search(statement).group(1)
+
+def pending_indexes(cur):
+    """The INDEXES statements the database still needs: drops of indexes that
+    exist, and creates of indexes that are missing or left INVALID by a
+    failed concurrent build"""
+    pending = []
+    for statement in INDEXES:
+        cur.execute('SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)',
+                    (index_name(statement),))
+        row = cur.fetchone()
+        if statement.lstrip().startswith('DROP'):
+            if row:
+                pending.append(statement)
+        elif not row or not row[0]:
+            pending.append(statement)
+    return pending
+
+def needs_enum_migration(cur):
+    """True if todo_items predates the todo_status/todo_priority enums"""
+    cur.execute(
+        """SELECT data_type FROM information_schema.columns
+           WHERE table_schema = current_schema()
+             AND table_name = 'todo_items' AND column_name = 'status'"""
+    )
+    row = cur.fetchone()
+    return row is not None and row[0] != 'USER-DEFINED'
+
+def init_db():
+    """Initialize database tables if they don't exist"""
+    conn = get_db_connection()
+    if not conn:
+        print("❌ Cannot initialize database - no connection")
+        return False
+
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT to_regclass('todo_items') IS NULL")
+        new_database = cur.fetchone()[0]
+
+        print("🔵 Creating tables if not exist...")
+        create_schema(cur, indexes=new_database)
+
+        if not new_database and pending_indexes(cur):
+            print("⚠️ Index changes are pending - "
+                  "run `python migrate_indexes.py` to build them without blocking writes")
+
+        if needs_enum_migration(cur):
+            print("⚠️ todo_items still stores status/priority as VARCHAR - "
+                  "run `python migrate_enums.py` to convert it")
+            import queries
+            queries.use_text_enum_order()
+
+        conn.commit()
+        cur.close()
+        conn.close()
+
+        print("✅ Database tables initialized successfully")
+        return True
+
+    except Exception as e:
+        print(f"❌ Database initialization error: {e}")
+        if conn:
+            conn.rollback()
+            conn.close()
+        return False
@@ -0,0 +1,48 @@
+# sharing.py - Categories shared with other users
+#
+# A category's owner can add members as viewers (read only) or editors (add,
+# change and delete any todo filed under it). Queries that read or write
+# todos carry the permission check themselves, joined against
+# queries.CATEGORY_ROLES, so a dashboard costs the same number of queries
+# however many people its lists are shared with. Questions about a category
+# as a whole (may I file a todo here? manage its members?) go through
+# category_role(), which holds the user's roles in flask.g for the request.
+import heapq
+
+from flask import g, session
+
+from schema import MEMBER_ROLES, STATUSES, PRIORITIES
+from storage import queries
+
+ROLES = ('owner',) + MEMBER_ROLES
+
+def remember(categories):
+    """Fill this request's role cache from CATEGORIES_FOR_USER rows already fetched"""
+    g.category_roles = {category.id: category.role for category in categories}
+
+def category_roles(cur):
+    """{category_id: role} for the logged-in user, queried at most once per request"""
+    roles = g.get('category_roles')
+    if roles is None:
+        cur.execute(queries.CATEGORY_ROLES, {'user_id': session['user_id']})
+        roles = g.category_roles = dict(cur.fetchall())
+    return roles
+
+def category_role(cur, category_id):
+    """The user's role in a category, or None if they cannot see it"""
+    return category_roles(cur).get(category_id)
+
+def can_edit(role):
+    return role in ('owner', 'editor')
+
+def any_shared(categories):
+    """True if the dashboard needs queries.SHARED_TODOS at all"""
+    return any(category.shared for category in categories)
+
+def display_order(todo):
+    """Sort key matching the dashboard queries' ORDER BY"""
+    return STATUSES.index(todo.status), PRIORITIES.index(todo.priority), -todo.created_at.timestamp()
+
+def merge(own, shared):
+    """The user's todos and shared ones, both already in display order, as one list"""
+    return list(heapq.merge(own, shared, key=display_order))
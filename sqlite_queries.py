@@ -0,0 +1,265 @@
+# sqlite_queries.py - queries.py for the SQLite backend (sqlite_store.py)
+#
+# Same names, parameters and result columns as in queries.py, so routes run
+# unchanged on either backend; only the queries behind features SQLite
+# supports are here. Positional parameters are ?, named ones :name. Keep
+# these in step with the indexes in sqlite_store.py.
+from queries import DESCRIPTION_PREVIEW_LENGTH
+from sqlite_store import NOW, rank
+from schema import STATUSES, PRIORITIES, REBALANCE_KEY_LENGTH
+
+USER_BY_USERNAME = 'SELECT id, username, password, timezone FROM todo_users WHERE username = ?'
+
+USERNAME_TAKEN = 'SELECT id FROM todo_users WHERE username = ?'
+
+INSERT_USER = 'INSERT INTO todo_users (username, password, email) VALUES (?, ?, ?) RETURNING id'
+
+# The settings page
+# No calendar feed on SQLite, so never a feed token
+USER_SETTINGS = 'SELECT username, email, timezone, NULL AS ical_token FROM todo_users WHERE id = ?'
+
+UPDATE_USER_SETTINGS = '''
+    UPDATE todo_users SET email = :email, timezone = :timezone WHERE id = :user_id
+'''
+
+INSERT_CATEGORY = 'INSERT INTO todo_categories (user_id, name, color) VALUES (?, ?, ?) RETURNING id'
+
+CATEGORY_ROLES = '''
+    SELECT id AS category_id, 'owner' AS role FROM todo_categories WHERE user_id = :user_id
+    UNION ALL
+    SELECT category_id, role FROM todo_category_members WHERE user_id = :user_id
+'''
+
+EDITABLE_CATEGORIES = f"SELECT category_id FROM ({CATEGORY_ROLES}) WHERE role <> 'viewer'"
+
+SHARED_CATEGORY_ROLES = '''
+    SELECT id AS category_id, 'owner' AS role FROM todo_categories c
+    WHERE user_id = :user_id AND EXISTS (SELECT 1 FROM todo_category_members m WHERE m.category_id = c.id)
+    UNION ALL
+    SELECT category_id, role FROM todo_category_members WHERE user_id = :user_id
+'''
+
+CATEGORIES_FOR_USER = '''
+    SELECT c.id, c.name, c.color, 'owner' AS role,
+           EXISTS (SELECT 1 FROM todo_category_members m WHERE m.category_id = c.id) AS shared,
+           NULL AS owner
+    FROM todo_categories c
+    WHERE c.user_id = :user_id
+    UNION ALL
+    SELECT c.id, c.name, c.color, m.role, 1, u.username
+    FROM todo_category_members m
+    JOIN todo_categories c ON c.id = m.category_id
+    JOIN todo_users u ON u.id = c.user_id
+    WHERE m.user_id = :user_id
+    ORDER BY name
+'''
+
+CATEGORY_MEMBERS = '''
+    SELECT u.id, u.username, m.role, m.added_at
+    FROM todo_category_members m
+    JOIN todo_users u ON u.id = m.user_id
+    WHERE m.category_id = ?
+    ORDER BY u.username
+'''
+
+UPSERT_CATEGORY_MEMBER = '''
+    INSERT INTO todo_category_members (category_id, user_id, role)
+    SELECT c.id, u.id, :role
+    FROM todo_categories c, todo_users u
+    WHERE c.id = :category_id AND u.username = :username AND u.id <> c.user_id
+    ON CONFLICT (category_id, user_id) DO UPDATE SET role = excluded.role
+    RETURNING user_id
+'''
+
+DELETE_CATEGORY_MEMBER = 'DELETE FROM todo_category_members WHERE category_id = ? AND user_id = ?'
+
+DESCRIPTION_PREVIEW = f'substr(t.description, 1, {DESCRIPTION_PREVIEW_LENGTH + 1})'
+
+DASHBOARD_TODO_COLUMNS = f'''t.id, t.title, {DESCRIPTION_PREVIEW}, t.priority, t.status,
+           c.name, c.color, t.due_date, t.created_at, t.subtask_total, t.subtask_done,
+           t.tags, t.position_key, t.updated_at'''
+
+# The tag list parameter arrives as a JSON array (see sqlite_store.py)
+TAG_FILTERS = {
+    'any': ' AND EXISTS (SELECT 1 FROM json_each(t.tags) WHERE value IN (SELECT value FROM json_each(:tags)))',
+    'all': ' AND NOT EXISTS (SELECT 1 FROM json_each(:tags) WHERE value NOT IN (SELECT value FROM json_each(t.tags)))',
+}
+
+# The expressions match idx_todos_user_top_order's and
+# idx_todos_user_manual_order's, which keeps the sort off
+ORDER_BY = {
+    'priority': f"{rank('t.status', STATUSES)}, {rank('t.priority', PRIORITIES)}, t.created_at DESC",
+    'manual': 't.position_key IS NULL, t.position_key, t.created_at DESC',
+}
+
+def dashboard_todos(tag_filter='', order='priority'):
+    return f'''
+    SELECT {DASHBOARD_TODO_COLUMNS}, 'owner' AS role
+    FROM todo_items t
+    LEFT JOIN todo_categories c ON t.category_id = c.id
+    WHERE t.user_id = :user_id AND t.parent_id IS NULL{tag_filter}
+    ORDER BY {ORDER_BY[order]}
+'''
+
+def shared_todos(tag_filter=''):
+    return f'''
+    SELECT {DASHBOARD_TODO_COLUMNS}, s.role
+    FROM ({SHARED_CATEGORY_ROLES}) s
+    JOIN todo_items t ON t.category_id = s.category_id
+    JOIN todo_categories c ON c.id = s.category_id
+    WHERE t.user_id <> :user_id AND t.parent_id IS NULL{tag_filter}
+    ORDER BY {ORDER_BY['priority']}
+'''
+
+def dashboard_stats(tag_filter=''):
+    return f'''
+    SELECT
+        COUNT(*) as total,
+        SUM(CASE WHEN status = 'completed' THEN 1 ELSE 0 END) as completed,
+        SUM(CASE WHEN status = 'pending' THEN 1 ELSE 0 END) as pending,
+        SUM(CASE WHEN status = 'in_progress' THEN 1 ELSE 0 END) as in_progress
+    FROM todo_items t
+    WHERE t.user_id = :user_id AND t.parent_id IS NULL{tag_filter}
+'''
+
+DASHBOARD_TODOS = dashboard_todos()
+DASHBOARD_STATS = dashboard_stats()
+SHARED_TODOS = shared_todos()
+DASHBOARD_TODOS_TAGGED = {match: dashboard_todos(sql) for match, sql in TAG_FILTERS.items()}
+DASHBOARD_TODOS_MANUAL = dashboard_todos(order='manual')
+DASHBOARD_TODOS_MANUAL_TAGGED = {match: dashboard_todos(sql, 'manual') for match, sql in TAG_FILTERS.items()}
+DASHBOARD_STATS_TAGGED = {match: dashboard_stats(sql) for match, sql in TAG_FILTERS.items()}
+SHARED_TODOS_TAGGED = {match: shared_todos(sql) for match, sql in TAG_FILTERS.items()}
+
+DASHBOARD_TODO = f'''
+    SELECT {DASHBOARD_TODO_COLUMNS}, CASE WHEN t.user_id = :user_id THEN 'owner' ELSE r.role END
+    FROM todo_items t
+    LEFT JOIN todo_categories c ON t.category_id = c.id
+    LEFT JOIN ({CATEGORY_ROLES}) r ON r.category_id = t.category_id
+    WHERE t.id = :todo_id AND t.parent_id IS NULL AND (t.user_id = :user_id OR r.role IS NOT NULL)
+'''
+
+USER_TAGS = '''
+    SELECT tag.value, COUNT(*)
+    FROM todo_items t, json_each(t.tags) AS tag
+    WHERE t.user_id = ? AND t.parent_id IS NULL
+    GROUP BY tag.value
+    ORDER BY tag.value
+'''
+
+# Zero-padded ids make the text path sort like queries.TODO_TREE's id array
+TODO_TREE = f'''
+    WITH RECURSIVE tree AS (
+        SELECT t.id, t.title, {DESCRIPTION_PREVIEW} AS description, t.priority, t.status,
+               t.category_id, t.due_date, t.created_at, t.subtask_total, t.subtask_done, t.tags,
+               t.parent_id, t.user_id, 0 AS depth, printf('%010d', t.id) AS path
+        FROM todo_items t
+        WHERE (t.id = :root_id
+               AND (t.user_id = :user_id OR t.category_id IN (SELECT category_id FROM ({CATEGORY_ROLES}))))
+           OR (:root_id IS NULL AND t.user_id = :user_id AND t.parent_id IS NULL)
+        UNION ALL
+        SELECT c.id, c.title, substr(c.description, 1, {DESCRIPTION_PREVIEW_LENGTH + 1}), c.priority, c.status,
+               c.category_id, c.due_date, c.created_at, c.subtask_total, c.subtask_done, c.tags,
+               c.parent_id, c.user_id, tree.depth + 1, tree.path || '/' || printf('%010d', c.id)
+        FROM tree
+        JOIN todo_items c ON c.parent_id = tree.id
+        WHERE tree.depth < 100
+    )
+    SELECT tree.id, tree.title, tree.description, tree.priority, tree.status,
+           c.name, c.color, tree.due_date, tree.created_at, tree.subtask_total, tree.subtask_done,
+           tree.tags, tree.parent_id, tree.depth,
+           CASE WHEN tree.user_id = :user_id THEN 'owner' ELSE r.role END
+    FROM tree
+    LEFT JOIN ({CATEGORY_ROLES}) r ON r.category_id = tree.category_id
+    LEFT JOIN todo_categories c ON c.id = r.category_id
+    ORDER BY tree.path
+'''
+
+READABLE_TODO = f'(user_id = :user_id OR category_id IN (SELECT category_id FROM ({CATEGORY_ROLES})))'
+EDITABLE_TODO = f'(user_id = :user_id OR category_id IN ({EDITABLE_CATEGORIES}))'
+
+TODO_DESCRIPTION = f'SELECT description FROM todo_items WHERE id = :todo_id AND {READABLE_TODO}'
+
+EDITABLE_PARENT = f'SELECT id, category_id FROM todo_items WHERE id = :todo_id AND {EDITABLE_TODO}'
+
+INSERT_TODO = '''
+    INSERT INTO todo_items (user_id, title, description, priority, category_id, due_date, status, parent_id, tags,
+                            position_key)
+    VALUES (?, ?, ?, ?, ?, ?, 'pending', ?, ?, ?)
+    RETURNING id
+'''
+
+# SQLite has no row locks; a no-op write takes the database's write lock,
+# which serializes key handouts just the same
+LOCK_POSITIONS = 'UPDATE todo_users SET username = username WHERE id = ?'
+
+# Ordered like idx_todos_user_manual_order so the first index entry answers it
+FIRST_POSITION = '''
+    SELECT position_key FROM todo_items
+    WHERE user_id = ? AND parent_id IS NULL AND position_key IS NOT NULL
+    ORDER BY position_key IS NULL, position_key
+    LIMIT 1
+'''
+
+POSITIONS = '''
+    SELECT id, position_key FROM todo_items
+    WHERE id IN (SELECT value FROM json_each(:ids)) AND user_id = :user_id AND parent_id IS NULL
+'''
+
+MOVE_TODO = '''
+    UPDATE todo_items SET position_key = :key
+    WHERE id = :todo_id AND user_id = :user_id AND parent_id IS NULL
+'''
+
+MANUAL_ORDER_IDS = f'''
+    SELECT id FROM todo_items t
+    WHERE user_id = ? AND parent_id IS NULL
+    ORDER BY {ORDER_BY['manual']}
+'''
+
+SET_POSITIONS = '''
+    UPDATE todo_items SET position_key = k.value
+    FROM json_each(:ids) AS i JOIN json_each(:keys) AS k ON k.key = i.key
+    WHERE todo_items.id = i.value
+'''
+
+USERS_TO_REBALANCE = f'''
+    SELECT DISTINCT user_id FROM todo_items
+    WHERE parent_id IS NULL AND (position_key IS NULL OR length(position_key) > {REBALANCE_KEY_LENGTH})
+    LIMIT ?
+'''
+
+DUPLICATE_POSITION_USERS = '''
+    SELECT user_id FROM todo_items
+    WHERE parent_id IS NULL AND position_key IS NOT NULL
+    GROUP BY user_id, position_key
+    HAVING count(*) > 1
+'''
+
+UPDATE_TODO_STATUS = f'''
+    UPDATE todo_items
+    SET status = :status,
+        completed_at = CASE WHEN :status = 'completed' THEN COALESCE(completed_at, {NOW}) END,
+        updated_at = {NOW}
+    WHERE id = :todo_id AND {EDITABLE_TODO}
+    RETURNING parent_id, category_id
+'''
+
+UPDATE_TODO_TAGS = f'''
+    UPDATE todo_items SET tags = :tags, updated_at = {NOW}
+    WHERE id = :todo_id AND {EDITABLE_TODO}
+    RETURNING category_id
+'''
+
+DELETE_TODO = f'''
+    DELETE FROM todo_items WHERE id = :todo_id AND {EDITABLE_TODO}
+    RETURNING parent_id, category_id
+'''
+
+AGENDA_TODOS = f'''
+    SELECT t.id, t.title, t.priority, t.status, c.name, c.color, t.due_date, t.parent_id
+    FROM todo_items t
+    LEFT JOIN todo_categories c ON c.id = t.category_id
+    WHERE t.user_id = ? AND t.status <> 'completed' AND t.due_date IS NOT NULL
+    ORDER BY t.due_date, {rank('t.priority', PRIORITIES)}
+'''
@@ -0,0 +1,308 @@
+# sqlite_store.py - Embedded SQLite storage for single-node deployments
+#
+# Selected with STORAGE_BACKEND=sqlite (see storage.py). The whole database is
+# the file at SQLITE_PATH. WAL mode lets readers run alongside the one writer,
+# and each thread keeps one connection open for its lifetime, so there is no
+# pool, connection budget or circuit breaker to manage: opening the file is
+# the only thing that can fail.
+#
+# Covers accounts, categories and their sharing, todos, subtasks and tags.
+# Features built on PostgreSQL itself (LISTEN/NOTIFY, rollup and sync
+# triggers, SKIP LOCKED archiving, replicas) are switched off by storage.py
+# instead.
+import json
+import os
+import sqlite3
+import threading
+from datetime import date, datetime
+
+from schema import STATUSES, PRIORITIES, MEMBER_ROLES, REBALANCE_KEY_LENGTH
+
+SQLITE_PATH = os.environ.get('SQLITE_PATH', 'todo.db')
+# How long a write waits for another thread's write to finish
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+SQLITE_CACHE_KB = int(os.environ.get('SQLITE_CACHE_KB', 16384))
+
+PRAGMAS = [
+    'PRAGMA journal_mode = WAL',
+    # Durable at checkpoints rather than at every commit; WAL keeps the file
+    # consistent either way
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA foreign_keys = ON',
+    f'PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}',
+    f'PRAGMA cache_size = -{SQLITE_CACHE_KB}',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA mmap_size = 268435456',
+]
+
+# Columns come back as the same Python types psycopg2 returns. Tags are
+# stored as a JSON array in a column declared TAGS, and any list passed as a
+# parameter is written as one.
+sqlite3.register_converter('DATE', lambda value: date.fromisoformat(value.decode()))
+sqlite3.register_converter('TIMESTAMP', lambda value: datetime.fromisoformat(value.decode()))
+sqlite3.register_converter('TAGS', json.loads)
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(' '))
+sqlite3.register_adapter(list, json.dumps)
+
+# CURRENT_TIMESTAMP has whole seconds only; todos added in the same second
+# would tie in the dashboard's created_at order
+NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+def rank(column, labels):
+    """CASE expression giving each label its position, standing in for PostgreSQL's enum order"""
+    whens = ' '.join(f"WHEN '{label}' THEN {n}" for n, label in enumerate(labels))
+    return f'(CASE {column} {whens} END)'
+
+STATUS_RANK = rank('status', STATUSES)
+PRIORITY_RANK = rank('priority', PRIORITIES)
+
+def check_in(column, labels):
+    return f"CHECK ({column} IN ({', '.join(repr(label) for label in labels)}))"
+
+TABLES = [
+    f'''
+    CREATE TABLE IF NOT EXISTS todo_users (
+        id INTEGER PRIMARY KEY,
+        username VARCHAR(50) UNIQUE NOT NULL,
+        password VARCHAR(255) NOT NULL,
+        created_at TIMESTAMP DEFAULT ({NOW}),
+        email VARCHAR(255),
+        timezone VARCHAR(64)
+    )
+    ''',
+    f'''
+    CREATE TABLE IF NOT EXISTS todo_categories (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER REFERENCES todo_users(id) ON DELETE CASCADE,
+        name VARCHAR(100) NOT NULL,
+        color VARCHAR(7) DEFAULT '#667eea',
+        created_at TIMESTAMP DEFAULT ({NOW}),
+        UNIQUE(user_id, name)
+    )
+    ''',
+    f'''
+    CREATE TABLE IF NOT EXISTS todo_items (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER REFERENCES todo_users(id) ON DELETE CASCADE,
+        category_id INTEGER REFERENCES todo_categories(id) ON DELETE SET NULL,
+        title VARCHAR(255) NOT NULL,
+        description TEXT,
+        priority TEXT NOT NULL DEFAULT 'medium' {check_in('priority', PRIORITIES)},
+        status TEXT NOT NULL DEFAULT 'pending' {check_in('status', STATUSES)},
+        due_date DATE,
+        created_at TIMESTAMP DEFAULT ({NOW}),
+        updated_at TIMESTAMP DEFAULT ({NOW}),
+        completed_at TIMESTAMP,
+        parent_id INTEGER REFERENCES todo_items(id) ON DELETE CASCADE,
+        subtask_total INTEGER NOT NULL DEFAULT 0,
+        subtask_done INTEGER NOT NULL DEFAULT 0,
+        tags TAGS NOT NULL DEFAULT '[]',
+        position_key TEXT
+    )
+    ''',
+    f'''
+    CREATE TABLE IF NOT EXISTS todo_category_members (
+        category_id INTEGER REFERENCES todo_categories(id) ON DELETE CASCADE,
+        user_id INTEGER REFERENCES todo_users(id) ON DELETE CASCADE,
+        role TEXT NOT NULL {check_in('role', MEMBER_ROLES)},
+        added_at TIMESTAMP DEFAULT ({NOW}),
+        PRIMARY KEY (category_id, user_id)
+    )
+    ''',
+]
+
+# Columns added since the first SQLite release, as (table, column, definition).
+# SQLite has no ADD COLUMN IF NOT EXISTS, so init_db() checks table_info.
+COLUMNS = [
+    ('todo_items', 'position_key', 'TEXT'),
+    ('todo_users', 'email', 'VARCHAR(255)'),
+    ('todo_users', 'timezone', 'VARCHAR(64)'),
+]
+
+# The todo_items_subtask_counts trigger of schema.py, one trigger per event
+TRIGGERS = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS todo_items_subtask_insert
+    AFTER INSERT ON todo_items FOR EACH ROW WHEN NEW.parent_id IS NOT NULL
+    BEGIN
+        UPDATE todo_items
+        SET subtask_total = subtask_total + 1,
+            subtask_done = subtask_done + (NEW.status = 'completed')
+        WHERE id = NEW.parent_id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS todo_items_subtask_delete
+    AFTER DELETE ON todo_items FOR EACH ROW WHEN OLD.parent_id IS NOT NULL
+    BEGIN
+        UPDATE todo_items
+        SET subtask_total = subtask_total - 1,
+            subtask_done = subtask_done - (OLD.status = 'completed')
+        WHERE id = OLD.parent_id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS todo_items_subtask_update
+    AFTER UPDATE OF parent_id, status ON todo_items FOR EACH ROW
+    WHEN OLD.parent_id IS NOT NEW.parent_id OR OLD.status IS NOT NEW.status
+    BEGIN
+        UPDATE todo_items
+        SET subtask_total = subtask_total - 1,
+            subtask_done = subtask_done - (OLD.status = 'completed')
+        WHERE id = OLD.parent_id;
+        UPDATE todo_items
+        SET subtask_total = subtask_total + 1,
+            subtask_done = subtask_done + (NEW.status = 'completed')
+        WHERE id = NEW.parent_id;
+    END
+    ''',
+]
+
+# Shaped after sqlite_queries.py like schema.INDEXES after queries.py. The
+# dashboard's ORDER BY uses the same rank expressions, so it reads the index
+# in order instead of sorting.
+INDEXES = [
+    f'''
+    CREATE INDEX IF NOT EXISTS idx_todos_user_top_order
+    ON todo_items (user_id, {STATUS_RANK}, {PRIORITY_RANK}, created_at DESC)
+    WHERE parent_id IS NULL
+    ''',
+    # SQLite puts NULLs first, so todos without a key yet are sent last by
+    # hand, as PostgreSQL does by default
+    '''
+    CREATE INDEX IF NOT EXISTS idx_todos_user_manual_order
+    ON todo_items (user_id, position_key IS NULL, position_key, created_at DESC)
+    WHERE parent_id IS NULL
+    ''',
+    f'''
+    CREATE INDEX IF NOT EXISTS idx_todos_rebalance ON todo_items (user_id)
+    WHERE parent_id IS NULL AND (position_key IS NULL OR length(position_key) > {REBALANCE_KEY_LENGTH})
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_todos_parent_id ON todo_items (parent_id) WHERE parent_id IS NOT NULL',
+    # The agenda: a user's open todos by due date
+    '''
+    CREATE INDEX IF NOT EXISTS idx_todos_user_open_due ON todo_items (user_id, due_date)
+    WHERE status <> 'completed'
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_todos_category_id ON todo_items (category_id)',
+    'CREATE INDEX IF NOT EXISTS idx_category_members_user_id ON todo_category_members (user_id)',
+]
+
+class BufferedCursor:
+    """A sqlite3 cursor that reads each result in full on execute(), as psycopg2's do
+
+    An INSERT ... RETURNING that was only read with fetchone() would
+    otherwise still be running, and SQLite refuses to commit past it.
+    """
+
+    def __init__(self, raw):
+        self._raw = raw
+        self._rows = iter(())
+        self.rowcount = -1
+
+    def execute(self, sql, params=()):
+        self._raw.execute(sql, params)
+        self._rows = iter(self._raw.fetchall())
+        self.rowcount = self._raw.rowcount
+        return self
+
+    def fetchone(self):
+        return next(self._rows, None)
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def __iter__(self):
+        return self._rows
+
+    @property
+    def description(self):
+        return self._raw.description
+
+    def close(self):
+        self._raw.close()
+
+class ThreadConnection:
+    """This thread's SQLite connection, lent out like db.PooledConnection
+
+    close() rolls back anything left uncommitted and keeps the connection
+    open for the thread's next request.
+    """
+
+    def __init__(self, raw):
+        self._raw = raw
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def cursor(self):
+        return BufferedCursor(self._raw.cursor())
+
+    def close(self):
+        self._raw.rollback()
+
+_local = threading.local()
+
+def connect():
+    """Open SQLITE_PATH with the pragmas applied"""
+    conn = sqlite3.connect(SQLITE_PATH, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+                           detect_types=sqlite3.PARSE_DECLTYPES)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+def get_db_connection(readonly=False):
+    """This thread's connection, opened on first use; None if the file cannot be opened
+
+    readonly is accepted for symmetry with db.get_db_connection; there are
+    no replicas to send reads to.
+    """
+    raw = getattr(_local, 'conn', None)
+    if raw is None:
+        try:
+            raw = _local.conn = connect()
+        except sqlite3.Error as e:
+            print(f"❌ SQLite connection error: {e}")
+            return None
+    return ThreadConnection(raw)
+
+def close_connection():
+    """Close this thread's connection, if it opened one"""
+    raw = getattr(_local, 'conn', None)
+    if raw is not None:
+        _local.conn = None
+        raw.close()
+
+def add_missing_columns(cur):
+    for table, column, definition in COLUMNS:
+        cur.execute(f'PRAGMA table_info({table})')
+        if column not in {row[1] for row in cur.fetchall()}:
+            cur.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+def init_db():
+    """Create tables, triggers and indexes if they don't exist"""
+    conn = get_db_connection()
+    if not conn:
+        print("❌ Cannot initialize database - no connection")
+        return False
+
+    try:
+        cur = conn.cursor()
+        print(f"🔵 Creating SQLite tables if not exist in {SQLITE_PATH}...")
+        for statement in TABLES:
+            cur.execute(statement)
+        add_missing_columns(cur)
+        for statement in TRIGGERS + INDEXES:
+            cur.execute(statement)
+        conn.commit()
+        cur.close()
+        conn.close()
+
+        print("✅ Database tables initialized successfully")
+        return True
+
+    except sqlite3.Error as e:
+        print(f"❌ Database initialization error: {e}")
+        conn.close()
+        return False
@@ -0,0 +1,56 @@
+# startup_report.py - Measure cold-start cost of the app
+#
+# Imports app.py in fresh interpreters, the way a serverless cold start does,
+# and times the import plus the first request, with and without lazy DB init.
+#
+#   python startup_report.py [--runs 5] [--path /login]
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROBE = '''
+import contextlib, io, json, sys, time
+started = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+    import app
+    imported = time.perf_counter()
+    app.app.test_client().get(sys.argv[1])
+finished = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'first_request_ms': (finished - imported) * 1000,
+    'db_init_ms': app.startup_report['db_init_ms'] or 0,
+}))
+'''
+
+def measure(lazy, path, runs):
+    env = dict(os.environ, LAZY_DB_INIT='1' if lazy else '0')
+    samples = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, '-c', PROBE, path],
+            capture_output=True, text=True, env=env,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+        if result.returncode != 0:
+            print(result.stderr)
+            sys.exit(1)
+        samples.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    return {key: statistics.median(s[key] for s in samples) for key in samples[0]}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time app import and first request in fresh processes')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--path', default='/login', help='first request to send')
+    args = parser.parse_args()
+
+    print(f"🚀 Cold start, median of {args.runs} runs, first request {args.path}\n")
+    print(f"{'mode':<8} {'import':>10} {'first req':>10} {'db init':>10} {'total':>10}")
+    for lazy in (False, True):
+        m = measure(lazy, args.path, args.runs)
+        total = m['import_ms'] + m['first_request_ms']
+        print(f"{'lazy' if lazy else 'eager':<8} {m['import_ms']:>8.1f}ms {m['first_request_ms']:>8.1f}ms "
+              f"{m['db_init_ms']:>8.1f}ms {total:>8.1f}ms")
@@ -0,0 +1,41 @@
+# storage.py - Pick the storage backend: PostgreSQL (default) or embedded SQLite
+#
+#   STORAGE_BACKEND=postgres   db.py + schema.py + queries.py
+#   STORAGE_BACKEND=sqlite     sqlite_store.py + sqlite_queries.py
+#
+# app.py reaches the database only through get_db_connection(), init_db()
+# and the `queries` module exported here, and asks supports() before using
+# anything the chosen backend cannot do.
+import os
+import sqlite3
+
+import psycopg2
+
+BACKEND = os.environ.get('STORAGE_BACKEND', 'postgres').lower()
+
+# Everything that needs more of the database than tables, indexes and plain
+# triggers: LISTEN/NOTIFY, the sync and analytics triggers, SKIP LOCKED
+# batching (archive, reminders), read replicas, the change_seq behind the
+# calendar feed's ETag
+POSTGRES_ONLY = frozenset({'realtime', 'sync', 'analytics', 'archive', 'recurrence', 'group_commit', 'replicas',
+                           'reminders', 'calendar'})
+
+if BACKEND == 'sqlite':
+    import sqlite_queries as queries
+    import sqlite_store
+    get_db_connection = sqlite_store.get_db_connection
+    init_db = sqlite_store.init_db
+    IntegrityError = sqlite3.IntegrityError
+    FEATURES = frozenset()
+elif BACKEND == 'postgres':
+    import queries
+    from db import get_db_connection
+    from schema import init_db
+    IntegrityError = psycopg2.IntegrityError
+    FEATURES = POSTGRES_ONLY
+else:
+    raise ValueError(f"STORAGE_BACKEND must be 'postgres' or 'sqlite', not {BACKEND!r}")
+
+def supports(feature):
+    """True if the configured backend provides `feature` (one of POSTGRES_ONLY)"""
+    return feature in FEATURES
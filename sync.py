@@ -0,0 +1,238 @@
+# sync.py - Delta sync for offline and mobile clients
+#
+# Every change to a user's todos and categories takes the next value of that
+# user's todo_users.change_seq (see TRIGGERS in schema.py), and a deleted todo
+# leaves a tombstone with a seq of its own. A client keeps the cursor it was
+# last given and asks only for what came after it, so a sync costs as much as
+# the change rather than the whole list.
+#
+# Queued offline edits carry the cursor they were made against (base_seq). An
+# edit to a todo that has changed on the server since then is not applied;
+# the client gets the server's copy back as a conflict to resolve.
+from datetime import date
+
+import psycopg2
+
+import models
+import queries
+import realtime
+import tags
+from schema import PRIORITIES, STATUSES
+
+MAX_MUTATIONS = 500
+TODO_FIELDS = ('title', 'description', 'priority', 'status', 'category_id', 'due_date', 'parent_id', 'tags')
+
+class MutationError(ValueError):
+    """A queued mutation that can never be applied as sent"""
+
+def optional_int(value):
+    # JSON true/false arrive as bool, which is an int subclass
+    return value is None or (isinstance(value, int) and not isinstance(value, bool))
+
+def iso(value):
+    return value.isoformat() if value else None
+
+def todo_json(todo):
+    """A models.SyncTodo as JSON"""
+    return {
+        'id': todo.id,
+        'title': todo.title,
+        'description': todo.description,
+        'priority': todo.priority,
+        'status': todo.status,
+        'category_id': todo.category_id,
+        'due_date': iso(todo.due_date),
+        'created_at': iso(todo.created_at),
+        'updated_at': iso(todo.updated_at),
+        'completed_at': iso(todo.completed_at),
+        'change_seq': todo.change_seq,
+        'parent_id': todo.parent_id,
+        'subtask_total': todo.subtask_total,
+        'subtask_done': todo.subtask_done,
+        'tags': todo.tags
+    }
+
+def changes_since(cur, user_id, since, limit):
+    """Todos, categories and deletions after cursor `since`, oldest first
+
+    since=None asks for everything. A cursor older than the oldest pruned
+    tombstone cannot be served incrementally either, so the answer is then
+    the full list with reset=True and the client replaces what it has.
+    """
+    cur.execute(queries.SYNC_STATE, (user_id,))
+    row = cur.fetchone()
+    if not row:
+        return None
+    upto, sync_floor = row
+
+    if since is not None and since > upto:
+        # Read from a replica that is behind the one the cursor came from
+        return {'cursor': since, 'has_more': False, 'reset': False,
+                'todos': [], 'categories': [], 'deleted': []}
+
+    reset = since is None or since < sync_floor
+    params = {'user_id': user_id, 'since': -1 if reset else since, 'upto': upto, 'limit': limit}
+
+    changes = []
+    cur.execute(queries.SYNC_TODOS, params)
+    changes += [(todo.change_seq, 'todos', todo_json(todo)) for todo in models.fetch_all(cur, models.SyncTodo)]
+    cur.execute(queries.SYNC_CATEGORIES, params)
+    changes += [(category.change_seq, 'categories', category._asdict())
+                for category in models.fetch_all(cur, models.SyncCategory)]
+    if not reset:
+        # A client starting from scratch has nothing to delete
+        cur.execute(queries.SYNC_TOMBSTONES, params)
+        changes += [(tombstone.change_seq, 'deleted', tombstone.todo_id)
+                    for tombstone in models.fetch_all(cur, models.Tombstone)]
+
+    # Each list holds at most `limit` rows, so the first `limit` of the merge are exact
+    changes.sort(key=lambda change: change[0])
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    result = {'cursor': changes[-1][0] if has_more else upto, 'has_more': has_more, 'reset': reset,
+              'todos': [], 'categories': [], 'deleted': []}
+    for _, kind, item in changes:
+        result[kind].append(item)
+    return result
+
+def todo_fields(mutation, adding):
+    """Validated todo fields from a mutation"""
+    fields = mutation.get('fields') or {}
+    if not isinstance(fields, dict):
+        raise MutationError('fields must be an object')
+    unknown = set(fields) - set(TODO_FIELDS)
+    if unknown:
+        raise MutationError(f"unknown fields: {', '.join(sorted(unknown))}")
+    if adding or 'title' in fields:
+        if not isinstance(fields.get('title'), str) or not fields['title'].strip():
+            raise MutationError('title is required')
+        fields['title'] = fields['title'].strip()
+    if fields.get('description') is not None and not isinstance(fields['description'], str):
+        raise MutationError('description must be a string')
+    for field in ('category_id', 'parent_id'):
+        if not optional_int(fields.get(field)):
+            raise MutationError(f'{field} must be an integer or null')
+    if fields.get('due_date') is not None:
+        try:
+            fields['due_date'] = date.fromisoformat(fields['due_date'])
+        except (TypeError, ValueError):
+            raise MutationError('due_date must be a YYYY-MM-DD date or null')
+    if 'priority' in fields and fields['priority'] not in PRIORITIES:
+        raise MutationError(f"priority must be one of {', '.join(PRIORITIES)}")
+    if 'status' in fields and fields['status'] not in STATUSES:
+        raise MutationError(f"status must be one of {', '.join(STATUSES)}")
+    if 'tags' in fields:
+        try:
+            fields['tags'] = tags.normalize(fields['tags'])
+        except ValueError as e:
+            raise MutationError(str(e))
+    if not adding and not fields:
+        raise MutationError('nothing to update')
+    if 'parent_id' in fields and not adding:
+        # Moving a todo under another one could close a loop; only new todos get a parent
+        raise MutationError('parent_id can only be set when adding')
+    return fields
+
+def update_sql(fields):
+    """UPDATE for just the given (validated) fields, guarded by base_seq"""
+    assignments = []
+    for field in fields:
+        if field == 'category_id':
+            assignments.append(f'category_id = {queries.OWNED_CATEGORY}')
+        elif field == 'tags':
+            assignments.append('tags = %(tags)s::text[]')
+        else:
+            assignments.append(f'{field} = %({field})s')
+    if 'status' in fields:
+        assignments.append('''completed_at = CASE WHEN %(status)s::todo_status = 'completed'
+                                                  THEN COALESCE(completed_at, CURRENT_TIMESTAMP) END''')
+    if 'due_date' in fields:
+        # A new due date gets its own reminder (see reminders.py)
+        assignments.append('reminded_at = CASE WHEN due_date IS DISTINCT FROM %(due_date)s THEN NULL ELSE reminded_at END')
+    assignments.append('updated_at = CURRENT_TIMESTAMP')
+    return f'''
+        UPDATE todo_items SET {', '.join(assignments)}
+        WHERE id = %(id)s AND user_id = %(user_id)s
+          AND (%(base_seq)s::bigint IS NULL OR change_seq <= %(base_seq)s)
+        RETURNING change_seq, parent_id
+    '''
+
+def not_applied(cur, user_id, todo_id):
+    """Why a guarded update/delete touched no row: a newer server copy, or no row at all"""
+    cur.execute(queries.SYNC_TODO, (todo_id, user_id))
+    todo = models.fetch_one(cur, models.SyncTodo)
+    if todo:
+        return {'status': 'conflict', 'id': todo_id, 'server': todo_json(todo)}
+    return {'status': 'not_found', 'id': todo_id}
+
+def apply_mutation(cur, user_id, mutation, base_seq, own_seqs):
+    op = mutation.get('op')
+    if op == 'add':
+        fields = todo_fields(mutation, adding=True)
+        params = {'user_id': user_id, 'description': '', 'priority': 'medium', 'status': 'pending',
+                  'category_id': None, 'due_date': None, 'parent_id': None, 'tags': [], **fields}
+        cur.execute(queries.SYNC_INSERT_TODO, params)
+        todo_id, change_seq, parent_id = cur.fetchone()
+        own_seqs[todo_id] = change_seq
+        realtime.publish(cur, user_id, 'todo_added', id=todo_id)
+        realtime.publish_parent(cur, user_id, parent_id)
+        return {'status': 'ok', 'id': todo_id, 'change_seq': change_seq}
+
+    if op not in ('update', 'delete'):
+        raise MutationError("op must be add, update or delete")
+    todo_id = mutation.get('id')
+    if not isinstance(todo_id, int) or isinstance(todo_id, bool):
+        raise MutationError('id is required')
+    base_seq = mutation.get('base_seq', base_seq)
+    if not optional_int(base_seq):
+        raise MutationError('base_seq must be an integer or null')
+    if todo_id in own_seqs and base_seq is not None:
+        # An earlier mutation in this batch changed the row; that is not a conflict
+        base_seq = max(base_seq, own_seqs[todo_id])
+    params = {'id': todo_id, 'user_id': user_id, 'base_seq': base_seq}
+
+    if op == 'delete':
+        cur.execute(queries.SYNC_DELETE_TODO, params)
+        row = cur.fetchone()
+        if not row:
+            return not_applied(cur, user_id, todo_id)
+        realtime.publish(cur, user_id, 'todo_deleted', id=todo_id)
+        realtime.publish_parent(cur, user_id, row[1])
+        return {'status': 'ok', 'id': todo_id}
+
+    fields = todo_fields(mutation, adding=False)
+    cur.execute(update_sql(fields), {**params, **fields})
+    row = cur.fetchone()
+    if not row:
+        return not_applied(cur, user_id, todo_id)
+    own_seqs[todo_id] = row[0]
+    realtime.publish(cur, user_id, 'todo_updated', id=todo_id, status=fields.get('status'))
+    if 'status' in fields:
+        realtime.publish_parent(cur, user_id, row[1])
+    return {'status': 'ok', 'id': todo_id, 'change_seq': row[0]}
+
+def apply_mutations(cur, user_id, base_seq, mutations):
+    """Apply queued offline mutations in order, one result per mutation
+
+    Each runs under a savepoint, so an invalid one is reported without
+    undoing the others. The caller commits.
+    """
+    results = []
+    own_seqs = {}
+    for mutation in mutations:
+        if not isinstance(mutation, dict):
+            results.append({'status': 'invalid', 'error': 'mutation must be an object'})
+            continue
+        cur.execute('SAVEPOINT sync_mutation')
+        try:
+            result = apply_mutation(cur, user_id, mutation, base_seq, own_seqs)
+            cur.execute('RELEASE SAVEPOINT sync_mutation')
+        except (MutationError, psycopg2.DataError, psycopg2.IntegrityError) as e:
+            cur.execute('ROLLBACK TO SAVEPOINT sync_mutation')
+            # First line only; the rest of a database error quotes our SQL
+            result = {'status': 'invalid', 'error': str(e).strip().splitlines()[0]}
+        if 'client_id' in mutation:
+            result['client_id'] = mutation['client_id']
+        results.append(result)
+    return results
@@ -0,0 +1,33 @@
+# tags.py - Free-form tags on todos
+#
+# Tags live in todo_items.tags (TEXT[]) behind a GIN index, so "any of" (&&)
+# and "all of" (@>) filters stay index-backed however many tags and todos a
+# user collects, and the dashboard gets each todo's tags in the same row.
+MAX_TAGS = 20
+MAX_TAG_LENGTH = 30
+MATCH_MODES = ('any', 'all')
+
+def normalize(value):
+    """A list of clean tags from a comma-separated string or a list of strings
+
+    Tags are trimmed and lowercased, a leading '#' is dropped, and duplicates
+    keep their first position. Raises ValueError for anything unusable.
+    """
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    if not isinstance(value, list) or not all(isinstance(tag, str) for tag in value):
+        raise ValueError('tags must be a list of strings')
+
+    tags = []
+    for tag in value:
+        tag = tag.strip().lstrip('#').strip().lower()
+        if not tag or tag in tags:
+            continue
+        if len(tag) > MAX_TAG_LENGTH:
+            raise ValueError(f'tags can be at most {MAX_TAG_LENGTH} characters')
+        tags.append(tag)
+    if len(tags) > MAX_TAGS:
+        raise ValueError(f'a todo can have at most {MAX_TAGS} tags')
+    return tags
@@ -0,0 +1,190 @@
+# test_routes.py - The core routes, run against each storage backend (see conftest.py)
+#
+# Routes report database errors by flashing a message and redirecting, so
+# every write is checked by where it went and what it flashed, and by what
+# the next page shows, never by the status code alone.
+import re
+import uuid
+from datetime import date, timedelta
+
+import pytest
+
+def flashed(client):
+    """(category, message) pairs flashed so far, taken out of the session"""
+    with client.session_transaction() as session:
+        return session.pop('_flashes', [])
+
+def post_ok(client, url, data=None, message=None):
+    """Post a form that should succeed: back to the dashboard with only success messages"""
+    response = client.post(url, data=data or {})
+    messages = flashed(client)
+    assert response.status_code == 302 and response.location.endswith('/dashboard'), response.status_code
+    assert [category for category, _ in messages] == ['success'], messages
+    if message:
+        assert message in messages[0][1]
+    return response
+
+def post_refused(client, url, data, message):
+    """Post a form that should be turned away with an error message"""
+    response = client.post(url, data=data)
+    if response.status_code == 200:
+        # Shown on the re-rendered form, which has used up the flash
+        assert f'alert-error">{message}<' in response.get_data(as_text=True)
+    else:
+        assert response.status_code == 302
+        assert ('error', message) in flashed(client)
+    return response
+
+def dashboard(client, query=''):
+    response = client.get('/dashboard' + query)
+    html = response.get_data(as_text=True)
+    assert response.status_code == 200
+    assert 'alert alert-error' not in html, html
+    return html
+
+def todo_ids(client, query=''):
+    """{title: id} of the cards on the dashboard, in display order"""
+    html = dashboard(client, query)
+    return dict((title, int(todo_id)) for todo_id, title in re.findall(
+        r'id="todo-(\d+)"[^>]*>\s*<div class="todo-header">\s*<div class="todo-title">([^<]*)</div>', html))
+
+def add(client, title, **fields):
+    post_ok(client, '/add', dict(fields, title=title), 'Task added')
+    return todo_ids(client)[title]
+
+def card(client, todo_id):
+    response = client.get(f'/todos/{todo_id}/card')
+    assert response.status_code == 200
+    return response.get_data(as_text=True)
+
+def test_register_rejects_taken_username(client):
+    other = client.application.test_client()
+    post_refused(other, '/register', {'username': client.username, 'password': 'password2'},
+                 'Username already exists. Please choose another.')
+
+def test_login_rejects_wrong_password(app_module):
+    client = app_module.app.test_client()
+    username = f'user_{uuid.uuid4().hex[:8]}'
+    client.post('/register', data={'username': username, 'password': 'password1'})
+    flashed(client)
+    post_refused(client, '/login', {'username': username, 'password': 'wrong-password'},
+                 'Invalid username or password')
+    assert client.get('/dashboard').location.endswith('/login')
+
+def test_new_user_gets_default_categories(client):
+    html = dashboard(client)
+    for name in ('Work', 'Personal', 'Shopping', 'Health'):
+        assert name in html
+
+def test_add_todo(client):
+    due = date.today() + timedelta(days=3)
+    todo_id = add(client, 'Write report', description='Quarterly numbers', priority='high',
+                  due_date=due.isoformat(), tags='work, Urgent')
+    html = card(client, todo_id)
+    assert 'Write report' in html
+    assert 'Quarterly numbers' in html
+    assert 'data-priority="high"' in html
+    assert 'data-status="pending"' in html
+    assert f'Due: {due.isoformat()}' in html
+    assert 'data-tags="urgent,work"' in html or 'data-tags="work,urgent"' in html
+
+def test_add_todo_requires_title(client):
+    post_refused(client, '/add', {'title': '  '}, 'Task title is required')
+    assert todo_ids(client) == {}
+
+def test_new_todos_go_on_top(client):
+    for title in ('first', 'second', 'third'):
+        add(client, title)
+    assert list(todo_ids(client, '?order=manual')) == ['third', 'second', 'first']
+
+def test_update_status(client):
+    todo_id = add(client, 'Ship it')
+    post_ok(client, f'/update/{todo_id}', {'status': 'in_progress'}, 'Task status updated')
+    assert 'data-status="in_progress"' in card(client, todo_id)
+    post_ok(client, f'/update/{todo_id}', {'status': 'completed'}, 'Task status updated')
+    assert 'data-status="completed"' in card(client, todo_id)
+
+def test_delete_todo(client):
+    todo_id = add(client, 'Throw away')
+    post_ok(client, f'/delete/{todo_id}', message='Task deleted')
+    assert todo_ids(client) == {}
+    assert client.get(f'/todos/{todo_id}/card').status_code == 404
+
+def test_cannot_touch_other_users_todos(client):
+    todo_id = add(client, 'Mine')
+    intruder = client.application.test_client()
+    username = f'user_{uuid.uuid4().hex[:8]}'
+    intruder.post('/register', data={'username': username, 'password': 'password1'})
+    intruder.post('/login', data={'username': username, 'password': 'password1'})
+    flashed(intruder)
+
+    post_refused(intruder, f'/update/{todo_id}', {'status': 'completed'}, 'Task not found')
+    post_refused(intruder, f'/delete/{todo_id}', {}, 'Task not found')
+    assert intruder.get(f'/todos/{todo_id}/card').status_code == 404
+    assert 'data-status="pending"' in card(client, todo_id)
+
+def test_tag_filter(client):
+    add(client, 'Tagged', tags='home')
+    add(client, 'Untagged')
+    assert set(todo_ids(client, '?tag=home')) == {'Tagged'}
+    assert set(todo_ids(client)) == {'Tagged', 'Untagged'}
+
+def test_subtasks(client):
+    parent_id = add(client, 'Parent')
+    post_ok(client, '/add', {'title': 'Child', 'parent_id': parent_id}, 'Task added')
+    assert '0/1 subtasks done' in card(client, parent_id)
+    response = client.get(f'/todos/{parent_id}/subtasks')
+    assert response.status_code == 200
+    assert 'Child' in response.get_data(as_text=True)
+
+def test_move_todo(client):
+    ids = {title: add(client, title) for title in ('a', 'b', 'c')}
+    assert list(todo_ids(client, '?order=manual')) == ['c', 'b', 'a']
+    response = client.post(f"/todos/{ids['a']}/move", json={'after': ids['c'], 'before': ids['b']})
+    assert response.status_code == 200, response.get_json()
+    assert list(todo_ids(client, '?order=manual')) == ['c', 'a', 'b']
+    response = client.post(f"/todos/{ids['c']}/move", json={'after': ids['b'], 'before': None})
+    assert response.status_code == 200, response.get_json()
+    assert list(todo_ids(client, '?order=manual')) == ['a', 'b', 'c']
+
+def test_add_category(client):
+    post_ok(client, '/add_category', {'name': 'Garden', 'color': '#00ff00'})
+    assert 'Garden' in dashboard(client)
+
+def test_agenda(client):
+    today = date.today()
+    add(client, 'Late', due_date=(today - timedelta(days=2)).isoformat())
+    add(client, 'Much later', due_date=(today + timedelta(days=30)).isoformat())
+    add(client, 'Someday')
+    response = client.get('/api/agenda')
+    assert response.status_code == 200
+    buckets = response.get_json()['buckets']
+    assert [entry['title'] for entry in buckets['overdue']] == ['Late']
+    assert [entry['title'] for entry in buckets['later']] == ['Much later']
+
+def test_settings(client):
+    response = client.post('/settings', data={'email': 'me@example.com', 'timezone': 'Europe/Berlin'})
+    assert response.status_code == 302
+    assert [category for category, _ in flashed(client)] == ['success']
+    html = client.get('/settings').get_data(as_text=True)
+    assert 'me@example.com' in html
+    assert '<option value="Europe/Berlin" selected>' in html
+
+def test_sync_rejects_malformed_mutations_one_by_one(client):
+    if client.get('/api/sync').status_code == 501:
+        pytest.skip('sync needs the PostgreSQL backend')
+    todo_id = add(client, 'Synced')
+    response = client.post('/api/sync', json={'base_seq': None, 'mutations': [
+        {'op': 'update', 'id': todo_id, 'base_seq': '7', 'fields': {'status': 'completed'}},
+        {'op': 'update', 'id': todo_id, 'fields': {'category_id': {'id': 1}}},
+        {'op': 'update', 'id': todo_id, 'fields': {'due_date': ['2026-01-01']}},
+        {'op': 'update', 'id': todo_id, 'fields': {'due_date': 'soon'}},
+        {'op': 'add', 'fields': {'title': 'Child', 'parent_id': True}},
+        {'op': 'update', 'id': todo_id, 'fields': {'status': 'in_progress', 'due_date': '2026-01-01'}},
+    ]})
+    assert response.status_code == 200, response.get_data(as_text=True)
+    results = response.get_json()['results']
+    assert [result['status'] for result in results] == ['invalid'] * 5 + ['ok'], results
+    html = card(client, todo_id)
+    assert 'data-status="in_progress"' in html
+    assert 'Due: 2026-01-01' in html